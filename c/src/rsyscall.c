@@ -27,6 +27,9 @@ char hello[] = "hello world, I am the syscall server!\n";
 char read_failed[] = "rsyscall: read(infd, &request, sizeof(request)) failed\n";
 char write_failed[] = "rsyscall: write(outfd, &response, sizeof(response)) failed\n";
 const int EINTR = 4;
+const int E2BIG = 7;
+const int EINVAL = 22;
+const int ECANCELED = 125;
 
 static long write(int fd, const void *buf, size_t count) {
     return rsyscall_raw_syscall(fd, (long) buf, (long) count, 0, 0, 0, SYS_write);
@@ -35,63 +38,366 @@ static long read(int fd, void *buf, size_t count) {
     return rsyscall_raw_syscall(fd, (long) buf, (long) count, 0, 0, 0, SYS_read);
 }
 
-static int read_request(const int infd, struct rsyscall_syscall *request)
+/* Requests are read into a buffer on the server's stack; servers started by
+ * clone_child_task run on a very small stack, so this must stay small. */
+#define RSYSCALL_BATCH_MAX 16
+
+struct request_reader {
+    int fd;
+    struct rsyscall_syscall *buf;
+    size_t capacity; /* in requests */
+    size_t start; /* in bytes: the first request not yet returned */
+    size_t end; /* in bytes: the end of the data we've read */
+};
+
+struct response_writer {
+    int fd;
+    int64_t *buf;
+    size_t capacity; /* in responses */
+    size_t count; /* responses buffered but not yet written */
+};
+
+static int flush_responses(struct response_writer *writer)
 {
-    char* buf = (char*) request;
-    size_t remaining = sizeof(*request);
+    char* data = (char*) writer->buf;
+    size_t remaining = writer->count * sizeof(*writer->buf);
     while (remaining) {
-        long const ret = read(infd, buf, remaining);
+        long const ret = write(writer->fd, data, remaining);
         if (ret == -EINTR) continue;
         if (ret < 0) {
-	    write(2, read_failed, sizeof(read_failed) - 1);
+	    write(2, write_failed, sizeof(write_failed) - 1);
 	    return ret;
 	}
-        if (ret == 0) {
-	    return 0;
-        }
         remaining -= ret;
-        buf += ret;
+        data += ret;
     }
+    writer->count = 0;
     return 1;
 }
 
-static int64_t perform_syscall(struct rsyscall_syscall request)
+static int write_response(struct response_writer *writer, const int64_t response)
 {
-    return rsyscall_raw_syscall(request.args[0], request.args[1], request.args[2],
-                       request.args[3], request.args[4], request.args[5],
-                       request.sys);
+    writer->buf[writer->count++] = response;
+    if (writer->count == writer->capacity) {
+        return flush_responses(writer);
+    }
+    return 1;
 }
 
-static int write_response(const int outfd, const int64_t response)
+/* Returns the next request, reading more from the fd if no complete request is
+ * buffered. Responses to earlier requests are flushed before we block in read,
+ * since the client may be waiting on those responses before sending more. */
+static int read_request(struct request_reader *reader, struct response_writer *writer,
+                        const struct rsyscall_syscall **request)
 {
-    char* data = (char*) &response;
-    size_t remaining = sizeof(response);
-    while (remaining) {
-        long const ret = write(outfd, data, remaining);
-        if (ret == -EINTR) continue;
-        if (ret < 0) {
-	    write(2, write_failed, sizeof(write_failed) - 1);
-	    return ret;
-	}
-        remaining -= ret;
-        data += ret;
+    const size_t size = sizeof(**request);
+    if (reader->end - reader->start < size) {
+        int ret = flush_responses(writer);
+        if (ret <= 0) return ret;
+        /* move any partial request to the start of the buffer */
+        char* buf = (char*) reader->buf;
+        const size_t leftover = reader->end - reader->start;
+        for (size_t i = 0; i < leftover; i++) {
+            buf[i] = buf[reader->start + i];
+        }
+        reader->start = 0;
+        reader->end = leftover;
+        while (reader->end < size) {
+            long const ret = read(reader->fd, buf + reader->end,
+                                  reader->capacity * size - reader->end);
+            if (ret == -EINTR) continue;
+            if (ret < 0) {
+                write(2, read_failed, sizeof(read_failed) - 1);
+                return ret;
+            }
+            if (ret == 0) {
+                return 0;
+            }
+            reader->end += ret;
+        }
     }
+    *request = (const struct rsyscall_syscall*) ((char*) reader->buf + reader->start);
+    reader->start += size;
     return 1;
 }
 
-int rsyscall_server(const int infd, const int outfd)
+static int64_t perform_syscall(const struct rsyscall_syscall *request)
 {
-    // write(2, hello, sizeof(hello) -1);
-    struct rsyscall_syscall request;
+    return rsyscall_raw_syscall(request->args[0], request->args[1], request->args[2],
+                       request->args[3], request->args[4], request->args[5],
+                       request->sys);
+}
+
+void rsyscall_raw_syscall_batch(const struct rsyscall_syscall *requests, int64_t *results, size_t n)
+{
+    for (size_t i = 0; i < n; i++) {
+        results[i] = perform_syscall(&requests[i]);
+    }
+}
+
+/* The chain of requests we're in the middle of; see RSYSCALL_CHAIN_NEXT. */
+struct chain_state {
+    size_t length; /* the number of requests in the chain so far */
+    int aborted; /* whether some request in the chain has failed */
+    int64_t results[RSYSCALL_CHAIN_MAX];
+};
+
+static int is_error(const int64_t ret) {
+    return -4095 < ret && ret < 0;
+}
+
+static int64_t perform_request(struct chain_state *chain, const struct rsyscall_syscall *request)
+{
+    const int64_t flags = request->sys & ~RSYSCALL_SYS_MASK;
+    if (!flags && !chain->length) {
+        /* not part of a chain */
+        return perform_syscall(request);
+    }
+    int64_t result = 0;
+    if (chain->aborted) {
+        result = -ECANCELED;
+    } else if (chain->length >= RSYSCALL_CHAIN_MAX) {
+        result = -E2BIG;
+    } else {
+        struct rsyscall_syscall actual = { .sys = request->sys & RSYSCALL_SYS_MASK };
+        for (int i = 0; i < 6; i++) {
+            actual.args[i] = request->args[i];
+            if (flags & RSYSCALL_CHAIN_REF(i)) {
+                /* only earlier requests in the chain can be referenced */
+                if ((uint64_t) request->args[i] >= chain->length) {
+                    result = -EINVAL;
+                    break;
+                }
+                actual.args[i] = chain->results[request->args[i]];
+            }
+        }
+        if (!result) result = perform_syscall(&actual);
+        chain->results[chain->length] = result;
+    }
+    chain->length++;
+    if (is_error(result)) chain->aborted = 1;
+    if (!(flags & RSYSCALL_CHAIN_NEXT)) {
+        chain->length = 0;
+        chain->aborted = 0;
+    }
+    return result;
+}
+
+/* Whether this syscall is known to return promptly. We flush our buffered
+ * responses before any other syscall, since it may block indefinitely (read,
+ * epoll_wait, waitid, futex...), and the client may be waiting on those
+ * responses before it does whatever would unblock it. */
+static int never_blocks(const int64_t sys)
+{
+    switch (sys) {
+    case SYS_mmap:
+    case SYS_munmap:
+    case SYS_mremap:
+    case SYS_mprotect:
+    case SYS_madvise:
+    case SYS_getpid:
+    case SYS_gettid:
+    case SYS_getuid:
+    case SYS_getgid:
+    case SYS_dup:
+    case SYS_dup3:
+    case SYS_fcntl:
+    case SYS_lseek:
+    case SYS_pipe2:
+    case SYS_socketpair:
+    case SYS_eventfd2:
+    case SYS_memfd_create:
+    case SYS_epoll_create1:
+    case SYS_epoll_ctl:
+    case SYS_rt_sigprocmask:
+        return 1;
+    default:
+        return 0;
+    }
+}
+
+static int serve(struct request_reader *reader, struct response_writer *writer)
+{
+    struct chain_state chain = {};
+    const struct rsyscall_syscall *request = NULL;
     int ret;
     for (;;) {
-	ret = read_request(infd, &request);
+	ret = read_request(reader, writer, &request);
 	if (ret <= 0) return ret;
-	ret = write_response(outfd, perform_syscall(request));
+	if (writer->count && !never_blocks(request->sys & RSYSCALL_SYS_MASK)) {
+	    ret = flush_responses(writer);
+	    if (ret <= 0) return ret;
+	}
+	ret = write_response(writer, perform_request(&chain, request));
 	if (ret <= 0) return ret;
     }
 }
 
+int rsyscall_server(const int infd, const int outfd)
+{
+    // write(2, hello, sizeof(hello) -1);
+    struct rsyscall_syscall request;
+    int64_t response;
+    struct request_reader reader = { .fd = infd, .buf = &request, .capacity = 1 };
+    struct response_writer writer = { .fd = outfd, .buf = &response, .capacity = 1 };
+    return serve(&reader, &writer);
+}
+
+int rsyscall_batch_server(const int infd, const int outfd)
+{
+    struct rsyscall_syscall requests[RSYSCALL_BATCH_MAX];
+    int64_t responses[RSYSCALL_BATCH_MAX];
+    struct request_reader reader = { .fd = infd, .buf = requests, .capacity = RSYSCALL_BATCH_MAX };
+    struct response_writer writer = { .fd = outfd, .buf = responses, .capacity = RSYSCALL_BATCH_MAX };
+    return serve(&reader, &writer);
+}
+
+enum {
+    RSYSCALL_RING_SERVER_RUNNING = 0,
+    RSYSCALL_RING_SERVER_SLEEPING = 1,
+    RSYSCALL_RING_SERVER_IN_SYSCALL = 2,
+};
+enum {
+    RSYSCALL_RING_KICK_NONE = 0,
+    RSYSCALL_RING_KICK_WRITING = 1,
+    RSYSCALL_RING_KICK_WRITTEN = 2,
+};
+/* How many times we check for a new request before going to sleep on the futex. */
+#define RSYSCALL_RING_SPINS 4096
+#define FUTEX_WAIT 0
+#define FUTEX_WAKE 1
+
+static long futex(uint32_t *uaddr, int op, uint32_t val) {
+    return rsyscall_raw_syscall((long) uaddr, op, val, 0, 0, 0, SYS_futex);
+}
+
+static long write_byte(const int sock)
+{
+    char byte = 0;
+    for (;;) {
+        long const ret = write(sock, &byte, sizeof(byte));
+        if (ret != -EINTR) return ret;
+    }
+}
+
+static long read_byte(const int sock)
+{
+    char byte;
+    for (;;) {
+        long const ret = read(sock, &byte, sizeof(byte));
+        if (ret != -EINTR) return ret;
+    }
+}
+
+static void wait_for_request(struct rsyscall_ring *ring, const uint32_t next)
+{
+    int spins = 0;
+    while (__atomic_load_n(&ring->submitted, __ATOMIC_ACQUIRE) == next) {
+        if (spins++ < RSYSCALL_RING_SPINS) {
+            __builtin_ia32_pause();
+            continue;
+        }
+        /* The client checks server_state after publishing a request, so either
+         * we see its request here, or it sees that we're sleeping and wakes us. */
+        __atomic_store_n(&ring->server_state, RSYSCALL_RING_SERVER_SLEEPING, __ATOMIC_SEQ_CST);
+        if (__atomic_load_n(&ring->submitted, __ATOMIC_SEQ_CST) == next) {
+            futex(&ring->server_state, FUTEX_WAIT, RSYSCALL_RING_SERVER_SLEEPING);
+        }
+        __atomic_store_n(&ring->server_state, RSYSCALL_RING_SERVER_RUNNING, __ATOMIC_SEQ_CST);
+        spins = 0;
+    }
+}
+
+int rsyscall_ring_server(struct rsyscall_ring *ring, const int sock)
+{
+    struct chain_state chain = {};
+    uint32_t next = __atomic_load_n(&ring->completed, __ATOMIC_ACQUIRE);
+    long ret;
+    for (;;) {
+        wait_for_request(ring, next);
+        struct rsyscall_ring_entry *entry = &ring->entries[next % RSYSCALL_RING_SIZE];
+        /* If the syscall blocks (say, in epoll_wait on sock), new requests
+         * can only get our attention by the client writing to sock. The
+         * client does that when it sees we're in a syscall; if it didn't see
+         * that before submitting and it's now waiting for completions, we
+         * wake it so it checks again. */
+        __atomic_store_n(&ring->server_state, RSYSCALL_RING_SERVER_IN_SYSCALL, __ATOMIC_SEQ_CST);
+        if (__atomic_load_n(&ring->submitted, __ATOMIC_SEQ_CST) != next + 1 &&
+            __atomic_exchange_n(&ring->client_waiting, 0, __ATOMIC_SEQ_CST)) {
+            ret = write_byte(sock);
+            if (ret < 0) goto write_fail;
+        }
+        const int64_t result = perform_request(&chain, &entry->request);
+        __atomic_store_n(&ring->server_state, RSYSCALL_RING_SERVER_RUNNING, __ATOMIC_SEQ_CST);
+        /* consume the client's kick, now that we're out of the syscall */
+        if (__atomic_load_n(&ring->kicked, __ATOMIC_ACQUIRE) == RSYSCALL_RING_KICK_WRITTEN) {
+            ret = read_byte(sock);
+            if (ret < 0) {
+                write(2, read_failed, sizeof(read_failed) - 1);
+                return ret;
+            }
+            __atomic_store_n(&ring->kicked, RSYSCALL_RING_KICK_NONE, __ATOMIC_RELEASE);
+        }
+        entry->result = result;
+        next++;
+        __atomic_store_n(&ring->completed, next, __ATOMIC_SEQ_CST);
+        if (__atomic_exchange_n(&ring->client_waiting, 0, __ATOMIC_SEQ_CST)) {
+            ret = write_byte(sock);
+            if (ret < 0) goto write_fail;
+        }
+    }
+write_fail:
+    write(2, write_failed, sizeof(write_failed) - 1);
+    return ret;
+}
+
+static long kick(struct rsyscall_ring *ring, const int sock)
+{
+    uint32_t expected = RSYSCALL_RING_KICK_NONE;
+    if (!__atomic_compare_exchange_n(&ring->kicked, &expected, RSYSCALL_RING_KICK_WRITING,
+                                     0, __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST)) {
+        /* someone else already kicked the server, and it hasn't consumed the kick */
+        return 0;
+    }
+    long const ret = write_byte(sock);
+    __atomic_store_n(&ring->kicked, ret < 0 ? RSYSCALL_RING_KICK_NONE : RSYSCALL_RING_KICK_WRITTEN,
+                     __ATOMIC_RELEASE);
+    return ret;
+}
+
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const int sock)
+{
+    const uint32_t submitted = __atomic_load_n(&ring->submitted, __ATOMIC_RELAXED);
+    __atomic_store_n(&ring->submitted, submitted + 1, __ATOMIC_SEQ_CST);
+    uint32_t state = __atomic_load_n(&ring->server_state, __ATOMIC_SEQ_CST);
+    if (state == RSYSCALL_RING_SERVER_SLEEPING) {
+        if (__atomic_compare_exchange_n(&ring->server_state, &state, RSYSCALL_RING_SERVER_RUNNING,
+                                        0, __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST)) {
+            long const ret = futex(&ring->server_state, FUTEX_WAKE, 1);
+            if (ret < 0) return ret;
+        }
+    } else if (state == RSYSCALL_RING_SERVER_IN_SYSCALL) {
+        long const ret = kick(ring, sock);
+        if (ret < 0) return ret;
+    }
+    return 0;
+}
+
+uint32_t rsyscall_ring_completed(struct rsyscall_ring *ring, const int wait, const int sock)
+{
+    if (wait) {
+        __atomic_store_n(&ring->client_waiting, 1, __ATOMIC_SEQ_CST);
+        /* If the server is blocked in a syscall with more requests behind it,
+         * make sure it's been kicked, since we might have missed it entering the syscall. */
+        const uint32_t completed = __atomic_load_n(&ring->completed, __ATOMIC_SEQ_CST);
+        if (__atomic_load_n(&ring->server_state, __ATOMIC_SEQ_CST) == RSYSCALL_RING_SERVER_IN_SYSCALL &&
+            __atomic_load_n(&ring->submitted, __ATOMIC_SEQ_CST) - completed > 1) {
+            kick(ring, sock);
+        }
+    }
+    return __atomic_load_n(&ring->completed, __ATOMIC_ACQUIRE);
+}
+
 static void receive_fds(const int sock, int *fds, int n) {
     union {
         struct cmsghdr hdr;
@@ -134,6 +440,8 @@ struct rsyscall_symbol_table rsyscall_symbol_table()
 {
     struct rsyscall_symbol_table table = {
         .rsyscall_server = rsyscall_server,
+        .rsyscall_batch_server = rsyscall_batch_server,
+        .rsyscall_ring_server = rsyscall_ring_server,
         .rsyscall_persistent_server = rsyscall_persistent_server,
         .rsyscall_futex_helper = rsyscall_futex_helper,
         .rsyscall_trampoline = rsyscall_trampoline,
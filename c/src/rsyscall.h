@@ -7,12 +7,99 @@ struct rsyscall_syscall {
     int64_t args[6];
 };
 
+/* The low bits of sys are the syscall number; the high bits are flags for
+ * chains of requests, in which a request can use the result of an earlier
+ * request without a round trip to the client in between. */
+#define RSYSCALL_SYS_MASK 0xffffffffLL
+/* The next request is in the same chain as this one. */
+#define RSYSCALL_CHAIN_NEXT (1LL << 32)
+/* Argument i is the index, within this chain, of an earlier request,
+ * and is replaced by the result of that request. */
+#define RSYSCALL_CHAIN_REF_SHIFT 33
+#define RSYSCALL_CHAIN_REF(i) (1LL << (RSYSCALL_CHAIN_REF_SHIFT + (i)))
+/* The maximum length of a chain. If a request in a chain fails, the requests
+ * after it in the chain aren't performed, and return -ECANCELED. */
+#define RSYSCALL_CHAIN_MAX 16
+
 int rsyscall_server(const int infd, const int outfd);
+/* Like rsyscall_server, but reads as many requests as are available at once,
+ * and writes responses back in a single write when no more requests are buffered. */
+int rsyscall_batch_server(const int infd, const int outfd);
 int rsyscall_persistent_server(int infd, int outfd, const int listensock);
 
+/* A ring of syscall requests, in memory shared between a client and an
+ * rsyscall_ring_server running in the same address space. */
+#define RSYSCALL_RING_SIZE 64
+struct rsyscall_ring_entry {
+    struct rsyscall_syscall request;
+    int64_t result;
+};
+struct rsyscall_ring {
+    /* written only by the client: the number of requests submitted */
+    uint32_t submitted;
+    /* written only by the server: the number of requests completed */
+    uint32_t completed;
+    /* one of the RSYSCALL_RING_SERVER_* states; the server sleeps on this futex */
+    uint32_t server_state;
+    /* set by the client when it's going to block waiting for a completion */
+    uint32_t client_waiting;
+    /* one of the RSYSCALL_RING_KICK_* states */
+    uint32_t kicked;
+    uint32_t padding;
+    struct rsyscall_ring_entry entries[RSYSCALL_RING_SIZE];
+};
+/* Performs syscalls submitted to the ring until a write to sock fails.
+ * sock is used to wake the client when it's waiting for a completion, and
+ * the client writes to sock to wake us if we're blocked in a syscall; so sock
+ * is the activity fd for this server. */
+int rsyscall_ring_server(struct rsyscall_ring *ring, const int sock);
+/* Submits the next entry in the ring, which the caller must have already filled in,
+ * and wakes the server if necessary. Called by the client. */
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const int sock);
+/* Returns the number of completed requests. If the client is going to block,
+ * it should pass wait=1, and then a byte will be written to sock on the next completion. */
+uint32_t rsyscall_ring_completed(struct rsyscall_ring *ring, const int wait, const int sock);
+
+/* An io_uring, set up by rsyscall_uring_setup, through which the local thread can
+ * perform syscalls asynchronously. */
+struct rsyscall_uring {
+    int fd;
+    unsigned sq_entries;
+    unsigned to_submit;
+    unsigned *sq_head;
+    unsigned *sq_tail;
+    unsigned *sq_mask;
+    unsigned *sq_array;
+    void *sqes;
+    unsigned *cq_head;
+    unsigned *cq_tail;
+    unsigned *cq_mask;
+    void *cqes;
+    void *sq_ring;
+    size_t sq_ring_size;
+    void *cq_ring;
+    size_t cq_ring_size;
+    size_t sqes_size;
+};
+struct rsyscall_uring_completion {
+    uint64_t user_data;
+    int64_t result;
+};
+/* If eventfd is not -1, it's registered to be notified of completions. */
+int rsyscall_uring_setup(struct rsyscall_uring *uring, unsigned entries, int eventfd);
+/* Returns 1 if the request was queued, 0 if the syscall isn't supported by io_uring,
+ * or -EBUSY if the submission queue is full. */
+int rsyscall_uring_prep(struct rsyscall_uring *uring, const struct rsyscall_syscall *request, uint64_t user_data);
+int rsyscall_uring_submit(struct rsyscall_uring *uring);
+size_t rsyscall_uring_reap(struct rsyscall_uring *uring, struct rsyscall_uring_completion *completions, size_t n);
+int rsyscall_uring_close(struct rsyscall_uring *uring);
+
 /* Assembly-language routines: */
 /* careful: the syscall number is the last arg, to make the assembly more convenient. */
 long rsyscall_raw_syscall(long arg1, long arg2, long arg3, long arg4, long arg5, long arg6, long sys);
+/* Performs n independent syscalls, in order, storing the result of each in results;
+ * so a caller can make many syscalls while only calling into C once. */
+void rsyscall_raw_syscall_batch(const struct rsyscall_syscall *requests, int64_t *results, size_t n);
 /* SIGSTOPs itself when it starts up, then waits on the futex, then does exit(0). */
 void rsyscall_futex_helper(void *futex_addr);
 /* A trampoline useful when used with clone to call arbitrary functions. */
@@ -35,6 +122,8 @@ struct rsyscall_symbol_table {
     void* rsyscall_persistent_server;
     void* rsyscall_futex_helper;
     void* rsyscall_trampoline;
+    void* rsyscall_batch_server;
+    void* rsyscall_ring_server;
 };
 struct rsyscall_symbol_table rsyscall_symbol_table();
 
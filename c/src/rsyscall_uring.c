@@ -0,0 +1,222 @@
+#define _GNU_SOURCE
+#include <stddef.h>
+#include <sys/syscall.h>
+#include <sys/mman.h>
+#include <linux/io_uring.h>
+#include <fcntl.h>
+#include <errno.h>
+#include "rsyscall.h"
+
+/* Like the rest of librsyscall, we don't use libc here; just raw syscalls. */
+
+static long uring_mmap(size_t length, int fd, long offset) {
+    return rsyscall_raw_syscall(0, length, PROT_READ|PROT_WRITE, MAP_SHARED|MAP_POPULATE, fd, offset, SYS_mmap);
+}
+static long uring_munmap(void *addr, size_t length) {
+    return rsyscall_raw_syscall((long) addr, length, 0, 0, 0, 0, SYS_munmap);
+}
+static long uring_close(int fd) {
+    return rsyscall_raw_syscall(fd, 0, 0, 0, 0, 0, SYS_close);
+}
+static int is_error(long ret) {
+    return -4095 < ret && ret < 0;
+}
+
+int rsyscall_uring_setup(struct rsyscall_uring *uring, unsigned entries, int eventfd)
+{
+    struct io_uring_params params = {};
+    long ret = rsyscall_raw_syscall(entries, (long) &params, 0, 0, 0, 0, SYS_io_uring_setup);
+    if (ret < 0) return ret;
+    const int fd = ret;
+    uring->fd = fd;
+    uring->sq_entries = params.sq_entries;
+    uring->to_submit = 0;
+    uring->sq_ring_size = params.sq_off.array + params.sq_entries * sizeof(unsigned);
+    uring->cq_ring_size = params.cq_off.cqes + params.cq_entries * sizeof(struct io_uring_cqe);
+    if (params.features & IORING_FEAT_SINGLE_MMAP) {
+        if (uring->cq_ring_size > uring->sq_ring_size) uring->sq_ring_size = uring->cq_ring_size;
+        uring->cq_ring_size = uring->sq_ring_size;
+    }
+    ret = uring_mmap(uring->sq_ring_size, fd, IORING_OFF_SQ_RING);
+    if (is_error(ret)) goto close_fd;
+    char *sq_ring = (char*) ret;
+    char *cq_ring = sq_ring;
+    if (!(params.features & IORING_FEAT_SINGLE_MMAP)) {
+        ret = uring_mmap(uring->cq_ring_size, fd, IORING_OFF_CQ_RING);
+        if (is_error(ret)) goto unmap_sq;
+        cq_ring = (char*) ret;
+    }
+    uring->sqes_size = params.sq_entries * sizeof(struct io_uring_sqe);
+    ret = uring_mmap(uring->sqes_size, fd, IORING_OFF_SQES);
+    if (is_error(ret)) goto unmap_cq;
+    uring->sqes = (void*) ret;
+    uring->sq_ring = sq_ring;
+    uring->sq_head = (unsigned*) (sq_ring + params.sq_off.head);
+    uring->sq_tail = (unsigned*) (sq_ring + params.sq_off.tail);
+    uring->sq_mask = (unsigned*) (sq_ring + params.sq_off.ring_mask);
+    uring->sq_array = (unsigned*) (sq_ring + params.sq_off.array);
+    uring->cq_ring = cq_ring;
+    uring->cq_head = (unsigned*) (cq_ring + params.cq_off.head);
+    uring->cq_tail = (unsigned*) (cq_ring + params.cq_off.tail);
+    uring->cq_mask = (unsigned*) (cq_ring + params.cq_off.ring_mask);
+    uring->cqes = cq_ring + params.cq_off.cqes;
+    if (eventfd >= 0) {
+        ret = rsyscall_raw_syscall(fd, IORING_REGISTER_EVENTFD, (long) &eventfd, 1, 0, 0, SYS_io_uring_register);
+        if (ret < 0) goto unmap_sqes;
+    }
+    return 0;
+unmap_sqes:
+    uring_munmap(uring->sqes, uring->sqes_size);
+unmap_cq:
+    if (cq_ring != sq_ring) uring_munmap(cq_ring, uring->cq_ring_size);
+unmap_sq:
+    uring_munmap(sq_ring, uring->sq_ring_size);
+close_fd:
+    uring_close(fd);
+    return ret;
+}
+
+/* Fill in the sqe for this request, if there's an io_uring op equivalent to it.
+ * We only translate syscalls whose semantics the io_uring op preserves exactly;
+ * for example, splice with offset pointers would not have the pointers updated. */
+static int translate(struct io_uring_sqe *sqe, const struct rsyscall_syscall *request)
+{
+    const int64_t *args = request->args;
+    switch (request->sys) {
+    case SYS_openat:
+        sqe->opcode = IORING_OP_OPENAT;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->open_flags = args[2];
+        sqe->len = args[3];
+        return 1;
+    case SYS_read:
+    case SYS_write:
+        sqe->opcode = request->sys == SYS_read ? IORING_OP_READ : IORING_OP_WRITE;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->len = args[2];
+        /* use and update the file position, like read and write */
+        sqe->off = -1;
+        return 1;
+    case SYS_pread64:
+    case SYS_pwrite64:
+        sqe->opcode = request->sys == SYS_pread64 ? IORING_OP_READ : IORING_OP_WRITE;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->len = args[2];
+        sqe->off = args[3];
+        return 1;
+    case SYS_readv:
+    case SYS_writev:
+        sqe->opcode = request->sys == SYS_readv ? IORING_OP_READV : IORING_OP_WRITEV;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->len = args[2];
+        sqe->off = -1;
+        return 1;
+    case SYS_statx:
+        sqe->opcode = IORING_OP_STATX;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->statx_flags = args[2];
+        sqe->len = args[3];
+        sqe->off = args[4];
+        return 1;
+    case SYS_close:
+        sqe->opcode = IORING_OP_CLOSE;
+        sqe->fd = args[0];
+        return 1;
+    case SYS_accept:
+    case SYS_accept4:
+        sqe->opcode = IORING_OP_ACCEPT;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->addr2 = args[2];
+        sqe->accept_flags = request->sys == SYS_accept4 ? args[3] : 0;
+        return 1;
+    case SYS_connect:
+        sqe->opcode = IORING_OP_CONNECT;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->off = args[2];
+        return 1;
+    case SYS_fsync:
+    case SYS_fdatasync:
+        sqe->opcode = IORING_OP_FSYNC;
+        sqe->fd = args[0];
+        sqe->fsync_flags = request->sys == SYS_fdatasync ? IORING_FSYNC_DATASYNC : 0;
+        return 1;
+    case SYS_splice:
+        if (args[1] || args[3]) return 0;
+        sqe->opcode = IORING_OP_SPLICE;
+        sqe->splice_fd_in = args[0];
+        sqe->splice_off_in = -1;
+        sqe->fd = args[2];
+        sqe->off = -1;
+        sqe->len = args[4];
+        sqe->splice_flags = args[5];
+        return 1;
+    case SYS_sendmsg:
+    case SYS_recvmsg:
+        sqe->opcode = request->sys == SYS_sendmsg ? IORING_OP_SENDMSG : IORING_OP_RECVMSG;
+        sqe->fd = args[0];
+        sqe->addr = args[1];
+        sqe->len = 1;
+        sqe->msg_flags = args[2];
+        return 1;
+    default:
+        return 0;
+    }
+}
+
+int rsyscall_uring_prep(struct rsyscall_uring *uring, const struct rsyscall_syscall *request, uint64_t user_data)
+{
+    const unsigned head = __atomic_load_n(uring->sq_head, __ATOMIC_ACQUIRE);
+    const unsigned tail = *uring->sq_tail;
+    if (tail - head >= uring->sq_entries) return -EBUSY;
+    const unsigned index = tail & *uring->sq_mask;
+    struct io_uring_sqe *sqe = &((struct io_uring_sqe*) uring->sqes)[index];
+    char *bytes = (char*) sqe;
+    for (size_t i = 0; i < sizeof(*sqe); i++) bytes[i] = 0;
+    if (!translate(sqe, request)) return 0;
+    sqe->user_data = user_data;
+    uring->sq_array[index] = index;
+    __atomic_store_n(uring->sq_tail, tail + 1, __ATOMIC_RELEASE);
+    uring->to_submit++;
+    return 1;
+}
+
+int rsyscall_uring_submit(struct rsyscall_uring *uring)
+{
+    while (uring->to_submit) {
+        long const ret = rsyscall_raw_syscall(uring->fd, uring->to_submit, 0, 0, 0, 0, SYS_io_uring_enter);
+        if (ret == -EINTR) continue;
+        if (ret < 0) return ret;
+        if (ret == 0) return -EAGAIN;
+        uring->to_submit -= ret;
+    }
+    return 0;
+}
+
+size_t rsyscall_uring_reap(struct rsyscall_uring *uring, struct rsyscall_uring_completion *completions, size_t n)
+{
+    unsigned head = *uring->cq_head;
+    const unsigned tail = __atomic_load_n(uring->cq_tail, __ATOMIC_ACQUIRE);
+    size_t count = 0;
+    for (; head != tail && count < n; head++, count++) {
+        const struct io_uring_cqe *cqe = &((struct io_uring_cqe*) uring->cqes)[head & *uring->cq_mask];
+        completions[count].user_data = cqe->user_data;
+        completions[count].result = cqe->res;
+    }
+    __atomic_store_n(uring->cq_head, head, __ATOMIC_RELEASE);
+    return count;
+}
+
+int rsyscall_uring_close(struct rsyscall_uring *uring)
+{
+    uring_munmap(uring->sqes, uring->sqes_size);
+    if (uring->cq_ring != uring->sq_ring) uring_munmap(uring->cq_ring, uring->cq_ring_size);
+    uring_munmap(uring->sq_ring, uring->sq_ring_size);
+    return uring_close(uring->fd);
+}
@@ -77,10 +77,33 @@ class Event:
         if self._exc:
             raise self._exc
 
+    def wait_cb(self, cb: Continuation[None]) -> t.Callable[[], None]:
+        """Resume `cb` once we're set, like `wait`, and return a function which withdraws it
+
+        A waiter which gives up, say on a timeout, can withdraw its callback, rather than
+        leaving it registered until we're set.
+
+        """
+        if self._is_set:
+            self._resume(cb)
+            return lambda: None
+        self._waiting_cbs.append(cb)
+        def withdraw() -> None:
+            if cb in self._waiting_cbs:
+                self._waiting_cbs.remove(cb)
+        return withdraw
+
+    def _resume(self, cb: Continuation[None]) -> None:
+        if self._exc:
+            cb.throw(self._exc)
+        else:
+            cb.send(None)
+
     def set(self) -> None:
         self._is_set = True
-        for cb in self._waiting_cbs:
-            cb.send(None)
+        waiting_cbs, self._waiting_cbs = self._waiting_cbs, []
+        for cb in waiting_cbs:
+            self._resume(cb)
 
     def close(self, exc: BaseException) -> None:
         self._exc = exc
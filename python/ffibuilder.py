@@ -253,6 +253,8 @@ struct signalfd_siginfo {
 // preadv2
 #define SYS_preadv2 ...
 #define SYS_pwritev2 ...
+#define SYS_process_vm_readv ...
+#define SYS_process_vm_writev ...
 
 #define RWF_DSYNC ...
 #define RWF_HIPRI ...
@@ -1174,6 +1176,8 @@ struct sockaddr_nl {
 // mmap stuff
 #define SYS_mmap ...
 #define SYS_munmap ...
+#define SYS_madvise ...
+#define SYS_mremap ...
 #define SYS_memfd_create ...
 
 // memfd stuff, from sys/mman.h and linux/memfd.h
@@ -1195,10 +1199,17 @@ struct sockaddr_nl {
 #define MAP_GROWSDOWN ...
 #define MAP_STACK ...
 
+#define MADV_DONTNEED ...
+#define MADV_REMOVE ...
+#define MADV_FREE ...
+
+#define MREMAP_MAYMOVE ...
+
 void *memcpy(void *dest, const void *src, size_t n);
 // we need these as function pointers, we aren't calling them from Python
 int (*const rsyscall_persistent_server)(int infd, int outfd, const int listensock);
 int (*const rsyscall_server)(const int infd, const int outfd);
+int (*const rsyscall_batch_server)(const int infd, const int outfd);
 void (*const rsyscall_futex_helper)(void *futex_addr);
 void (*const rsyscall_trampoline)(void);
 
@@ -1216,11 +1227,48 @@ struct rsyscall_syscall {
     int64_t sys;
     int64_t args[6];
 };
+void rsyscall_raw_syscall_batch(const struct rsyscall_syscall *requests, int64_t *results, size_t n);
+#define RSYSCALL_SYS_MASK ...
+#define RSYSCALL_CHAIN_NEXT ...
+#define RSYSCALL_CHAIN_REF_SHIFT ...
+#define RSYSCALL_CHAIN_MAX ...
+#define RSYSCALL_RING_SIZE ...
+struct rsyscall_ring_entry {
+    struct rsyscall_syscall request;
+    int64_t result;
+};
+struct rsyscall_ring {
+    uint32_t submitted;
+    uint32_t completed;
+    uint32_t server_state;
+    uint32_t client_waiting;
+    uint32_t kicked;
+    uint32_t padding;
+    struct rsyscall_ring_entry entries[...];
+};
+struct rsyscall_uring {
+    int fd;
+    ...;
+};
+struct rsyscall_uring_completion {
+    uint64_t user_data;
+    int64_t result;
+};
+int rsyscall_uring_setup(struct rsyscall_uring *uring, unsigned entries, int eventfd);
+int rsyscall_uring_prep(struct rsyscall_uring *uring, const struct rsyscall_syscall *request, uint64_t user_data);
+int rsyscall_uring_submit(struct rsyscall_uring *uring);
+size_t rsyscall_uring_reap(struct rsyscall_uring *uring, struct rsyscall_uring_completion *completions, size_t n);
+int rsyscall_uring_close(struct rsyscall_uring *uring);
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const int sock);
+uint32_t rsyscall_ring_completed(struct rsyscall_ring *ring, const int wait, const int sock);
+int (*const rsyscall_ring_server)(struct rsyscall_ring *ring, const int sock);
 struct rsyscall_symbol_table {
     void* rsyscall_server;
     void* rsyscall_persistent_server;
     void* rsyscall_futex_helper;
     void* rsyscall_trampoline;
+    void* rsyscall_batch_server;
+    void* rsyscall_ring_server;
 };
 struct rsyscall_bootstrap {
     struct rsyscall_symbol_table symbols;
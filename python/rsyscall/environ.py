@@ -13,8 +13,11 @@ from dneio import run_all
 from rsyscall.command import Command
 from rsyscall.handle import Task, FileDescriptor, WrittenPointer
 from rsyscall.memory.ram import RAM
+from rsyscall.near.sysif import Syscall
 from rsyscall.path import Path
+from rsyscall.sys.syscall import SYS
 from rsyscall.unistd import ArgList
+import contextlib
 import os
 import typing as t
 import functools
@@ -62,31 +65,29 @@ class ExecutablePathCache:
                 self.fds[path] = fd
         return self.fds[path]
 
-    async def _check(self, path: Path, name: WrittenPointer[str]) -> bool:
-        "Return true if there's an executable with this name under this path"
-        fd = await self._get_fd_for_path(path)
-        if fd is None:
-            return False
-        else:
-            try:
-                # TODO hmm this returns fine for directories tho. hm. hm.
-                # oh well we'll just fail at exec time, that was always possible
-                await fd.faccessat(name, OK.X)
-            except OSError:
-                return False
-            else:
-                return True
+    async def _check_many(self, paths: t.List[Path], name: WrittenPointer[str]) -> t.List[bool]:
+        "Return, for each of these paths, true if there's an executable with this name under it"
+        fds = await run_all([functools.partial(self._get_fd_for_path, path) for path in paths])
+        existing = [fd for fd in fds if fd is not None]
+        with contextlib.ExitStack() as stack:
+            name_near = stack.enter_context(name.borrow(self.task))
+            # the probes are independent, so we can make them all as a single batch
+            # TODO hmm this returns fine for directories tho. hm. hm.
+            # oh well we'll just fail at exec time, that was always possible
+            results = iter(await self.task.sysif.syscall_batch([
+                Syscall(SYS.faccessat, stack.enter_context(fd.borrow(self.task)), name_near, OK.X, 0, 0, 0)
+                for fd in existing]))
+        return [fd is not None and next(results) == 0 for fd in fds]
 
     async def which(self, name: str) -> Command:
         "Locate an executable with this name on PATH; throw ExecutableNotFound on failure"
         try:
             path = self.path_cache[name]
         except KeyError:
-            nameptr = await self.ram.ptr(name)
+            nameptr = await self.ram.const_ptr(name)
             # do the lookup for 64 paths at a time, that seems like a good batching number
             for paths in chunks(self.paths, 64):
-                thunks = [functools.partial(self._check, path, nameptr) for path in paths]
-                results = await run_all(thunks) # type: ignore
+                results = await self._check_many(paths, nameptr)
                 for path, result in zip(paths, results):
                     if result:
                         # path is set as the loop variable; python has no scope
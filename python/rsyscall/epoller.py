@@ -78,10 +78,11 @@ because it's not really useful.
 
 """
 from __future__ import annotations
-from dneio import RequestQueue, Continuation, reset
+from dneio import RequestQueue, Continuation, Event, reset, run_all
 from rsyscall._raw import ffi # type: ignore
 import collections
 import errno
+import functools
 import os
 import math
 import typing as t
@@ -94,6 +95,8 @@ from rsyscall.sys.syscall import SYS
 from rsyscall.sys.socket import SOCK, SOL, SO, Sockaddr, SockaddrStorage, T_sockaddr, Sockbuf
 from rsyscall.sys.epoll import EpollEvent, EpollEventList, EPOLL, EPOLL_CTL, EpollFlag
 from rsyscall.fcntl import O, F
+if t.TYPE_CHECKING:
+    from rsyscall.timer_wheel import TimerWheel
 
 import logging
 logger = logging.getLogger(__name__)
@@ -108,6 +111,18 @@ __all__ = [
 class RemovedFromEpollError(Exception):
     pass
 
+# The number of events we read with each epoll_wait starts at EPOLL_MIN_EVENTS, doubles
+# whenever epoll_wait fills the buffer, and halves after EPOLL_SHRINK_AFTER calls in a row
+# which use less than a quarter of it.
+EPOLL_MIN_EVENTS = 32
+EPOLL_MAX_EVENTS = 4096
+EPOLL_SHRINK_AFTER = 16
+
+# The data of each epoll event is a number allocated by EpollWaiter, with a slot index in
+# the low bits and the slot's generation in the high bits.
+_SLOT_BITS = 32
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+
 class EpollWaiter:
     """The core class which reads events from the epollfd and dispatches them.
 
@@ -117,23 +132,39 @@ class EpollWaiter:
     actual epoll_wait calls in this shared class, our usage of epoll becomes more
     efficient.
 
+    The buffer we pass to epoll_wait grows and shrinks with the number of events we
+    receive, up to `max_events`, so that many ready fds don't take many epoll_wait calls.
+
+    Each registration gets a slot in a table, which holds the callback waiting for its next
+    event. Freed slots are reused, so the number we register with epoll also contains a
+    generation, which is bumped each time the slot is freed; an event for an old
+    generation is for a registration which is already gone, and we drop it.
+
     """
     def __init__(self, ram: RAM, epfd: FileDescriptor,
                  wait_readable: t.Optional[t.Callable[[], t.Awaitable[None]]],
                  timeout: int,
+                 max_events: int=EPOLL_MAX_EVENTS,
     ) -> None:
         "To make this, use one of the constructor methods of Epoller: make_subsidiary or make_root"
         self.ram = ram
         self.epfd = epfd
         self.wait_readable = wait_readable
         self.timeout = timeout
+        self.max_events = max(max_events, 1)
+        self.buffer_events = min(EPOLL_MIN_EVENTS, self.max_events)
 
-        self.used_numbers: t.Set[int] = set()
+        self._callbacks: t.List[t.Optional[Continuation[EPOLL]]] = []
+        self._generations: t.List[int] = []
+        self._free_slots: t.List[int] = []
         self.pending_remove: t.Set[int] = set()
         self.queue = RequestQueue[int, EPOLL]()
+        # made on first use by Epoller.timer_wheel
+        self.timer_wheel: t.Optional[TimerWheel] = None
+        self.timer_wheel_made: t.Optional[Event] = None
         reset(self._run())
 
-    def allocate_number(self, request: int) -> int:
+    def allocate_number(self) -> int:
         """Add a callback which will be called on EpollEvents with data == returned number.
 
         We can then add the returned number to the epollfd with some file descriptor and
@@ -142,13 +173,29 @@ class EpollWaiter:
         This is not the user-interface for epoll. That's the register method on Epoller.
 
         """
-        number = request
-        # this is amusingly horrible, but it provides a useful feature:
-        # the number in epoll usually matches the fd number.
-        while number in self.used_numbers:
-            number += 1000
-        self.used_numbers.add(number)
-        return number
+        if self._free_slots:
+            index = self._free_slots.pop()
+        else:
+            index = len(self._callbacks)
+            self._callbacks.append(None)
+            self._generations.append(0)
+        return (self._generations[index] << _SLOT_BITS) | index
+
+    def _release_number(self, number: int) -> None:
+        "Free this number's slot; events which still arrive for it will be dropped."
+        index = number & _SLOT_MASK
+        self._callbacks[index] = None
+        self._generations[index] = (self._generations[index] + 1) & _SLOT_MASK
+        self._free_slots.append(index)
+
+    def _store_callbacks(self) -> None:
+        for number, cb in self.queue.fetch_any():
+            index = number & _SLOT_MASK
+            if (number >> _SLOT_BITS) != self._generations[index]:
+                # this number was already released, and its slot may belong to someone else
+                cb.throw(RemovedFromEpollError())
+            else:
+                self._callbacks[index] = cb
 
     def remove_number_after_next_epoll_wait(self, number: int) -> None:
         """Remove the callback for this number after the next time we call epoll_wait.
@@ -159,9 +206,19 @@ class EpollWaiter:
         """
         self.pending_remove.add(number)
 
+    def _next_buffer_events(self, received: int, quiet: int) -> t.Tuple[int, int]:
+        "Return the buffer size for the next epoll_wait, and the new count of quiet calls."
+        if received >= self.buffer_events:
+            return min(self.buffer_events*2, self.max_events), 0
+        if received > self.buffer_events//4 or self.buffer_events <= EPOLL_MIN_EVENTS:
+            return self.buffer_events, 0
+        if quiet + 1 < EPOLL_SHRINK_AFTER:
+            return self.buffer_events, quiet + 1
+        return max(self.buffer_events//2, EPOLL_MIN_EVENTS), 0
+
     async def _run(self) -> None:
-        input_buf: Pointer = await self.ram.malloc(EpollEventList, 32 * EpollEvent.sizeof())
-        number_to_cb: t.Dict[int, Continuation[EPOLL]] = {}
+        input_buf: Pointer = await self.ram.malloc(EpollEventList, self.buffer_events * EpollEvent.sizeof())
+        quiet = 0
         registered_activity_fd: t.Optional[FileDescriptor] = None
         while True:
             if self.wait_readable:
@@ -172,7 +229,7 @@ class EpollWaiter:
                 if registered_activity_fd:
                     # delete the old registered activity fd
                     await self.epfd.epoll_ctl(EPOLL_CTL.DEL, registered_activity_fd)
-                activity_fd_number = self.allocate_number(int(activity_fd))
+                activity_fd_number = self.allocate_number()
                 # start up a coroutine to consume events from the activity_fd
                 async def devnull(activity_fd_number=activity_fd_number):
                     while True:
@@ -184,6 +241,9 @@ class EpollWaiter:
                                # anything that can be read.
                                EPOLL.IN|EPOLL.RDHUP|EPOLL.PRI|EPOLL.ERR|EPOLL.HUP)))
                 registered_activity_fd = activity_fd
+            if input_buf.size() != self.buffer_events * EpollEvent.sizeof():
+                input_buf.free()
+                input_buf = await self.ram.malloc(EpollEventList, self.buffer_events * EpollEvent.sizeof())
             try:
                 valid_events_buf, rest = await self.epfd.epoll_wait(input_buf, self.timeout)
                 received_events = await valid_events_buf.read()
@@ -191,34 +251,49 @@ class EpollWaiter:
                 final_exn = wait_error
                 break
             input_buf = valid_events_buf + rest
-            for num, cb in self.queue.fetch_any():
-                number_to_cb[num] = cb
+            self.buffer_events, quiet = self._next_buffer_events(len(received_events), quiet)
+            self._store_callbacks()
+            # take all the callbacks first, so the dispatch is a single pass
+            ready: t.List[t.Tuple[Continuation[EPOLL], EPOLL]] = []
             for event in received_events:
-                number_to_cb[event.data].send(event.events)
-                del number_to_cb[event.data]
-            for num, cb in self.queue.fetch_any():
-                number_to_cb[num] = cb
-            for number in list(self.pending_remove):
-                number_to_cb[number].throw(RemovedFromEpollError())
-                del number_to_cb[number]
-                self.pending_remove.remove(number)
+                index = event.data & _SLOT_MASK
+                if (event.data >> _SLOT_BITS) != self._generations[index]:
+                    continue
+                cb = self._callbacks[index]
+                if cb is None:
+                    raise Exception("got an epoll event for a number with no callback", event)
+                self._callbacks[index] = None
+                ready.append((cb, event.events))
+            for cb, events in ready:
+                cb.send(events)
+            # the callbacks we just sent to may have requested again; take those requests
+            # out of the queue now, so that they're the ones we throw to on removal, and
+            # so that closing the queue on hangup doesn't throw into them
+            self._store_callbacks()
+            pending_remove, self.pending_remove = self.pending_remove, set()
+            for number in pending_remove:
+                cb = self._callbacks[number & _SLOT_MASK]
+                self._release_number(number)
+                if cb is not None:
+                    cb.throw(RemovedFromEpollError())
         self.queue.close(final_exn)
 
 class Epoller:
     "Terribly named class that allows registering fds on epoll, and waiting on them."
     @staticmethod
-    def make_subsidiary(ram: RAM, epfd: FileDescriptor, wait_readable: t.Callable[[], t.Awaitable[None]]) -> Epoller:
+    def make_subsidiary(ram: RAM, epfd: FileDescriptor, wait_readable: t.Callable[[], t.Awaitable[None]],
+                        max_events: int=EPOLL_MAX_EVENTS) -> Epoller:
         """Make a subsidiary epoller, as described in the module docstring.
 
         We delegate responsibility for blocking to wait for new events to some other
         component. We call the passed-in wait_readable function to block for new events.
 
         """
-        center = Epoller(EpollWaiter(ram, epfd, wait_readable, 0), ram, epfd)
+        center = Epoller(EpollWaiter(ram, epfd, wait_readable, 0, max_events), ram, epfd)
         return center
 
     @staticmethod
-    async def make_root(ram: RAM, task: Task) -> Epoller:
+    async def make_root(ram: RAM, task: Task, max_events: int=EPOLL_MAX_EVENTS) -> Epoller:
         """Make a root epoller, as described in the module docstring.
 
         We take responsibility for blocking to wait for new events for every other
@@ -228,7 +303,7 @@ class Epoller:
 
         """
         epfd = await task.epoll_create()
-        center = Epoller(EpollWaiter(ram, epfd, None, -1), ram, epfd)
+        center = Epoller(EpollWaiter(ram, epfd, None, -1, max_events), ram, epfd)
         return center
 
     def __init__(self, epoll_waiter: EpollWaiter, ram: RAM, epfd: FileDescriptor) -> None:
@@ -246,6 +321,30 @@ class Epoller:
         """
         return Epoller(self.epoll_waiter, ram, self.epfd.inherit(ram.task))
 
+    async def timer_wheel(self) -> TimerWheel:
+        """Get the `rsyscall.timer_wheel.TimerWheel` shared by every Epoller with our EpollWaiter.
+
+        The TimerWheel's timerfd is made in the EpollWaiter's task, on first use.
+
+        """
+        waiter = self.epoll_waiter
+        if waiter.timer_wheel is None:
+            if waiter.timer_wheel_made is None:
+                made = waiter.timer_wheel_made = Event()
+                from rsyscall.timer_wheel import TimerWheel
+                try:
+                    waiter.timer_wheel = await TimerWheel.make(Epoller(waiter, waiter.ram, waiter.epfd))
+                except BaseException as exn:
+                    # let the next caller try again
+                    waiter.timer_wheel_made = None
+                    made.close(exn)
+                    raise
+                made.set()
+            else:
+                await waiter.timer_wheel_made.wait()
+            assert waiter.timer_wheel is not None
+        return waiter.timer_wheel
+
     async def register(self, fd: FileDescriptor, events: EPOLL) -> EpolledFileDescriptor:
         """Register a file descriptor on this epollfd, for the given events, calling the passed callback.
 
@@ -254,11 +353,28 @@ class Epoller:
         epollfd.
 
         """
-        number = self.epoll_waiter.allocate_number(int(fd.near))
+        number = self.epoll_waiter.allocate_number()
         efd = EpolledFileDescriptor(self, fd, number)
         await self.epfd.epoll_ctl(EPOLL_CTL.ADD, fd, await self.ram.ptr(EpollEvent(number, events)))
         return efd
 
+    async def register_many(self, fds: t.Sequence[FileDescriptor], events: EPOLL) -> t.List[EpolledFileDescriptor]:
+        """Register many file descriptors on this epollfd, all for the same events.
+
+        This is like calling `Epoller.register` for each fd, but we allocate and write all
+        the EpollEvents in a single batch, and make all the epoll_ctl calls concurrently,
+        so that they can be pipelined.
+
+        """
+        numbers = [self.epoll_waiter.allocate_number() for _ in fds]
+        efds = [EpolledFileDescriptor(self, fd, number) for fd, number in zip(fds, numbers)]
+        async def op(sem: RAM) -> t.List[WrittenPointer[EpollEvent]]:
+            return [await sem.ptr(EpollEvent(number, events)) for number in numbers]
+        event_ptrs = await self.ram.perform_batch(op, shape_key=("epoll_register_many", len(fds)))
+        await run_all([functools.partial(self.epfd.epoll_ctl, EPOLL_CTL.ADD, fd, ptr)
+                       for fd, ptr in zip(fds, event_ptrs)])
+        return efds
+
 class EpolledFileDescriptor:
     """Representation of a file descriptor registered on an epollfd.
 
@@ -286,6 +402,9 @@ class EpolledFileDescriptor:
         self.status = FDStatus(EPOLL.OUT|EPOLL.IN)
         self.in_epollfd = True
         self.queue = RequestQueue[EPOLL, None]()
+        # requests are moved from the queue to here, once there's an event to check them against
+        self.waiters: t.Dict[EPOLL, t.List[t.Tuple[EPOLL, Continuation[None]]]] = {flag: [] for flag in EPOLL}
+        self.final_exn: t.Optional[Exception] = None
         self.total_events: t.Counter[EPOLL] = collections.Counter()
         self.consumed_events: t.Dict[EPOLL, int] = {flag: 0 for flag in EPOLL}
         reset(self._run())
@@ -307,7 +426,7 @@ class EpolledFileDescriptor:
         self.in_epollfd = False
 
     async def _run(self) -> None:
-        waiters: t.Dict[EPOLL, t.List[t.Tuple[EPOLL, Continuation[None]]]] = {flag: [] for flag in EPOLL}
+        waiters = self.waiters
         while True:
             try:
                 ev = await self.epoller.epoll_waiter.queue.request(self.number)
@@ -326,14 +445,43 @@ class EpolledFileDescriptor:
                     for waiting_flag in val:
                         waiters[waiting_flag].remove((val, cb))
                     cb.send(None)
+        self.final_exn = final_exn
         self.queue.close(final_exn)
+        remaining = {id(cb): cb for entries in waiters.values() for _, cb in entries}
+        for entries in waiters.values():
+            entries.clear()
+        for cb in remaining.values():
+            cb.throw(final_exn)
+
+    def _wait_cb(self, flags: EPOLL, cb: Continuation[None]) -> t.Callable[[], None]:
+        "Resume `cb` once one of `flags` is set, and return a function which withdraws it."
+        if self.final_exn is not None:
+            cb.throw(self.final_exn)
+            return lambda: None
+        entry = (flags, cb)
+        for flag in flags:
+            self.waiters[flag].append(entry)
+        def withdraw() -> None:
+            for flag in flags:
+                if entry in self.waiters[flag]:
+                    self.waiters[flag].remove(entry)
+        return withdraw
+
+    async def wait_for(self, flags: EPOLL, deadline: t.Optional[float]=None) -> None:
+        """Call epoll_wait until at least one of the passed flags is set in our status.
+
+        If `deadline` passes first, raise TimeoutError; it's a `time.monotonic` time.
 
-    async def wait_for(self, flags: EPOLL) -> None:
-        "Call epoll_wait until at least one of the passed flags is set in our status."
+        """
         if (not (self.status.mask & flags)
             and not any(self.total_events[flag] - self.consumed_events[flag] > 0
                         for flag in flags)):
-            return await self.queue.request(flags)
+            if deadline is None:
+                return await self.queue.request(flags)
+            timer_wheel = await self.epoller.timer_wheel()
+            # registered directly, rather than through the queue, so that it can be
+            # withdrawn on timeout
+            return await timer_wheel.wait_until(deadline, functools.partial(self._wait_cb, flags))
 
     def consume(self, events: t.Dict[EPOLL, int]) -> None:
         """The information from these events is outdated; discard them
@@ -421,19 +569,29 @@ class FDStatus:
     def negedge(self, event: EPOLL) -> None:
         self.mask &= ~event
 
+# An AsyncFileDescriptor registers for every event, edge-triggered.
+AFD_EVENTS = EPOLL.IN|EPOLL.OUT|EPOLL.RDHUP|EPOLL.PRI|EPOLL.ERR|EPOLL.HUP|EPOLL.ET
+
 class AsyncFileDescriptor:
     """A file descriptor on which IO can be performed without blocking the thread.
 
     Also comes with helpful methods `AsyncFileDescriptor.write_all_bytes` and
     `AsyncFileDescriptor.read_some_bytes` to abstract over memory allocation.
 
-    We always wait for a posedge to come back from epoll before trying to read. This is
-    not necessarily too pessimistic, because as soon as we have a single posedge, we will
-    keep reading in a loop, as long as data keeps coming through.
+    Normally, once we've seen an EAGAIN, we wait for a posedge to come back from epoll
+    before trying to read again. This is not necessarily too pessimistic, because as soon
+    as we have a single posedge, we will keep reading in a loop, as long as data keeps
+    coming through.
+
+    If `optimistic` is set, each read, write or accept instead tries the syscall first, and
+    only waits for epoll if it gets EAGAIN. For request/response protocols, where the
+    response has often arrived by the time we try to read it, this saves waiting for the
+    posedge; in exchange, we make a wasted syscall whenever the fd isn't ready.
 
     """
     @staticmethod
-    async def make(epoller: Epoller, ram: RAM, fd: FileDescriptor) -> AsyncFileDescriptor:
+    async def make(epoller: Epoller, ram: RAM, fd: FileDescriptor,
+                   optimistic: bool=False) -> AsyncFileDescriptor:
         """Make an AsyncFileDescriptor; make sure to call this with only O.NONBLOCK file descriptors.
 
         It won't actually break anything if this is called with file descriptors not in
@@ -441,19 +599,31 @@ class AsyncFileDescriptor:
         probably not what the user wants.
 
         """
-        epolled = await epoller.register(
-            fd, EPOLL.IN|EPOLL.OUT|EPOLL.RDHUP|EPOLL.PRI|EPOLL.ERR|EPOLL.HUP|EPOLL.ET,
-        )
-        return AsyncFileDescriptor(ram, fd, epolled)
+        epolled = await epoller.register(fd, AFD_EVENTS)
+        return AsyncFileDescriptor(ram, fd, epolled, optimistic)
+
+    @staticmethod
+    async def make_many(epoller: Epoller, ram: RAM, fds: t.Sequence[FileDescriptor],
+                        optimistic: bool=False) -> t.List[AsyncFileDescriptor]:
+        """Make an AsyncFileDescriptor for each of these O.NONBLOCK file descriptors.
+
+        This registers all of them with a single `Epoller.register_many`, which is much
+        cheaper than calling `AsyncFileDescriptor.make` for each one.
+
+        """
+        epolleds = await epoller.register_many(fds, AFD_EVENTS)
+        return [AsyncFileDescriptor(ram, fd, epolled, optimistic) for fd, epolled in zip(fds, epolleds)]
 
     def __init__(self, ram: RAM, handle: FileDescriptor,
                  epolled: EpolledFileDescriptor,
+                 optimistic: bool=False,
     ) -> None:
         "Don't construct directly; use the AsyncFileDescriptor.make constructor instead."
         self.ram = ram
         self.handle = handle
         "The underlying FileDescriptor for this AFD, used for all system calls"
         self.epolled = epolled
+        self.optimistic = optimistic
 
     def __str__(self) -> str:
         return f"AsyncFileDescriptor({self.epolled})"
@@ -468,19 +638,27 @@ class AsyncFileDescriptor:
         most useful when calling accept() and wanting to create new AFDs out of the resulting FDs.
 
         """
-        return await AsyncFileDescriptor.make(self.epolled.epoller, self.ram, fd)
+        return await AsyncFileDescriptor.make(self.epolled.epoller, self.ram, fd, self.optimistic)
 
     async def wait_for_rdhup(self) -> None:
         "Call epoll_wait until this file descriptor has a hangup."
         await self.epolled.wait_for(EPOLL.RDHUP|EPOLL.HUP)
 
-    async def read(self, ptr: Pointer) -> t.Tuple[Pointer, Pointer]:
-        "Call `FileDescriptor.read` without blocking the thread."
+    async def read(self, ptr: Pointer, deadline: t.Optional[float]=None) -> t.Tuple[Pointer, Pointer]:
+        """Call `FileDescriptor.read` without blocking the thread.
+
+        If `deadline` (a `time.monotonic` time) passes while we're waiting for the fd to
+        become readable, raise TimeoutError.
+
+        """
+        try_first = self.optimistic
         while True:
-            await self.epolled.wait_for(EPOLL.IN|EPOLL.RDHUP|EPOLL.HUP|EPOLL.ERR)
+            if not try_first:
+                await self.epolled.wait_for(EPOLL.IN|EPOLL.RDHUP|EPOLL.HUP|EPOLL.ERR, deadline)
+            try_first = False
             current_events = self.epolled.get_current_events(EPOLL.IN|EPOLL.RDHUP|EPOLL.HUP|EPOLL.ERR)
             try:
-                return (await self.handle.read(ptr))
+                result = await self.handle.read(ptr)
             except OSError as e:
                 self.epolled.consume(current_events)
                 if e.errno == errno.EAGAIN:
@@ -491,6 +669,7 @@ class AsyncFileDescriptor:
             else:
                 self.epolled.consume(current_events)
                 self.epolled.status.posedge(EPOLL.IN|EPOLL.RDHUP|EPOLL.HUP)
+                return result
 
     async def read_some_bytes(self, count: int=4096) -> bytes:
         """Read at most count bytes; possibly less, if we have a partial read.
@@ -504,18 +683,23 @@ class AsyncFileDescriptor:
         valid, _ = await self.read(ptr)
         return await valid.read()
 
-    async def write(self, buf: Pointer) -> t.Tuple[Pointer, Pointer]:
+    async def write(self, buf: Pointer, deadline: t.Optional[float]=None) -> t.Tuple[Pointer, Pointer]:
         """Call `FileDescriptor.write` without blocking the thread.
 
         Note that this doesn't retry partial writes, which are always a possibility, so you should
         make sure to do that yourself, or use `AsyncFileDescriptor.write_all`.
 
+        If `deadline` passes while we're waiting for the fd to become writable, raise TimeoutError.
+
         """
+        try_first = self.optimistic
         while True:
-            await self.epolled.wait_for(EPOLL.OUT|EPOLL.ERR)
+            if not try_first:
+                await self.epolled.wait_for(EPOLL.OUT|EPOLL.ERR, deadline)
+            try_first = False
             current_events = self.epolled.get_current_events(EPOLL.OUT|EPOLL.ERR)
             try:
-                return await self.handle.write(buf)
+                result = await self.handle.write(buf)
             except OSError as e:
                 self.epolled.consume(current_events)
                 if e.errno == errno.EAGAIN:
@@ -526,6 +710,7 @@ class AsyncFileDescriptor:
             else:
                 self.epolled.consume(current_events)
                 self.epolled.status.posedge(EPOLL.OUT)
+                return result
 
     async def write_all(self, to_write: Pointer) -> None:
         """Write all of this pointer to the fd, retrying on partial writes until complete.
@@ -551,22 +736,28 @@ class AsyncFileDescriptor:
         await self.write_all(ptr)
 
     @t.overload
-    async def accept(self, flags: SOCK=SOCK.NONE) -> FileDescriptor: ...
+    async def accept(self, flags: SOCK=SOCK.NONE, *, deadline: t.Optional[float]=None) -> FileDescriptor: ...
     @t.overload
-    async def accept(self, flags: SOCK, addr: WrittenPointer[Sockbuf[T_sockaddr]]
+    async def accept(self, flags: SOCK, addr: WrittenPointer[Sockbuf[T_sockaddr]],
+                     deadline: t.Optional[float]=None,
     ) -> t.Tuple[FileDescriptor, WrittenPointer[Sockbuf[T_sockaddr]]]: ...
 
-    async def accept(self, flags: SOCK=SOCK.NONE, addr: t.Optional[WrittenPointer[Sockbuf[T_sockaddr]]]=None
+    async def accept(self, flags: SOCK=SOCK.NONE, addr: t.Optional[WrittenPointer[Sockbuf[T_sockaddr]]]=None,
+                     deadline: t.Optional[float]=None,
     ) -> t.Union[FileDescriptor, t.Tuple[FileDescriptor, WrittenPointer[Sockbuf[T_sockaddr]]]]:
-        "Call accept without blocking the thread."
+        "Call accept without blocking the thread, raising TimeoutError if `deadline` passes first."
+        try_first = self.optimistic
         while True:
-            await self.epolled.wait_for(EPOLL.IN|EPOLL.HUP|EPOLL.ERR)
+            if not try_first:
+                await self.epolled.wait_for(EPOLL.IN|EPOLL.HUP|EPOLL.ERR, deadline)
+            try_first = False
             current_events = self.epolled.get_current_events(EPOLL.IN|EPOLL.HUP|EPOLL.ERR)
             try:
+                result: t.Union[FileDescriptor, t.Tuple[FileDescriptor, WrittenPointer[Sockbuf[T_sockaddr]]]]
                 if addr is None:
-                    return (await self.handle.accept(flags))
+                    result = await self.handle.accept(flags)
                 else:
-                    return (await self.handle.accept(flags, addr))
+                    result = await self.handle.accept(flags, addr)
             except OSError as e:
                 self.epolled.consume(current_events)
                 if e.errno == errno.EAGAIN:
@@ -577,6 +768,7 @@ class AsyncFileDescriptor:
             else:
                 self.epolled.consume(current_events)
                 self.epolled.status.posedge(EPOLL.IN)
+                return result
 
     async def accept_addr(self, flags: SOCK=SOCK.NONE) -> t.Tuple[FileDescriptor, Sockaddr]:
         "Call accept with a buffer for the address, and return the resulting fd and address."
@@ -630,7 +822,7 @@ class AsyncFileDescriptor:
         using this AFD.
 
         """
-        return AsyncFileDescriptor(self.ram, fd, self.epolled)
+        return AsyncFileDescriptor(self.ram, fd, self.epolled, self.optimistic)
 
     async def close(self) -> None:
         "Remove this FD from Epoll and invalidate the FD handle."
@@ -647,6 +839,13 @@ class AsyncFileDescriptor:
 ################################################################################
 # Miscellaneous helpers
 
+# The size of the buffer AsyncReadBuffer reads into starts at READ_BUFFER_MIN, doubles
+# whenever a read fills it, and halves after READ_BUFFER_SHRINK_AFTER reads in a row
+# which use less than an eighth of it.
+READ_BUFFER_MIN = 4096
+READ_BUFFER_MAX = 256*1024
+READ_BUFFER_SHRINK_AFTER = 16
+
 class AsyncReadBuffer:
     """A buffer for parsing variable-length streaming data.
 
@@ -655,36 +854,71 @@ class AsyncReadBuffer:
     data so that it can be parsed. That's what this class does; and it provides a few
     helper methods to make it easier to read and parse such streams.
 
+    Buffered data is kept in a bytearray, which we only ever append to and remove from the
+    front of; CPython makes removing from the front of a bytearray cheap, so this works
+    like a ring buffer. We read into a single remote buffer which we reuse across reads;
+    it doubles in size whenever a read fills it, up to READ_BUFFER_MAX, and halves after
+    a run of reads which use only a small part of it.
+
     """
     def __init__(self, fd: AsyncFileDescriptor, parsing_ffi=None) -> None:
         self.fd = fd
         self.ffi = parsing_ffi or ffi
-        self.buf = b""
-        self.unread_ptr: t.Optional[Pointer] = None
-
-    async def _read(self) -> bytes:
-        "Read some bytes; raises on EOF."
-        if self.unread_ptr is None:
-            ptr = await self.fd.ram.malloc(bytes, 4096)
-            self.unread_ptr, _ = await self.fd.read(ptr)
-        if self.unread_ptr.size():
-            data = await self.unread_ptr.read()
-        else:
-            data = b''
-        self.unread_ptr = None
-        if len(data) == 0:
+        self.buf = bytearray()
+        # how far into buf we've already searched for searched_delim
+        self.searched = 0
+        self.searched_delim = b""
+        self.read_size = READ_BUFFER_MIN
+        self.small_reads = 0
+        self.read_ptr: t.Optional[Pointer[bytes]] = None
+        # the result of a read whose data we haven't yet copied into buf
+        self.unread: t.Optional[t.Tuple[Pointer[bytes], Pointer[bytes]]] = None
+
+    async def _read(self) -> None:
+        "Read some more bytes onto the end of the buffer; raises on EOF."
+        if self.unread is None:
+            if self.read_ptr is None:
+                self.read_ptr = await self.fd.ram.malloc(bytes, self.read_size)
+            ptr, self.read_ptr = self.read_ptr, None
+            self.unread = await self.fd.read(ptr)
+        valid, rest = self.unread
+        count = valid.size()
+        if count:
+            self.buf += await valid.read_memoryview()
+        self.unread = None
+        self._adapt(count, valid.merge(rest))
+        if count == 0:
             raise EOFError
+
+    def _adapt(self, count: int, ptr: Pointer[bytes]) -> None:
+        "Keep this buffer for the next read, unless the last read showed it's the wrong size."
+        size = ptr.size()
+        if count == size:
+            self.small_reads = 0
+            self.read_size = min(size*2, READ_BUFFER_MAX)
+        elif count < size//8 and size > READ_BUFFER_MIN:
+            self.small_reads += 1
+            if self.small_reads >= READ_BUFFER_SHRINK_AFTER:
+                self.small_reads = 0
+                self.read_size = max(size//2, READ_BUFFER_MIN)
+        else:
+            self.small_reads = 0
+        if self.read_size == size:
+            self.read_ptr = ptr
         else:
-            return data
+            ptr.free()
+
+    def _remove(self, length: int) -> None:
+        del self.buf[:length]
+        self.searched = 0
 
     async def read_length(self, length: int, remove: bool=True) -> bytes:
         "Read exactly this many bytes; raises on EOF."
         while len(self.buf) < length:
-            data = await self._read()
-            self.buf += data
-        section = self.buf[:length]
+            await self._read()
+        section = bytes(self.buf[:length])
         if remove:
-            self.buf = self.buf[length:]
+            self._remove(length)
         return section
 
     async def read_cffi(self, name: str, remove: bool=True) -> t.Any:
@@ -748,21 +982,23 @@ class AsyncReadBuffer:
 
     async def read_until_delimiter(self, delim: bytes) -> t.Optional[bytes]:
         "Read and return all bytes until the specified delimiter, stripping the delimiter; on EOF, return None."
+        if delim != self.searched_delim:
+            self.searched = 0
+            self.searched_delim = delim
         while True:
-            try:
-                i = self.buf.index(delim)
-            except ValueError:
-                pass
-            else:
-                section = self.buf[:i]
+            i = self.buf.find(delim, self.searched)
+            if i >= 0:
+                section = bytes(self.buf[:i])
                 # skip the delimiter
-                self.buf = self.buf[i+1:]
+                self._remove(i + len(delim))
                 return section
-            # buf contains no copies of "delim", gotta read some more data
-            data = await self._read()
-            if data is None:
+            # buf contains no copies of "delim"; next time, only search the new data,
+            # and the end of the old data in case the delimiter straddles them
+            self.searched = max(len(self.buf) - len(delim) + 1, 0)
+            try:
+                await self._read()
+            except EOFError:
                 return None
-            self.buf += data
 
     async def read_line(self) -> bytes:
         "Read and return a line, stripping the newline character."
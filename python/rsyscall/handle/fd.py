@@ -12,11 +12,11 @@ from weakref import WeakSet
 import itertools
 import abc
 import gc
+import os
 import rsyscall.far
 import rsyscall.near
-from rsyscall.near.sysif import SyscallHangup, SyscallInterface
+from rsyscall.near.sysif import SyscallHangup, SyscallBatchError, SyscallInterface, Syscall
 from rsyscall.sys.syscall import SYS
-import trio
 import typing as t
 import logging
 import contextlib
@@ -248,15 +248,32 @@ class FDTable(rsyscall.far.FDTable):
 
     async def gc_using_task(self, task: FileDescriptorTask) -> None:
         gc.collect()
-        async with trio.open_nursery() as nursery:
-            # take a snapshot of near_to_handles so we can mutate it while iterating
-            for fd, handles in list(self.near_to_handles.items()):
-                if not handles:
-                    # we immediately take responsibility for closing this fd, so our close
-                    # attempts don't collide with others
-                    del self.near_to_handles[fd]
-                    logger.debug("gc for %s: starting close fd for %s", self, fd)
-                    nursery.start_soon(self._close_fd, task, fd)
+        fds: t.List[rsyscall.near.FileDescriptor] = []
+        # take a snapshot of near_to_handles so we can mutate it while iterating
+        for fd, handles in list(self.near_to_handles.items()):
+            if not handles:
+                # we immediately take responsibility for closing this fd, so our close
+                # attempts don't collide with others
+                del self.near_to_handles[fd]
+                fds.append(fd)
+        if not fds:
+            return
+        logger.debug("gc for %s: closing fds %s", self, fds)
+        # the closes are independent, so we can make them all as a single batch
+        results: t.List[t.Optional[int]]
+        try:
+            results = list(await task.sysif.syscall_batch([Syscall(SYS.close, fd, 0, 0, 0, 0, 0) for fd in fds]))
+        except SyscallBatchError as exn:
+            # closing some of the fds through this task went wrong; see _close_fd. The
+            # rest were closed, so their numbers may already be reused; don't put them back.
+            results = exn.results
+        for fd, result in zip(fds, results):
+            if result is None:
+                assert fd not in self.near_to_handles, f"fd {fd} was somehow reopened before it was actually closed"
+                self.near_to_handles[fd] = WeakSet()
+        for fd, result in zip(fds, results):
+            if result is not None and result < 0:
+                raise OSError(-result, os.strerror(-result), fd)
 
     async def run_gc(self) -> None:
         task = self._get_task_in_table()
@@ -89,6 +89,29 @@ class Pointer(t.Generic[T]):
         value = await self.transport.read(self)
         return self.serializer.from_bytes(value)
 
+    async def read_into(self, buf: t.Union[bytearray, memoryview]) -> int:
+        """Read the raw bytes pointed to by this pointer into the start of this buffer
+
+        This doesn't deserialize, and for local pointers it copies straight into the buffer, so
+        it's useful for reading bulk data into a preallocated bytearray or memoryview. The buffer
+        must be at least as big as the pointer; returns the number of bytes read.
+
+        """
+        self._validate()
+        if memoryview(buf).nbytes < self.size():
+            raise Exception("buffer of size", memoryview(buf).nbytes, "is too small for pointer", self)
+        return await self.transport.read_into(self, buf)
+
+    async def read_memoryview(self) -> memoryview:
+        """Read the raw bytes pointed to by this pointer as a read-only memoryview
+
+        For local pointers, this is a view of the memory itself, with no copy, so it's only
+        meaningful until the pointer is freed or written to; copy it if you need to keep it.
+
+        """
+        self._validate()
+        return await self.transport.read_memoryview(self)
+
     def size(self) -> int:
         """Return the size of this pointer's allocation in bytes
 
@@ -133,6 +156,10 @@ class Pointer(t.Generic[T]):
         ptr.valid = False
         # TODO we should only allow merge if we are the only reference to this allocation
         alloc = self.allocation.merge(ptr.allocation)
+        if ptr.mapping.near.length > self.mapping.near.length:
+            # the mapping was grown in place between the two allocations (see
+            # Arena.grow), so only the later handle covers the merged allocation
+            return Pointer(ptr.mapping, self.transport, self.serializer, alloc, self.typ)
         return self._with_alloc(alloc)
 
     def __add__(self, right: Pointer[T]) -> Pointer[T]:
@@ -185,14 +212,12 @@ class Pointer(t.Generic[T]):
         of the buffer to read to or write from.
 
         """
-        # TODO actual tracking of pointer references is not yet implemented
-        # we should have a flag or lock to indicate that this pointer shouldn't be moved or deleted,
-        # while it's being borrowed.
         # TODO rename this to pinned
         # TODO make this the only way to get .near
         self._validate()
         self.check_address_space(task)
-        yield self.near
+        with self.allocation.pinned():
+            yield self.near
 
     def _validate(self) -> None:
         if not self.valid:
@@ -117,6 +117,8 @@ class NativeLoader:
     persistent_server_func: Pointer[NativeFunction]
     trampoline_func: Pointer[NativeFunction]
     futex_helper_func: Pointer[NativeFunction]
+    batch_server_func: Pointer[NativeFunction]
+    ring_server_func: Pointer[NativeFunction]
 
     @staticmethod
     def make_from_symbols(task: Task, symbols: t.Any) -> NativeLoader:
@@ -137,6 +139,8 @@ class NativeLoader:
             persistent_server_func=to_handle(symbols.rsyscall_persistent_server),
             trampoline_func=to_handle(symbols.rsyscall_trampoline),
             futex_helper_func=to_handle(symbols.rsyscall_futex_helper),
+            batch_server_func=to_handle(symbols.rsyscall_batch_server),
+            ring_server_func=to_handle(symbols.rsyscall_ring_server),
         )
 
     def make_trampoline_stack(self, trampoline: Trampoline) -> Stack[Trampoline]:
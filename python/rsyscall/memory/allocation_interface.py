@@ -1,6 +1,7 @@
 "Defines AllocationInterface."
 from __future__ import annotations
 import abc
+import contextlib
 import typing as t
 
 class UseAfterFreeError(Exception):
@@ -50,4 +51,11 @@ class AllocationInterface:
     def free(self) -> None:
         "Invalidate this allocation and return its range for re-allocation; also called automatically on __del__."
         pass
+    def pinned(self) -> t.ContextManager[None]:
+        """Keep the memory of this allocation from being moved or unmapped while in this context.
+
+        By default this does nothing, since most allocations are never moved.
+
+        """
+        return contextlib.nullcontext()
 
@@ -4,13 +4,20 @@ None of this is actually specific to memory; it would be a good project to make
 allocators indifferent to whether they are allocating memory or allocating something else
 - sub-ranges of files, for example.
 
-It would also be nice to provide an allocator that can grow its memory mapping when it
-needs new space. That would require us to pin allocations when making use of pointers
-using them.
+UnlimitedAllocator grows its most recent memory mapping with mremap when it needs new
+space, and only makes a new mapping if that fails. Pointers hold the address of their
+mapping, so a mapping can only be moved by mremap when it has no live allocations and
+nothing else has pinned it; otherwise it's only grown in place.
+
+Our mappings are shared, and a shared mapping is backed by a file, even when it's
+anonymous; touching pages of the mapping past the end of the file raises SIGBUS. So a
+mapping we want to grow is backed by a memfd, which we extend before growing the mapping.
+Making a memfd takes several more syscalls than a plain mmap, so an allocator's first
+arena is anonymous, and only the arenas it makes once it's run out of space have memfds.
 
 """
 from __future__ import annotations
-from dneio import RequestQueue, reset
+from dneio import RequestQueue, Continuation, reset
 from rsyscall._raw import ffi, lib # type: ignore
 from rsyscall.far import AddressSpace
 from rsyscall.near.sysif import SyscallInterface
@@ -23,14 +30,16 @@ import trio
 import abc
 import enum
 import contextlib
+import errno
 import typing as t
 import logging
 from dataclasses import dataclass
-from rsyscall.sys.mman import PROT, MAP, MemoryMapping
+from rsyscall.sys.mman import PROT, MAP, MADV, MREMAP, MemoryMapping
+from rsyscall.linux.memfd import MFD, _memfd_create
 logger = logging.getLogger(__name__)
 
 # We set eq=False because two distinct zero-length allocations can be identical in all
-# their fields, yet they should not be treated as equal, such as in calls to .index()
+# their fields, yet they should not be treated as equal, such as when stored in a set
 @dataclass(eq=False)
 class Allocation(AllocationInterface):
     """An allocation from some Arena.
@@ -48,15 +57,10 @@ class Allocation(AllocationInterface):
 
     def offset(self) -> int:
         if not self.valid:
-            try:
-                idx = self.arena.allocations.index(self)
-            except ValueError:
-                idx = -1
             raise UseAfterFreeError(
                 "This allocation has already been freed; refusing to return its offset for use in pointers",
                 self,
-                "idx", idx,
-                "self.arena.allocations", self.arena.allocations,
+                "self.arena", self.arena,
             )
         return self.start
 
@@ -64,21 +68,24 @@ class Allocation(AllocationInterface):
         if self.valid:
             self.valid = False
             self.arena.allocations.remove(self)
+            self.arena._release(self.start, self.end)
 
     def size(self) -> int:
         return self.end - self.start
 
+    def pinned(self) -> t.ContextManager[None]:
+        return self.arena.pinned()
+
     def split(self, size: int) -> t.Tuple[Allocation, Allocation]:
         if not self.valid:
             raise Exception("can't split freed allocation")
-        idx = self.arena.allocations.index(self)
         splitpoint = self.start+size
-        first = Allocation(self.arena, self.start, splitpoint, valid=False)
-        second = Allocation(self.arena, splitpoint, self.end, valid=False)
-        self.free()
-        self.arena.allocations[idx:idx] = [first, second]
-        first.valid = True
-        second.valid = True
+        first = Allocation(self.arena, self.start, splitpoint)
+        second = Allocation(self.arena, splitpoint, self.end)
+        # the space stays allocated; it just belongs to first and second now
+        self.valid = False
+        self.arena.allocations.remove(self)
+        self.arena.allocations.update((first, second))
         return first, second
 
     def merge(self, other: AllocationInterface) -> Allocation:
@@ -94,16 +101,12 @@ class Allocation(AllocationInterface):
         arena = self.arena
         if self.end != other.start:
             raise Exception("to merge allocations, our end", self.end, "must equal their start", other.start)
-        a_idx = arena.allocations.index(self)
-        b_idx = arena.allocations.index(other)
-        if a_idx + 1 != b_idx:
-            raise Exception("allocations are unexpectedly at non-adjacent indices",
-                            a_idx, self, id(self), b_idx, other, id(other))
-        new = Allocation(self.arena, self.start, other.end, valid=False)
-        self.free()
-        other.free()
-        arena.allocations.insert(a_idx, new)
-        new.valid = True
+        new = Allocation(self.arena, self.start, other.end)
+        self.valid = False
+        other.valid = False
+        arena.allocations.remove(self)
+        arena.allocations.remove(other)
+        arena.allocations.add(new)
         return new
 
     def __str__(self) -> str:
@@ -123,6 +126,22 @@ class OutOfSpaceError(Exception):
     "Raised by malloc if the allocation request couldn't be satisfied."
     pass
 
+@dataclass
+class ArenaStats:
+    "Statistics about the memory in one Arena."
+    mapping: MemoryMapping
+    live_bytes: int
+    free_bytes: int
+    largest_free: int
+    allocations: int
+
+    @property
+    def fragmentation(self) -> float:
+        "The fraction of free space which isn't in the largest free extent."
+        if self.free_bytes == 0:
+            return 0.0
+        return 1 - self.largest_free/self.free_bytes
+
 class AllocatorInterface:
     "A memory allocator; raises OutOfSpaceError if there's no more space."
     async def bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, AllocationInterface]]:
@@ -135,41 +154,244 @@ class AllocatorInterface:
     def inherit(self, task: Task) -> AllocatorInterface:
         raise Exception("can't be inherited:", self)
 
+    def stats(self) -> t.List[ArenaStats]:
+        raise Exception("doesn't keep statistics:", self)
+
 @dataclass(eq=False)
 class Arena(AllocatorInterface):
-    "A single memory mapping and allocations within it."
+    """A single memory mapping and allocations within it.
+
+    We keep an index of the free extents in the mapping, so allocating and freeing don't
+    have to scan the live allocations. Free extents are looked up by their ends when an
+    allocation is freed, so that adjacent free extents are coalesced, and grouped by
+    size class, so we can find one big enough for an allocation without a full scan.
+
+    We also keep track of the free extents which are big enough to be worth returning
+    their pages to the kernel, for `Arena.trim`.
+
+    Anything which uses addresses in the mapping without holding an allocation, such as
+    memory shared with another address space, should pin the Arena, so that it isn't
+    moved or unmapped. `Pointer.borrow` pins the Arena while a pointer is passed to a
+    syscall, through `Allocation.pinned`.
+
+    If `memfd` is passed, it's the file backing the mapping, which the Arena takes
+    ownership of; only Arenas with a memfd can grow.
+
+    """
     mapping: MemoryMapping
-    allocations: t.List[Allocation]
+    allocations: t.Set[Allocation]
 
-    def __init__(self, mapping: MemoryMapping) -> None:
+    @staticmethod
+    async def make(task: Task, length: int) -> Arena:
+        """Map a new Arena in `task`, backed by a memfd so that it can grow.
+
+        memfd_create takes a name in the task's memory, but this is how we get memory in
+        the first place; so we briefly map a page, which starts out zeroed, and pass it as
+        an empty name. If we can't make a memfd, we fall back to an anonymous mapping.
+
+        """
+        name_page = await task.mmap(4096, PROT.READ, MAP.PRIVATE)
+        try:
+            memfd = task.make_fd_handle(await _memfd_create(
+                task.sysif, name_page.near.as_address(), MFD.CLOEXEC))
+        except OSError:
+            logger.info("failed to make a memfd in %s, falling back to anonymous mappings",
+                        task, exc_info=True)
+            return Arena(await task.mmap(length, PROT.READ|PROT.WRITE, MAP.SHARED))
+        finally:
+            await name_page.munmap()
+        try:
+            await memfd.ftruncate(length)
+            mapping = await memfd.mmap(length, PROT.READ|PROT.WRITE, MAP.SHARED)
+        except BaseException:
+            await memfd.close()
+            raise
+        return Arena(mapping, memfd)
+
+    def __init__(self, mapping: MemoryMapping, memfd: t.Optional[handle.FileDescriptor]=None) -> None:
         self.mapping = mapping
-        self.allocations: t.List[Allocation] = []
+        self.memfd = memfd
+        self.allocations: t.Set[Allocation] = set()
+        self._free_by_start: t.Dict[int, int] = {}
+        self._free_by_end: t.Dict[int, int] = {}
+        # the starts of the free extents whose size has each bit length
+        self._free_classes: t.List[t.Set[int]] = [set() for _ in range(mapping.near.length.bit_length() + 1)]
+        # the starts of the free extents which we should trim
+        self._trim_candidates: t.Set[int] = set()
+        self._pins = 0
+        # called after a free which leaves memory to reclaim, or an unpin which lets us do it
+        self.on_free: t.Optional[t.Callable[[Arena], None]] = None
+        self._add_free(0, mapping.near.length)
+
+    def pin(self) -> None:
+        "Prevent this Arena from being moved or unmapped until a matching `Arena.unpin`."
+        self._pins += 1
+
+    def unpin(self) -> None:
+        if self._pins == 0:
+            raise Exception("unpin called on an Arena which isn't pinned", self)
+        self._pins -= 1
+        if self.on_free is not None and self._reclaimable():
+            self.on_free(self)
+
+    @contextlib.contextmanager
+    def pinned(self) -> t.Iterator[None]:
+        self.pin()
+        try:
+            yield
+        finally:
+            self.unpin()
+
+    def movable(self) -> bool:
+        "Whether nothing refers to addresses in this Arena, so that it can be moved or unmapped."
+        return not self.allocations and self._pins == 0
+
+    def _reclaimable(self) -> bool:
+        "Whether we have free extents to trim, or we're empty, and nothing has pinned us."
+        return self._pins == 0 and bool(self._trim_candidates or not self.allocations)
 
     async def malloc(self, size: int, alignment: int) -> t.Tuple[MemoryMapping, Allocation]:
         return self.mapping, self.allocate(size, alignment)
 
+    def _add_free(self, start: int, end: int) -> None:
+        if start == end:
+            return
+        self._free_by_start[start] = end
+        self._free_by_end[end] = start
+        self._free_classes[(end - start).bit_length()].add(start)
+
+    def _remove_free(self, start: int) -> int:
+        "Remove the free extent starting at `start` from the index, returning its end."
+        end = self._free_by_start.pop(start)
+        del self._free_by_end[end]
+        self._free_classes[(end - start).bit_length()].discard(start)
+        self._trim_candidates.discard(start)
+        return end
+
+    def _release(self, start: int, end: int) -> None:
+        "Mark this range as free again, coalescing it with any free extents next to it."
+        if start != end:
+            if start in self._free_by_end:
+                start = self._free_by_end[start]
+                self._remove_free(start)
+            if end in self._free_by_start:
+                end = self._remove_free(end)
+            self._add_free(start, end)
+            if _page_interior(start, end)[1] >= TRIM_THRESHOLD:
+                self._trim_candidates.add(start)
+        if self.on_free is not None and self._reclaimable():
+            self.on_free(self)
+
+    def _allocate_from(self, start: int, size: int, alignment: int) -> Allocation:
+        end = self._remove_free(start)
+        alloc_start = align(start, alignment)
+        self._add_free(start, alloc_start)
+        self._add_free(alloc_start + size, end)
+        newalloc = Allocation(self, alloc_start, alloc_start + size)
+        self.allocations.add(newalloc)
+        return newalloc
+
     def allocate(self, size: int, alignment: int) -> Allocation:
-        newstart = 0
-        for i, alloc in enumerate(self.allocations):
-            if (newstart+size) <= alloc.start:
-                newalloc = Allocation(self, newstart, newstart+size)
-                self.allocations.insert(i, newalloc)
-                return newalloc
-            newstart = align(alloc.end, alignment)
-        if (newstart+size) <= self.mapping.near.length:
-            newalloc = Allocation(self, newstart, newstart+size)
-            self.allocations.append(newalloc)
+        if size == 0:
+            # zero-length allocations don't take up any space, so they can go anywhere aligned
+            newalloc = Allocation(self, 0, 0)
+            self.allocations.add(newalloc)
             return newalloc
+        # any extent with at least this size fits the allocation, however it's aligned
+        needed = size + alignment - 1
+        for size_class in range(needed.bit_length() + 1, len(self._free_classes)):
+            if self._free_classes[size_class]:
+                return self._allocate_from(self._free_classes[size_class].pop(), size, alignment)
+        # smaller extents might still fit, depending on their alignment
+        for size_class in range(size.bit_length(), min(needed.bit_length() + 1, len(self._free_classes))):
+            for start in self._free_classes[size_class]:
+                if align(start, alignment) + size <= self._free_by_start[start]:
+                    return self._allocate_from(start, size, alignment)
         raise OutOfSpaceError()
 
+    async def grow(self, new_length: int) -> bool:
+        """Grow the mapping to `new_length` with mremap, returning False if we can't.
+
+        If the Arena is movable, the kernel can move the mapping to find room; otherwise
+        we can only grow it in place, which fails if the addresses after the mapping are
+        in use.
+
+        We can't grow an Arena without a memfd, since its mapping is backed by a file of
+        fixed size, and the new pages would be past the end of it.
+
+        Pointers allocated before we grew in place keep the handle for the old, shorter
+        mapping; it's still valid for them, since it has the same address and file, and
+        their allocations are all inside its length.
+
+        """
+        old_length = self.mapping.near.length
+        if new_length <= old_length:
+            raise Exception("can't grow an Arena of length", old_length, "to", new_length)
+        if self.memfd is None:
+            return False
+        flags = MREMAP.MAYMOVE if self.movable() else MREMAP.NONE
+        await self.memfd.ftruncate(new_length)
+        try:
+            self.mapping = await self.mapping.mremap(new_length, flags)
+        except OSError as e:
+            await self.memfd.ftruncate(old_length)
+            if e.errno == errno.ENOMEM:
+                return False
+            raise
+        self._free_classes.extend(set() for _ in range(len(self._free_classes), new_length.bit_length() + 1))
+        # coalesce with the free extent at the old end of the mapping, if there is one;
+        # the new pages were never touched, so they don't need trimming
+        start = old_length
+        if old_length in self._free_by_end:
+            start = self._free_by_end[old_length]
+            trim = start in self._trim_candidates
+            self._remove_free(start)
+            if trim:
+                self._trim_candidates.add(start)
+        self._add_free(start, new_length)
+        return True
+
+    async def trim(self) -> None:
+        """Return the pages of large free extents to the kernel.
+
+        Only the whole pages inside extents which were freed since the last trim are
+        returned. Our mappings are shared, so we use MADV.REMOVE, which frees the backing
+        memory; MADV.DONTNEED would only unmap it from the page table.
+
+        This must not race with allocation from this Arena, since the allocation could be
+        written to before our madvise takes effect.
+
+        """
+        candidates, self._trim_candidates = self._trim_candidates, set()
+        for start in candidates:
+            if start not in self._free_by_start:
+                # coalesced into another extent while we were trimming
+                continue
+            offset, length = _page_interior(start, self._free_by_start[start])
+            await self.mapping.madvise(MADV.REMOVE, offset, length)
+
+    def stats(self) -> t.List[ArenaStats]:
+        free_bytes = sum(end - start for start, end in self._free_by_start.items())
+        largest_free = max((end - start for start, end in self._free_by_start.items()), default=0)
+        return [ArenaStats(
+            mapping=self.mapping,
+            live_bytes=self.mapping.near.length - free_bytes,
+            free_bytes=free_bytes,
+            largest_free=largest_free,
+            allocations=len(self.allocations),
+        )]
+
     async def close(self) -> None:
-        if self.allocations:
-            raise Exception
+        if not self.movable():
+            raise Exception("can't unmap an Arena which is still in use", self)
         await self.mapping.munmap()
+        if self.memfd is not None:
+            await self.memfd.close()
 
     def __str__(self) -> str:
         if len(self.allocations) < 10:
-            allocations = "[" + ",".join(f"({alloc.start}, {alloc.end})" for alloc in self.allocations) + "]"
+            allocations = "[" + ",".join(f"({alloc.start}, {alloc.end})" for alloc in
+                                         sorted(self.allocations, key=lambda alloc: alloc.start)) + "]"
         else:
             allocations = f"[...{len(self.allocations)}...]"
         return f"Arena({str(self.mapping)}, {allocations})"
@@ -177,6 +399,14 @@ class Arena(AllocatorInterface):
     def __repr__(self) -> str:
         return str(self)
 
+# Free extents with at least this many bytes of whole pages are returned to the kernel.
+TRIM_THRESHOLD = 64*1024
+
+def _page_interior(start: int, end: int, page_size: int=4096) -> t.Tuple[int, int]:
+    "Return the offset and length of the whole pages between start and end."
+    offset = align(start, page_size)
+    return offset, max((end - offset) // page_size * page_size, 0)
+
 def align(num: int, alignment: int) -> int:
     """Return the lowest value greater than `num` that is cleanly divisible by `alignment`.
 
@@ -196,57 +426,144 @@ def align(num: int, alignment: int) -> int:
 class UnlimitedAllocator:
     """An allocator which just calls `mmap` to request more memory when it runs out.
 
+    When we run out of space, we first try to grow our most recent arena, at least
+    doubling it, and only call mmap if that fails.
+
+    When memory is freed from one of our arenas, we wake up our main loop to trim the
+    large free extents out of that arena, or, once we've mapped more than
+    `high_water_mark` bytes, to unmap it if it's empty. Allocation only happens in our
+    main loop, so this never races with it; and arenas which haven't had memory freed
+    aren't touched.
+
     """
-    def __init__(self, task: Task) -> None:
+    def __init__(self, task: Task, high_water_mark: int=4*1024*1024) -> None:
         self.task = task
+        self.high_water_mark = high_water_mark
         self.lock = trio.Lock()
         self.arenas: t.List[Arena] = []
+        # the arenas which have had memory freed since we last reclaimed from them
+        self.freed_arenas: t.Set[Arena] = set()
+        self.reclaim_requested = False
         self.queue = RequestQueue[t.List[t.Tuple[int, int]], t.Sequence[t.Tuple[MemoryMapping, Allocation]]]()
         reset(self._run())
 
     async def _run(self) -> None:
-        "Try to allocate all these requests; if we run out of space, make one big mmap call for the rest."
-        # TODO we should coalesce together multiple pending mallocs waiting on the lock
+        """Allocate for all the pending requests together, with at most one mmap call.
+
+        Requests which arrive while we're waiting for the mmap are coalesced into the next
+        batch.
+
+        """
         while True:
-            sizes, cb = await self.queue.get_one()
-            cb.resume(await outcome.acapture(self._bulk_malloc, sizes))
+            requests = await self.queue.get_many()
+            batch: t.List[t.Tuple[t.List[t.Tuple[int, int]], Continuation]] = []
+            for sizes, cb in requests:
+                checked = outcome.capture(self._check_sizes, sizes)
+                if isinstance(checked, outcome.Error):
+                    cb.resume(checked)
+                else:
+                    batch.append((sizes, cb))
+            if not batch:
+                continue
+            result = await outcome.acapture(
+                self._bulk_malloc, [size for sizes, _ in batch for size in sizes])
+            if isinstance(result, outcome.Error):
+                for _, cb in batch:
+                    cb.resume(result)
+                continue
+            allocations = iter(result.value)
+            for sizes, cb in batch:
+                cb.send([next(allocations) for _ in sizes])
+            if self.reclaim_requested:
+                self.reclaim_requested = False
+                try:
+                    await self._reclaim()
+                except Exception:
+                    # this is just an optimization, so we can carry on without it
+                    logger.info("failed to reclaim memory from arenas", exc_info=True)
+
+    def _arena_freed(self, arena: Arena) -> None:
+        self.freed_arenas.add(arena)
+        if not self.reclaim_requested:
+            self.reclaim_requested = True
+            # an empty request wakes up our main loop, even if nothing else is allocated
+            reset(self.queue.request([]))
+
+    async def _reclaim(self) -> None:
+        "Unmap freed arenas which are empty, while we're past the high-water mark, and trim the rest."
+        freed, self.freed_arenas = self.freed_arenas, set()
+        mapped = sum(arena.mapping.near.length for arena in self.arenas)
+        for arena in reversed(self.arenas[:]):
+            # a pinned arena might be in use by a syscall; we're called again once it's unpinned
+            if arena not in freed or not arena._reclaimable():
+                continue
+            if mapped > self.high_water_mark and arena.movable():
+                self.arenas.remove(arena)
+                mapped -= arena.mapping.near.length
+                await self._close_arena(arena)
+            else:
+                await arena.trim()
 
-    async def _bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, Allocation]]:
-        "Try to allocate all these requests; if we run out of space, make one big mmap call for the rest."
-        allocations: t.List[t.Tuple[MemoryMapping, Allocation]] = []
-        size_index = 0
-        for arena in self.arenas:
-            size, alignment = sizes[size_index]
+    async def _make_arena(self, length: int) -> Arena:
+        """Map memory for a new arena; subclasses can override this to map it differently.
+
+        Most tasks never need more than their first arena, so that's just an anonymous
+        mapping; the arenas after it are backed by memfds, so that they can grow.
+
+        """
+        if not self.arenas:
+            return Arena(await self.task.mmap(length, PROT.READ|PROT.WRITE, MAP.SHARED))
+        return await Arena.make(self.task, length)
+
+    async def _close_arena(self, arena: Arena) -> None:
+        await arena.close()
+
+    async def _grow(self, arena: Arena, length: int) -> bool:
+        "Try to grow this arena; subclasses can override this if their arenas can't be grown."
+        return await arena.grow(length)
+
+    def _check_sizes(self, sizes: t.List[t.Tuple[int, int]]) -> None:
+        for size, alignment in sizes:
             if alignment > 4096:
                 raise Exception("can't handle alignments of more than 4096 bytes", alignment)
-            try:
-                allocations.append((arena.mapping, arena.allocate(size, alignment)))
-            except OutOfSpaceError:
-                pass
-            else:
-                size_index += 1
-                if size_index == len(sizes):
-                    # we finished all the allocations, stop allocating
+
+    async def _bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, Allocation]]:
+        "Try to allocate all these requests; if we run out of space, make one big mmap call for the rest."
+        allocations: t.List[t.Optional[t.Tuple[MemoryMapping, Allocation]]] = []
+        rest_sizes: t.List[t.Tuple[int, t.Tuple[int, int]]] = []
+        for i, (size, alignment) in enumerate(sizes):
+            for arena in self.arenas:
+                try:
+                    allocations.append((arena.mapping, arena.allocate(size, alignment)))
+                except OutOfSpaceError:
+                    pass
+                else:
                     break
-        if size_index != len(sizes):
-            # we hit the end of the arena and now need to allocate more for the remaining sizes:
-            rest_sizes = sizes[size_index:]
-            # let's do it in bulk:
+            else:
+                allocations.append(None)
+                rest_sizes.append((i, (size, alignment)))
+        if rest_sizes:
+            # we're out of space in the existing arenas for the remaining sizes;
+            # let's allocate more for them in bulk:
             # TODO this usage of align() overestimates how much memory we need;
             # it's not a big deal though, because most things have alignment=1
-            remaining_size = sum([align(size, alignment) for size, alignment in rest_sizes])
-            mapping = await self.task.mmap(align(remaining_size, 4096), PROT.READ|PROT.WRITE, MAP.SHARED)
-            arena = Arena(mapping)
-            self.arenas.append(arena)
-            for size, alignment in rest_sizes:
-                if alignment > 4096:
-                    raise Exception("can't handle alignments of more than 4096 bytes", alignment)
+            remaining_size = align(sum([align(size, alignment) for _, (size, alignment) in rest_sizes]), 4096)
+            last = self.arenas[-1] if self.arenas else None
+            if last is not None and await self._grow(last, last.mapping.near.length + max(
+                    remaining_size, last.mapping.near.length)):
+                arena = last
+            else:
+                arena = await self._make_arena(remaining_size)
+                arena.on_free = self._arena_freed
+                self.arenas.append(arena)
+            for i, (size, alignment) in rest_sizes:
                 try:
-                    allocations.append((arena.mapping, arena.allocate(size, alignment)))
+                    allocations[i] = (arena.mapping, arena.allocate(size, alignment))
                 except OutOfSpaceError:
-                    raise Exception("some kind of internal error caused a freshly created memory arena",
+                    raise Exception("some kind of internal error caused a freshly grown or created memory arena",
                                     " to return null for an allocation, size", size, "alignment", alignment)
-        return allocations
+        # every allocation has been filled in by now
+        return t.cast(t.List[t.Tuple[MemoryMapping, Allocation]], allocations)
 
     async def bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, Allocation]]:
         return await self.queue.request(sizes)
@@ -255,10 +572,209 @@ class UnlimitedAllocator:
         [ret] = await self.bulk_malloc([(size, alignment)])
         return ret
 
+    def stats(self) -> t.List[ArenaStats]:
+        return [stats for arena in self.arenas for stats in arena.stats()]
+
     async def close(self) -> None:
         "Unmap all the mappings owned by this Allocator."
         for arena in self.arenas:
-            await arena.close()
+            await self._close_arena(arena)
+
+# Allocations whose size and alignment round up to at most SLAB_MAX_SIZE are served from
+# slabs of SLAB_SIZE bytes, divided into slots of a single power-of-two size.
+SLAB_MIN_SIZE = 8
+SLAB_MAX_SIZE = 256
+SLAB_SIZE = 4096
+
+def slab_slot_size(size: int, alignment: int) -> t.Optional[int]:
+    "Return the size of the slab slot which can hold this allocation, or None if it's too big for a slab."
+    needed = max(size, alignment, SLAB_MIN_SIZE)
+    slot_size = 1 << (needed - 1).bit_length()
+    if slot_size > SLAB_MAX_SIZE:
+        return None
+    return slot_size
+
+class SlabSlot:
+    "A slot in a Slab, which is returned to the Slab once every piece of it is freed."
+    __slots__ = ('slab', 'index', 'pieces')
+
+    def __init__(self, slab: Slab, index: int) -> None:
+        self.slab = slab
+        self.index = index
+        self.pieces = 1
+
+@dataclass(eq=False)
+class SlabAllocation(AllocationInterface):
+    """A slot in a Slab, or a piece of one made by split.
+
+    Unlike Allocation, nothing else holds a reference to a SlabAllocation, so __del__
+    does actually free it.
+
+    """
+    slot: SlabSlot
+    start: int
+    end: int
+    valid: bool = True
+
+    def offset(self) -> int:
+        if not self.valid:
+            raise UseAfterFreeError(
+                "This allocation has already been freed; refusing to return its offset for use in pointers",
+                self,
+            )
+        slab = self.slot.slab
+        return slab.allocation.offset() + self.slot.index*slab.slot_size + self.start
+
+    def free(self) -> None:
+        if self.valid:
+            self.valid = False
+            self.slot.pieces -= 1
+            if self.slot.pieces == 0:
+                self.slot.slab.release(self.slot.index)
+
+    def size(self) -> int:
+        return self.end - self.start
+
+    def pinned(self) -> t.ContextManager[None]:
+        return self.slot.slab.allocation.pinned()
+
+    def split(self, size: int) -> t.Tuple[SlabAllocation, SlabAllocation]:
+        if not self.valid:
+            raise Exception("can't split freed allocation")
+        self.valid = False
+        self.slot.pieces += 1
+        splitpoint = self.start+size
+        return SlabAllocation(self.slot, self.start, splitpoint), SlabAllocation(self.slot, splitpoint, self.end)
+
+    def merge(self, other: AllocationInterface) -> SlabAllocation:
+        if not isinstance(other, SlabAllocation):
+            raise Exception("can't merge", type(self), "with", type(other))
+        if not self.valid:
+            raise Exception("self.merge(other) was called when self is already freed")
+        if not other.valid:
+            raise Exception("self.merge(other) was called when other is already freed")
+        if self.slot is not other.slot:
+            raise Exception("merging allocations from two different slab slots - not supported!")
+        if self.end != other.start:
+            raise Exception("to merge allocations, our end", self.end, "must equal their start", other.start)
+        self.valid = False
+        other.valid = False
+        self.slot.pieces -= 1
+        return SlabAllocation(self.slot, self.start, other.end)
+
+    def __str__(self) -> str:
+        slab = self.slot.slab
+        state = "" if self.valid else "FREED, "
+        return f"SlabAlloc({state}{slab.slot_size}, {self.slot.index}, {self.start}, {self.end})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+    def __del__(self) -> None:
+        self.free()
+
+class Slab:
+    "An allocation from an UnlimitedAllocator, divided into slots of a single size."
+    def __init__(self, allocator: SlabAllocator,
+                 mapping: MemoryMapping, allocation: AllocationInterface, slot_size: int) -> None:
+        self.allocator = allocator
+        self.mapping = mapping
+        self.allocation = allocation
+        self.slot_size = slot_size
+        self.capacity = allocation.size() // slot_size
+        self.free_slots = list(range(self.capacity))
+
+    def empty(self) -> bool:
+        return len(self.free_slots) == self.capacity
+
+    def release(self, index: int) -> None:
+        self.free_slots.append(index)
+        if len(self.free_slots) == 1:
+            # we were full, so we aren't in our allocator's list of slabs with free slots
+            self.allocator.partial_slabs[self.slot_size].append(self)
+        if self.empty():
+            self.allocator._release_slab(self)
+
+class SlabAllocator(AllocatorInterface):
+    """Serves small allocations from slabs, with a set of slabs for each power-of-two size class.
+
+    Allocating and freeing a slot is O(1), and since every slot in a slab is the same
+    size, small short-lived allocations don't fragment the arenas. The slabs themselves
+    are allocated from an UnlimitedAllocator. We keep one empty slab for each size class
+    for reuse, and free any other slab once it's empty, so that its arena can be
+    reclaimed.
+
+    """
+    def __init__(self, allocator: UnlimitedAllocator) -> None:
+        self.allocator = allocator
+        # the slabs for each slot size which have at least one free slot
+        self.partial_slabs: t.Dict[int, t.List[Slab]] = {}
+        # the empty slab we're keeping for each slot size, if we still have one
+        self.spare_slabs: t.Dict[int, Slab] = {}
+        slot_size = SLAB_MIN_SIZE
+        while slot_size <= SLAB_MAX_SIZE:
+            self.partial_slabs[slot_size] = []
+            slot_size *= 2
+
+    def _release_slab(self, slab: Slab) -> None:
+        "Called when this slab becomes empty; keep it as the spare, or free it if we already have one."
+        spare = self.spare_slabs.get(slab.slot_size)
+        if spare is None or spare is slab or not spare.empty():
+            self.spare_slabs[slab.slot_size] = slab
+        else:
+            self.partial_slabs[slab.slot_size].remove(slab)
+            slab.allocation.free()
+
+    def _take_slot(self, size: int, slot_size: int) -> t.Optional[t.Tuple[MemoryMapping, SlabAllocation]]:
+        "Take a free slot of this size, or return None if there isn't one."
+        slabs = self.partial_slabs[slot_size]
+        if not slabs:
+            return None
+        slab = slabs[-1]
+        index = slab.free_slots.pop()
+        if not slab.free_slots:
+            slabs.pop()
+        return slab.mapping, SlabAllocation(SlabSlot(slab, index), 0, size)
+
+    async def bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, SlabAllocation]]:
+        """Allocate all these from slabs, getting any new slabs we need with a single bulk_malloc.
+
+        If a concurrent call takes the slots in our new slabs while we're waiting for
+        them, we just go round again.
+
+        """
+        slot_sizes: t.List[int] = []
+        for size, alignment in sizes:
+            slot_size = slab_slot_size(size, alignment)
+            if slot_size is None:
+                raise Exception("allocation too big for a slab", size, alignment)
+            slot_sizes.append(slot_size)
+        results: t.List[t.Optional[t.Tuple[MemoryMapping, SlabAllocation]]] = [None]*len(sizes)
+        pending = list(range(len(sizes)))
+        while pending:
+            missing: t.Dict[int, int] = {}
+            rest: t.List[int] = []
+            for i in pending:
+                results[i] = self._take_slot(sizes[i][0], slot_sizes[i])
+                if results[i] is None:
+                    missing[slot_sizes[i]] = missing.get(slot_sizes[i], 0) + 1
+                    rest.append(i)
+            if not rest:
+                break
+            new_slab_sizes = [slot_size
+                              for slot_size, count in missing.items()
+                              for _ in range(-(-count // (SLAB_SIZE // slot_size)))]
+            # slots are naturally aligned, since the slab is aligned to the slot size
+            new_slabs = await self.allocator.bulk_malloc([(SLAB_SIZE, slot_size) for slot_size in new_slab_sizes])
+            for slot_size, (mapping, allocation) in zip(new_slab_sizes, new_slabs):
+                self.partial_slabs[slot_size].append(Slab(self, mapping, allocation, slot_size))
+            pending = rest
+        # every result has been filled in by now
+        return t.cast(t.List[t.Tuple[MemoryMapping, SlabAllocation]], results)
+
+    async def malloc(self, size: int, alignment: int) -> t.Tuple[MemoryMapping, SlabAllocation]:
+        [ret] = await self.bulk_malloc([(size, alignment)])
+        return ret
 
 class AllocatorClient(AllocatorInterface):
     """A task-specific allocator, to protect us from getting memory back for the wrong address space.
@@ -269,10 +785,14 @@ class AllocatorClient(AllocatorInterface):
     mapping's address space match, and ensures that the ownership for the mapping is
     correct.
 
+    Small allocations are served by a SlabAllocator, which is shared in the same way.
+
     """
-    def __init__(self, task: Task, shared_allocator: UnlimitedAllocator) -> None:
+    def __init__(self, task: Task, shared_allocator: UnlimitedAllocator,
+                 slab_allocator: t.Optional[SlabAllocator]=None) -> None:
         self.task = task
         self.shared_allocator = shared_allocator
+        self.slab_allocator = slab_allocator or SlabAllocator(shared_allocator)
         if self.task.address_space != self.shared_allocator.task.address_space:
             raise Exception("task and allocator are in different address spaces",
                             self.task.address_space, self.shared_allocator.task.address_space)
@@ -282,10 +802,23 @@ class AllocatorClient(AllocatorInterface):
         return AllocatorClient(task, UnlimitedAllocator(task))
 
     def inherit(self, task: Task) -> AllocatorClient:
-        return AllocatorClient(task, self.shared_allocator)
+        return AllocatorClient(task, self.shared_allocator, self.slab_allocator)
+
+    def stats(self) -> t.List[ArenaStats]:
+        "Return statistics for each arena in the shared allocator; slabs count as live allocations."
+        return self.shared_allocator.stats()
 
     async def bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, AllocationInterface]]:
-        seq = await self.shared_allocator.bulk_malloc(sizes)
+        large = [(size, alignment) for size, alignment in sizes if slab_slot_size(size, alignment) is None]
+        small = [(size, alignment) for size, alignment in sizes if slab_slot_size(size, alignment) is not None]
+        large_seq = iter(await self.shared_allocator.bulk_malloc(large) if large else [])
+        small_seq = iter(await self.slab_allocator.bulk_malloc(small) if small else [])
+        seq: t.List[t.Tuple[MemoryMapping, AllocationInterface]] = []
+        for size, alignment in sizes:
+            if slab_slot_size(size, alignment) is None:
+                seq.append(next(large_seq))
+            else:
+                seq.append(next(small_seq))
         return [(mapping.for_task(self.task), alloc) for mapping, alloc in seq]
 
     async def malloc(self, size: int, alignment: int) -> t.Tuple[MemoryMapping, AllocationInterface]:
@@ -0,0 +1,184 @@
+"""Memory transport to a remote address space on the local host, using process_vm_readv/writev.
+
+`rsyscall.memory.socket_transport.SocketMemoryTransport` copies every byte through a
+socketpair, with a syscall on each side of the socketpair for each read or write, and
+the remote thread has to perform its half of each copy.
+
+When the remote thread is on the same host and in our pid namespace, and we have
+ptrace-equivalent permission over it, we can instead copy memory directly between our
+address space and the remote address space with process_vm_readv/writev, from the local
+thread. That's a single syscall, which the remote thread isn't involved in at all.
+
+Concurrent reads and writes are coalesced: we make one syscall with an iovec per pointer
+for all the reads (or writes) which are pending at once.
+
+We can't know in advance whether we have permission; so we just try, and if we get
+EPERM, we fall back to the transport we were constructed with. Likewise if we get ESRCH:
+our pid for the remote process isn't valid, say because it has moved into another pid
+namespace with setns or exec'd a setuid binary and been reparented; the fallback still
+works, since it doesn't depend on the pid.
+
+"""
+from __future__ import annotations
+from dneio import RequestQueue, Continuation, reset
+from rsyscall._raw import ffi # type: ignore
+from rsyscall.handle import Pointer, Task
+from rsyscall.memory.transport import MemoryTransport
+from rsyscall.sys.syscall import SYS
+import errno
+import logging
+import typing as t
+
+__all__ = [
+    "ProcessVmTransport",
+]
+
+logger = logging.getLogger(__name__)
+
+# the kernel's limit on the number of iovecs passed to process_vm_readv/writev
+UIO_MAXIOV = 1024
+
+def _local_task() -> Task:
+    # imported here, since the local thread is itself created with this module imported
+    from rsyscall.tasks.local import local_thread
+    return local_thread.task
+
+# A request to read from a pointer (when the data is None) or write to it.
+Request = t.Tuple[Pointer, t.Optional[bytes]]
+
+class ProcessVmTransport(MemoryTransport):
+    """Read and write bytes in a remote address space with process_vm_readv/writev
+
+    We make the syscalls in the local thread, and copy memory between the remote address
+    space and buffers allocated by cffi. We use `fallback` if we don't have permission, or
+    if the remote process isn't reachable through its pid.
+
+    """
+    @staticmethod
+    def make(remote: Task, fallback: MemoryTransport) -> MemoryTransport:
+        "Return a ProcessVmTransport for `remote` if it's in our pid namespace, otherwise `fallback`."
+        return ProcessVmTransport._make(_local_task(), remote, fallback)
+
+    @staticmethod
+    def _make(local: Task, remote: Task, fallback: MemoryTransport) -> MemoryTransport:
+        if remote.pidns is not local.pidns:
+            return fallback
+        return ProcessVmTransport(local, remote, fallback)
+
+    def __init__(self, local: Task, remote: Task, fallback: MemoryTransport) -> None:
+        self.local = local
+        self.remote = remote
+        self.fallback = fallback
+        self.permitted = True
+        self.queue = RequestQueue[Request, t.Optional[bytes]]()
+        reset(self._run())
+
+    def inherit(self, task: Task) -> MemoryTransport:
+        return ProcessVmTransport._make(self.local, task, self.fallback.inherit(task))
+
+    def _check(self, ptr: Pointer) -> None:
+        if ptr.mapping.task.address_space != self.remote.address_space:
+            raise Exception("trying to access pointer", ptr, "not in remote address space")
+
+    async def write(self, dest: Pointer, data: bytes) -> None:
+        if dest.size() != len(data):
+            raise Exception("mismatched pointer size", dest.size(), "and data size", len(data))
+        self._check(dest)
+        if self.permitted:
+            try:
+                await self.queue.request((dest, data))
+                return
+            except (PermissionError, ProcessLookupError):
+                pass
+        await self.fallback.write(dest, data)
+
+    async def read(self, src: Pointer) -> bytes:
+        self._check(src)
+        if self.permitted:
+            try:
+                data = await self.queue.request((src, None))
+                assert data is not None
+                return data
+            except (PermissionError, ProcessLookupError):
+                pass
+        return await self.fallback.read(src)
+
+    async def _run(self) -> None:
+        while True:
+            requests = await self.queue.get_many()
+            # perform each run of consecutive reads or writes with a single syscall
+            while requests:
+                is_write = requests[0][0][1] is not None
+                count = 1
+                while (count < min(len(requests), UIO_MAXIOV)
+                       and (requests[count][0][1] is not None) == is_write):
+                    count += 1
+                batch, requests = requests[:count], requests[count:]
+                await self._transfer(batch, is_write)
+
+    async def _transfer(self, batch: t.List[t.Tuple[Request, Continuation[t.Optional[bytes]]]],
+                        is_write: bool) -> None:
+        "Copy memory for this batch of requests, retrying after any partial transfer."
+        while batch:
+            try:
+                transferred = await self._process_vm(batch, is_write)
+            except (PermissionError, ProcessLookupError) as exn:
+                # no point trying again; let the requests retry with our fallback
+                logger.debug("process_vm access to %s failed with %s, falling back", self.remote, exn)
+                self.permitted = False
+                for _, cb in batch:
+                    cb.throw(exn)
+                return
+            except Exception as exn:
+                if len(batch) == 1:
+                    batch[0][1].throw(exn)
+                    return
+                # retry the requests individually to find out which one failed
+                for request in batch:
+                    await self._transfer([request], is_write)
+                return
+            done = 0
+            for (ptr, data), cb in batch:
+                if transferred < ptr.size():
+                    break
+                transferred -= ptr.size()
+                done += 1
+                cb.send(None if is_write else data)
+            if done == 0:
+                # process_vm_readv/writev stop at the first iovec they can't completely copy
+                batch[0][1].throw(OSError(errno.EFAULT, "partial transfer", batch[0][0][0]))
+                done = 1
+            batch = batch[done:]
+
+    async def _process_vm(self, batch: t.List[t.Tuple[Request, Continuation[t.Optional[bytes]]]],
+                          is_write: bool) -> int:
+        """Make one process_vm_readv/writev call for this batch
+
+        For reads, we replace the None in each request with the buffer to read into, and
+        turn the buffers into bytes after the call.
+
+        """
+        local_iov = ffi.new('struct iovec[]', len(batch))
+        remote_iov = ffi.new('struct iovec[]', len(batch))
+        buffers = []
+        for i, ((ptr, data), _) in enumerate(batch):
+            size = ptr.size()
+            if is_write:
+                buf = ffi.from_buffer(data)
+            else:
+                buf = ffi.new('char[]', size)
+            buffers.append(buf)
+            local_iov[i].iov_base = buf
+            local_iov[i].iov_len = size
+            # the pointer can't be freed while it's waiting on us, so its address is valid
+            remote_iov[i].iov_base = ffi.cast('void*', int(ptr.near))
+            remote_iov[i].iov_len = size
+        number = SYS.process_vm_writev if is_write else SYS.process_vm_readv
+        ret = await self.local.sysif.syscall(
+            number, self.remote.near_process.id,
+            int(ffi.cast('uintptr_t', local_iov)), len(batch),
+            int(ffi.cast('uintptr_t', remote_iov)), len(batch), 0)
+        if not is_write:
+            for i, (((ptr, _), cb), buf) in enumerate(zip(batch, buffers)):
+                batch[i] = ((ptr, bytes(ffi.buffer(buf))), cb)
+        return ret
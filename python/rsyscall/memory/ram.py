@@ -3,10 +3,11 @@ from __future__ import annotations
 from dneio import run_all
 from rsyscall.handle import Task, Pointer, WrittenPointer
 from rsyscall.memory.transport import MemoryTransport, MemoryGateway
-from rsyscall.memory.allocation_interface import AllocationInterface
-from rsyscall.memory.allocator import AllocatorInterface
+from rsyscall.memory.allocation_interface import AllocationInterface, UseAfterFreeError
+from rsyscall.memory.allocator import AllocatorInterface, ArenaStats
 from rsyscall.struct import FixedSize, T_fixed_size, HasSerializer, T_has_serializer, FixedSerializer, T_fixed_serializer, Serializer, PathLikeSerializer, T_pathlike, StrSerializer
 from rsyscall.sys.mman import MemoryMapping
+import collections
 import functools
 import os
 import rsyscall.near.types as near
@@ -16,6 +17,7 @@ import typing as t
 
 __all__ = [
     "RAM",
+    "ConstPointerCache",
     "perform_batch",
 ]
 
@@ -26,23 +28,117 @@ class BytesSerializer(Serializer[bytes]):
     def from_bytes(self, data: bytes) -> bytes:
         return data
 
+class ConstEntry:
+    "A pointer in a ConstPointerCache, which is freed once it's evicted and no longer referenced."
+    def __init__(self, ptr: WrittenPointer) -> None:
+        self.ptr = ptr
+        self.refs = 0
+        self.evicted = False
+
+    def release(self) -> None:
+        self.refs -= 1
+        if self.refs == 0 and self.evicted:
+            self.ptr.free()
+
+    def evict(self) -> None:
+        self.evicted = True
+        if self.refs == 0:
+            self.ptr.free()
+
+class ConstAllocation(AllocationInterface):
+    """A reference to the allocation of a pointer in a ConstPointerCache.
+
+    The allocation is shared, so it can't be split or merged, and freeing this just
+    drops our reference.
+
+    """
+    def __init__(self, entry: ConstEntry) -> None:
+        self.entry = entry
+        self.valid = True
+        entry.refs += 1
+
+    def offset(self) -> int:
+        if not self.valid:
+            raise UseAfterFreeError("This const allocation has already been freed", self)
+        return self.entry.ptr.allocation.offset()
+
+    def size(self) -> int:
+        return self.entry.ptr.allocation.size()
+
+    def pinned(self) -> t.ContextManager[None]:
+        return self.entry.ptr.allocation.pinned()
+
+    def split(self, size: int) -> t.Tuple[AllocationInterface, AllocationInterface]:
+        raise Exception("const pointers are shared, so they can't be split", self)
+
+    def merge(self, other: AllocationInterface) -> AllocationInterface:
+        raise Exception("const pointers are shared, so they can't be merged", self)
+
+    def free(self) -> None:
+        if self.valid:
+            self.valid = False
+            self.entry.release()
+
+    def __del__(self) -> None:
+        self.free()
+
+class ConstPointerCache:
+    """A bounded cache of pointers to immutable values, for `RAM.const_ptr`
+
+    Entries are keyed by the type and serialized bytes of the value, and the least
+    recently used entry is evicted when the cache is full. A cache should only be shared
+    between RAMs for the same address space.
+
+    """
+    def __init__(self, max_entries: int=256) -> None:
+        self.max_entries = max_entries
+        self.entries: t.OrderedDict[t.Tuple[type, bytes], ConstEntry] = collections.OrderedDict()
+
+    def get(self, key: t.Tuple[type, bytes], address_space: far.AddressSpace) -> t.Optional[ConstEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.ptr.mapping.task.address_space is not address_space:
+            # the task which owns this pointer's mapping has changed address space
+            del self.entries[key]
+            entry.evict()
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: t.Tuple[type, bytes], entry: ConstEntry) -> None:
+        replaced = self.entries.get(key)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if replaced is not None and replaced is not entry:
+            replaced.evict()
+        while len(self.entries) > self.max_entries:
+            _, evicted = self.entries.popitem(last=False)
+            evicted.evict()
+
 T = t.TypeVar('T')
 class RAM:
     """Central user-friendly class for accessing memory.
 
-    Future work: An option to allocate "const" pointers, which we
-    could cache and reuse each time they're requested. This would be
-    useful for small pieces of memory which are very frequently used.
+    We can also allocate "const" pointers with `RAM.const_ptr`, which we cache and reuse
+    each time they're requested; that's useful for small pieces of memory which are very
+    frequently used. RAMs for the same address space should share a `ConstPointerCache`.
 
     """
     def __init__(self, 
                  task: Task,
                  transport: MemoryTransport,
                  allocator: AllocatorInterface,
+                 const_cache: t.Optional[ConstPointerCache]=None,
     ) -> None:
         self.task = task
         self.transport = transport
         self.allocator = allocator
+        self.const_cache = const_cache or ConstPointerCache()
+
+    def stats(self) -> t.List[ArenaStats]:
+        "Return statistics about each arena of memory in our allocator."
+        return self.allocator.stats()
 
     @t.overload
     async def malloc(self, cls: t.Type[T_fixed_size]) -> Pointer[T_fixed_size]: ...
@@ -131,8 +227,55 @@ class RAM:
         else:
             raise Exception("don't know how to serialize data passed to ptr", data)
 
+    @t.overload
+    async def const_ptr(self, data: T_has_serializer) -> WrittenPointer[T_has_serializer]: ...
+    @t.overload
+    async def const_ptr(self, data: T_pathlike) -> WrittenPointer[T_pathlike]: ...
+    @t.overload
+    async def const_ptr(self, data: str) -> WrittenPointer[str]: ...
+    @t.overload
+    async def const_ptr(self, data: t.Union[bytes]) -> WrittenPointer[bytes]: ...
+    async def const_ptr(self, data: t.Union[T_has_serializer, T_pathlike, str, bytes],
+    ) -> t.Union[
+        WrittenPointer[T_has_serializer],
+        WrittenPointer[T_pathlike],
+        WrittenPointer[str], WrittenPointer[bytes],
+    ]:
+        """Like `RAM.ptr`, but return a pointer to a shared, cached copy of the data.
+
+        The pointer must only be read, never written to, since it's shared with other
+        users of the same data; so it also can't be split or merged. Since the data is
+        identified by its serialized bytes, it must not refer to other pointers.
+
+        """
+        if isinstance(data, HasSerializer):
+            serializer: Serializer = data.get_self_serializer(self.task)
+        elif isinstance(data, os.PathLike):
+            serializer = PathLikeSerializer(type(data))
+        elif isinstance(data, str):
+            serializer = StrSerializer()
+        elif isinstance(data, bytes):
+            serializer = BytesSerializer()
+        else:
+            raise Exception("don't know how to serialize data passed to const_ptr", data)
+        key = (type(data), serializer.to_bytes(data))
+        entry = self.const_cache.get(key, self.task.address_space)
+        if entry is None:
+            new_ptr = await self.ptr(data)
+            # a concurrent call may have cached this value while we were allocating
+            entry = self.const_cache.get(key, self.task.address_space)
+            if entry is None:
+                entry = ConstEntry(new_ptr)
+                self.const_cache.put(key, entry)
+            else:
+                new_ptr.free()
+        ptr = entry.ptr
+        return WrittenPointer(ptr.mapping.for_task(self.task), self.transport,
+                              data, ptr.serializer, ConstAllocation(entry), ptr.typ)
+
     async def perform_batch(self, op: t.Callable[[RAM], t.Awaitable[T]],
                                   allocator: AllocatorInterface=None,
+                                  shape_key: t.Optional[t.Hashable]=None,
     ) -> T:
         """Batches together memory operations performed by a callable.
         
@@ -141,7 +284,7 @@ class RAM:
         """
         if allocator is None:
             allocator = self.allocator
-        return await perform_batch(self.task, self.transport, allocator, op)
+        return await perform_batch(self.task, self.transport, allocator, op, shape_key)
 
     async def malloc_serializer(
             self, serializer: Serializer[T], size: int, typ: t.Type[T],
@@ -206,18 +349,35 @@ class NoopTransport(MemoryTransport):
     def inherit(self, task: Task) -> NoopTransport:
         raise Exception("shouldn't try to inherit")
 
+class BatchShapeError(Exception):
+    "A batch operation made different allocations from the ones we prepared for it."
+    pass
+
 class PrefilledAllocator(AllocatorInterface):
     "An allocator which has been prefilled with allocations for an exact sequence of calls to malloc."
-    def __init__(self, allocations: t.Sequence[t.Tuple[MemoryMapping, AllocationInterface]]) -> None:
+    def __init__(self, plan: t.Sequence[t.Tuple[int, int]],
+                 allocations: t.Sequence[t.Tuple[MemoryMapping, AllocationInterface]]) -> None:
+        self.plan = list(plan)
         self.allocations = list(allocations)
 
     async def malloc(self, size: int, alignment: int) -> t.Tuple[MemoryMapping, AllocationInterface]:
+        if not self.allocations:
+            raise BatchShapeError("batch operation made more allocations than were prepared for it")
+        planned = self.plan.pop(0)
         mapping, allocation = self.allocations.pop(0)
-        if allocation.size() != size:
-            raise Exception("batch operation seems to be non-deterministic, ",
-                            "allocating different sizes/in different order on second run")
+        if planned != (size, alignment):
+            allocation.free()
+            raise BatchShapeError("batch operation seems to be non-deterministic, ",
+                                  "allocating different sizes/in different order on second run",
+                                  planned, (size, alignment))
         return mapping, allocation
 
+    def free_remaining(self) -> None:
+        "Free any allocations which haven't been used."
+        for _, allocation in self.allocations:
+            allocation.free()
+        self.allocations = []
+
 class BatchWriteSemantics(RAM):
     "A variant of RAM which stores writes to pointers so they can be performed later."
     def __init__(self, 
@@ -228,6 +388,8 @@ class BatchWriteSemantics(RAM):
         self.task = task
         self.transport = transport
         self.allocator = allocator
+        # a fresh cache, so const_ptr allocates the same way as on the first run
+        self.const_cache = ConstPointerCache()
         self.writes: t.List[t.Tuple[Pointer, bytes]] = []
 
     async def _write_to_pointer(self, ptr: Pointer[T], data: T, data_bytes: bytes) -> WrittenPointer[T]:
@@ -235,11 +397,16 @@ class BatchWriteSemantics(RAM):
         self.writes.append((wptr, data_bytes))
         return wptr
 
+# The allocations made by batch operations with each shape key, most recently used last.
+_batch_plans: t.OrderedDict[t.Hashable, t.List[t.Tuple[int, int]]] = collections.OrderedDict()
+MAX_BATCH_PLANS = 256
+
 async def perform_batch(
         task: Task,
         transport: MemoryTransport,
         allocator: AllocatorInterface,
         batch: t.Callable[[RAM], t.Awaitable[T]],
+        shape_key: t.Optional[t.Hashable]=None,
 ) -> T:
     """Batches together memory operations performed by a callable.
 
@@ -279,12 +446,48 @@ async def perform_batch(
     in CPU time, but it improves robustness by making it not possible
     to mess up in calculating the size you want to allocate.
 
+    If the caller passes a `shape_key`, the allocations made by the callable
+    must be entirely determined by that key. Then we remember the allocations
+    made for that key, and on later calls with the same key, we skip the first
+    call to the callable. If the callable makes different allocations after all,
+    we notice, and fall back to calling it twice.
+
     """
+    if shape_key is not None:
+        plan = _batch_plans.get(shape_key)
+        if plan is not None:
+            _batch_plans.move_to_end(shape_key)
+            try:
+                return await _perform_with_plan(task, transport, allocator, batch, plan, exact=True)
+            except BatchShapeError:
+                del _batch_plans[shape_key]
     later_allocator = LaterAllocator()
     await batch(RAM(task, NoopTransport(), later_allocator))
-    allocations = await allocator.bulk_malloc(later_allocator.allocations)
-    sem = BatchWriteSemantics(task, transport, PrefilledAllocator(allocations))
-    ret = await batch(sem)
+    if shape_key is not None:
+        _batch_plans[shape_key] = later_allocator.allocations
+        while len(_batch_plans) > MAX_BATCH_PLANS:
+            _batch_plans.popitem(last=False)
+    return await _perform_with_plan(task, transport, allocator, batch, later_allocator.allocations)
+
+async def _perform_with_plan(
+        task: Task,
+        transport: MemoryTransport,
+        allocator: AllocatorInterface,
+        batch: t.Callable[[RAM], t.Awaitable[T]],
+        plan: t.List[t.Tuple[int, int]],
+        exact: bool=False,
+) -> T:
+    "Allocate according to this plan, then call the callable and perform its writes."
+    allocations = await allocator.bulk_malloc(plan)
+    prefilled = PrefilledAllocator(plan, allocations)
+    sem = BatchWriteSemantics(task, transport, prefilled)
+    try:
+        ret = await batch(sem)
+        if exact and prefilled.allocations:
+            raise BatchShapeError("batch operation made fewer allocations than were prepared for it")
+    except BatchShapeError:
+        prefilled.free_remaining()
+        raise
 
     await run_all([functools.partial(transport.write, dest, data)
                    for dest, data in sem.writes])
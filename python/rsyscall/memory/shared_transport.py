@@ -0,0 +1,167 @@
+"""Memory transport to a remote address space through memory mapped into both address spaces.
+
+Even `rsyscall.memory.process_vm_transport.ProcessVmTransport` costs a syscall for each
+read and write. If a remote thread is on the same host as us, we can do better: we
+create a memfd, and map it into both our address space and the remote address space.
+Then we can access memory in that mapping in the remote address space just by accessing
+the corresponding memory in our own address space, with no syscalls at all.
+
+To make use of that, `SharedMemoryAllocator` allocates the remote thread's memory from
+such mappings. `SharedMemoryTransport` copies to and from pointers in those mappings
+with a local memmove, and falls back to some other transport for any other pointers.
+
+The remote thread gets access to the memfd by opening it through /proc, so this only
+works if the remote thread is in our pid namespace and is permitted to open our fds.
+If that fails, we just fall back to normal mappings.
+
+"""
+from __future__ import annotations
+from pathlib import Path
+from rsyscall._raw import ffi # type: ignore
+from rsyscall.fcntl import O
+from rsyscall.handle import Pointer, Task
+import rsyscall.far as far
+import rsyscall.near.types as near
+from rsyscall.memory.allocator import UnlimitedAllocator, AllocatorClient, Arena
+from rsyscall.memory.transport import MemoryTransport
+from rsyscall.sys.mman import PROT, MAP, MemoryMapping
+import logging
+import typing as t
+if t.TYPE_CHECKING:
+    from rsyscall.memory.ram import RAM
+
+__all__ = [
+    "SharedMemoryTransport",
+    "SharedMemoryAllocator",
+    "make_shared_memory",
+]
+
+logger = logging.getLogger(__name__)
+
+def _local_ram() -> RAM:
+    # imported here, since the local thread is itself created with this module imported
+    from rsyscall.tasks.local import local_thread
+    return local_thread.ram
+
+# The remote address space and mapping of a shared mapping.
+MappingKey = t.Tuple[far.AddressSpace, near.MemoryMapping]
+
+class SharedMemoryTransport(MemoryTransport):
+    """Read and write memory which is mapped into both the local and remote address space
+
+    `local_addresses` maps each shared mapping in the remote address space to the address
+    of the same memory in the local address space. Pointers in other mappings are read
+    and written with `fallback`.
+
+    """
+    def __init__(self, fallback: MemoryTransport,
+                 local_addresses: t.Optional[t.Dict[MappingKey, int]]=None) -> None:
+        self.fallback = fallback
+        self.local_addresses: t.Dict[MappingKey, int] = {} if local_addresses is None else local_addresses
+
+    def inherit(self, task: Task) -> SharedMemoryTransport:
+        return SharedMemoryTransport(self.fallback.inherit(task), self.local_addresses)
+
+    def _local_address(self, ptr: Pointer) -> t.Optional[int]:
+        mapping = ptr.mapping
+        base = self.local_addresses.get((mapping.task.address_space, mapping.near))
+        if base is None:
+            return None
+        return base + (int(ptr.near) - mapping.near.address)
+
+    async def write(self, dest: Pointer, data: bytes) -> None:
+        if dest.size() != len(data):
+            raise Exception("mismatched pointer size", dest.size(), "and data size", len(data))
+        address = self._local_address(dest)
+        if address is None:
+            await self.fallback.write(dest, data)
+        else:
+            ffi.memmove(ffi.cast('void*', address), data, len(data))
+
+    async def read(self, src: Pointer) -> bytes:
+        address = self._local_address(src)
+        if address is None:
+            return await self.fallback.read(src)
+        return bytes(ffi.buffer(ffi.cast('void*', address), src.size()))
+
+    async def read_into(self, src: Pointer, buf: t.Union[bytearray, memoryview]) -> int:
+        address = self._local_address(src)
+        if address is None:
+            return await self.fallback.read_into(src, buf)
+        ffi.memmove(ffi.from_buffer(buf, require_writable=True), ffi.cast('void*', address), src.size())
+        return src.size()
+
+    async def read_memoryview(self, src: Pointer) -> memoryview:
+        address = self._local_address(src)
+        if address is None:
+            return await self.fallback.read_memoryview(src)
+        return memoryview(ffi.buffer(ffi.cast('void*', address), src.size())).toreadonly()
+
+class SharedMemoryAllocator(UnlimitedAllocator):
+    """Allocates memory for a remote thread from memfds which are also mapped locally
+
+    `ram` is used to set up each new mapping in the remote thread, so it must not allocate
+    from this allocator.
+
+    """
+    def __init__(self, ram: RAM, transport: SharedMemoryTransport) -> None:
+        self.ram = ram
+        self.transport = transport
+        self.local_mappings: t.Dict[MappingKey, MemoryMapping] = {}
+        # our /proc path for the memfd only means the same thing to the remote thread
+        # if it's in our pid namespace
+        self.shared = ram.task.pidns is _local_ram().task.pidns
+        super().__init__(ram.task)
+
+    async def _mmap_shared(self, length: int) -> MemoryMapping:
+        local = _local_ram()
+        memfd = await local.task.memfd_create(await local.const_ptr(Path("rsyscall_shared_memory")))
+        try:
+            await memfd.ftruncate(length)
+            local_mapping = await memfd.mmap(length, PROT.READ|PROT.WRITE, MAP.SHARED)
+            try:
+                path = f"/proc/{local.task.near_process.id}/fd/{int(memfd.near)}"
+                remote_fd = await self.task.open(await self.ram.ptr(path), O.RDWR)
+                try:
+                    mapping = await remote_fd.mmap(length, PROT.READ|PROT.WRITE, MAP.SHARED)
+                finally:
+                    await remote_fd.close()
+            except BaseException:
+                await local_mapping.munmap()
+                raise
+        finally:
+            await memfd.close()
+        key = (self.task.address_space, mapping.near)
+        self.local_mappings[key] = local_mapping
+        self.transport.local_addresses[key] = local_mapping.near.address
+        return mapping
+
+    async def _make_arena(self, length: int) -> Arena:
+        if self.shared:
+            try:
+                # we don't pass the memfd to the Arena, so it won't grow; the local
+                # mapping of the memfd wouldn't grow along with the remote one
+                return Arena(await self._mmap_shared(length))
+            except OSError:
+                logger.info("failed to share memory with %s, falling back to unshared mappings",
+                            self.task, exc_info=True)
+                self.shared = False
+        return await super()._make_arena(length)
+
+    async def _close_arena(self, arena: Arena) -> None:
+        await arena.close()
+        # the task may have changed address space since we made the key, so look it up by mapping
+        for key in [key for key in self.local_mappings if key[1] == arena.mapping.near]:
+            local_mapping = self.local_mappings.pop(key)
+            del self.transport.local_addresses[key]
+            await local_mapping.munmap()
+
+def make_shared_memory(ram: RAM) -> t.Tuple[SharedMemoryTransport, AllocatorClient]:
+    """Make a transport and allocator for `ram`'s task which share memory with the local thread
+
+    `ram` continues to be used to set up shared mappings; the returned transport falls back
+    to `ram.transport`.
+
+    """
+    transport = SharedMemoryTransport(ram.transport)
+    return transport, AllocatorClient(ram.task, SharedMemoryAllocator(ram, transport))
@@ -8,7 +8,8 @@ to read and write to other address spaces.
 We could have taken a dependency on some means of RDMA, or used
 process_vm_readv/writev, or used other techniques, but these only work
 in certain circumstances and places additional dependencies on
-us. Nevertheless, they might be useful optimizations in the future.
+us. Nevertheless, they can be useful optimizations; see
+`rsyscall.memory.process_vm_transport.ProcessVmTransport`.
 
 Instead, we make sure that whenever we want to read and write to any
 address space, we have a file descriptor owned by a task in that
@@ -31,10 +32,15 @@ call `write` on B's file descriptor, and `read` on A's file descriptor.
 """
 from __future__ import annotations
 from dataclasses import dataclass
+from dneio import RequestQueue, Event, reset, run_all
 from rsyscall import AsyncFileDescriptor, Pointer, FileDescriptor, Task
 from rsyscall.memory.allocation_interface import AllocationInterface
 from rsyscall.memory.transport import MemoryTransport
+from rsyscall.near.sysif import Syscall, raise_if_error
 from rsyscall.sys.socket import MSG
+from rsyscall.sys.syscall import SYS
+import contextlib
+import functools
 import logging
 import trio
 import typing as t
@@ -116,48 +122,177 @@ class SocketMemoryTransport(MemoryTransport):
     plus the connected socketpair, into a transport for the "remote"
     address space.
 
-    We rely heavily on the fact that syscall results are returned
-    "synchronously" and in order. After a socket read or write completes on one
-    end of the socketpair, we rely on the corresponding write or read on the
-    other end of the socketpair to be submitted immediately, so that the data is
-    processed in order.
+    We queue up concurrent writes, and concurrent reads, and perform each
+    queue as one transfer, with a batch of syscalls on the remote side, one
+    for each pointer. Writes and reads go in opposite directions through the
+    socketpair, so they don't interfere with each other.
+
+    Transfers are pipelined in chunks of `chunk_size` bytes: while one side
+    of the socketpair is copying a chunk, the other side can be copying the
+    next one, as long as it doesn't get more than `window` bytes ahead.
+    So we never stage more than a chunk at a time in local memory, and
+    there's no limit on the size of a transfer.
 
     """
     local: AsyncFileDescriptor
     remote: FileDescriptor
+    chunk_size: int = 64*1024
+    window: int = 1024*1024
 
-    def inherit(self, task: Task) -> SocketMemoryTransport:
-        return SocketMemoryTransport(self.local, self.remote.for_task(task))
+    def __post_init__(self) -> None:
+        self.write_queue = RequestQueue[t.Tuple[Pointer, bytes], None]()
+        self.read_queue = RequestQueue[Pointer, bytes]()
+        reset(self._run_writes())
+        reset(self._run_reads())
 
-    async def do_write(self, dest: Pointer, src: Pointer[bytes], i=0) -> None:
-        if dest.size() == 0:
-            return
-        written, rest = await self.local.write(src)
-        dest, dest_rest = dest.split(written.size())
-        if dest_rest.size() != 0:
-            raise NotImplementedError("partial write, oops, not supported yet")
-        await self.remote.recv(dest, MSG.WAITALL)
+    def inherit(self, task: Task) -> SocketMemoryTransport:
+        return SocketMemoryTransport(self.local, self.remote.for_task(task), self.chunk_size, self.window)
 
     async def write(self, dest: Pointer, data: bytes) -> None:
         if dest.size() != len(data):
             raise Exception("mismatched pointer size", dest.size(), "and data size", len(data))
-        src = await self.local.ram.ptr(data)
-        dest_span = to_span(dest)
-        await self.do_write(dest_span, src)
-
-    async def do_read(self, dest: Pointer[bytes], src: Pointer) -> bytes:
         if dest.size() == 0:
-            return b''
-        written, rest = await self.remote.write(src)
-        dest, dest_rest = dest.split(written.size())
-        if dest_rest.size() != 0:
-            raise NotImplementedError("partial write, oops, not supported yet")
-        result, anything_left = await self.local.read(dest)
-        if anything_left.size() != 0:
-            raise NotImplementedError("partial read, oops, not supported yet")
-        return await result.read()
+            return
+        await self.write_queue.request((to_span(dest), data))
 
     async def read(self, src: Pointer) -> bytes:
-        dest = await self.local.ram.malloc(bytes, src.size())
-        src_span = to_span(src)
-        return await self.do_read(dest, src_span)
+        if src.size() == 0:
+            return b''
+        return await self.read_queue.request(to_span(src))
+
+    async def _run_writes(self) -> None:
+        while True:
+            requests = await self.write_queue.get_many()
+            try:
+                await self._write_many([dest for (dest, _), _ in requests],
+                                       b"".join([data for (_, data), _ in requests]))
+            except Exception as exn:
+                for _, cb in requests:
+                    cb.throw(exn)
+            else:
+                for _, cb in requests:
+                    cb.send(None)
+
+    async def _run_reads(self) -> None:
+        while True:
+            requests = await self.read_queue.get_many()
+            # the pointers may be split during the transfer, so get their sizes now
+            sizes = [src.size() for src, _ in requests]
+            try:
+                data = await self._read_many([src for src, _ in requests])
+            except Exception as exn:
+                for _, cb in requests:
+                    cb.throw(exn)
+            else:
+                offset = 0
+                for size, (_, cb) in zip(sizes, requests):
+                    cb.send(data[offset:offset+size])
+                    offset += size
+
+    async def _remote_batch(self, number: SYS, ptrs: t.List[Pointer], flags: t.Sequence[int]) -> int:
+        """Call recvfrom or write on the remote fd for each of these pointers, as one batch of syscalls
+
+        Returns the number of bytes transferred, which is less than the total size if the
+        last syscall was partial. A partial syscall before the last one would mean the
+        data was transferred out of order, which we can't recover from.
+
+        """
+        task = self.remote.task
+        with contextlib.ExitStack() as stack:
+            fd = stack.enter_context(self.remote.borrow(task))
+            results = await task.sysif.syscall_batch([
+                Syscall(number, fd, stack.enter_context(ptr.borrow(task)), ptr.size(), *flags)
+                for ptr in ptrs])
+        transferred = 0
+        for i, (ptr, result) in enumerate(zip(ptrs, results)):
+            raise_if_error(result)
+            transferred += result
+            if result != ptr.size() and any(results[i+1:]):
+                raise Exception("partial transfer in the middle of a batch on the remote side",
+                                number, ptr, result)
+        return transferred
+
+    async def _write_many(self, dests: t.List[Pointer], data: bytes) -> None:
+        sent = _Progress()
+        received = _Progress()
+        async def send() -> None:
+            for offset in range(0, len(data), self.chunk_size):
+                await received.wait_for(offset + self.chunk_size - self.window)
+                rest: Pointer[bytes] = await self.local.ram.ptr(data[offset:offset+self.chunk_size])
+                while rest.size():
+                    written, rest = await self.local.write(rest)
+                    sent.advance(written.size())
+        async def recv() -> None:
+            pending = dests
+            while pending:
+                # only receive what's already been sent, so the remote side never blocks
+                await sent.wait_for(received.count + 1)
+                batch, pending = _take(pending, sent.count - received.count)
+                transferred = await self._remote_batch(SYS.recvfrom, batch, [MSG.WAITALL, 0, 0])
+                pending = _take(batch, transferred)[1] + pending
+                received.advance(transferred)
+        await run_all([functools.partial(sent.run, send), functools.partial(received.run, recv)])
+
+    async def _read_many(self, srcs: t.List[Pointer]) -> bytes:
+        total = sum(src.size() for src in srcs)
+        sent = _Progress()
+        received = _Progress()
+        chunks: t.List[bytes] = []
+        async def send() -> None:
+            pending = srcs
+            while pending:
+                await received.wait_for(sent.count + self.chunk_size - self.window)
+                batch, pending = _take(pending, self.chunk_size)
+                transferred = await self._remote_batch(SYS.write, batch, [0, 0, 0])
+                pending = _take(batch, transferred)[1] + pending
+                sent.advance(transferred)
+        async def recv() -> None:
+            while received.count < total:
+                dest = await self.local.ram.malloc(bytes, min(self.chunk_size, total - received.count))
+                valid, _ = await self.local.read(dest)
+                if valid.size() == 0:
+                    raise EOFError("got EOF while reading memory from the remote side")
+                chunks.append(await valid.read())
+                received.advance(valid.size())
+        await run_all([functools.partial(sent.run, send), functools.partial(received.run, recv)])
+        return b"".join(chunks)
+
+def _take(ptrs: t.List[Pointer], size: int) -> t.Tuple[t.List[Pointer], t.List[Pointer]]:
+    "Split off the first `size` bytes of this list of pointers, splitting a pointer if necessary"
+    taken: t.List[Pointer] = []
+    rest = list(ptrs)
+    while rest and size > 0:
+        if rest[0].size() <= size:
+            ptr = rest.pop(0)
+        else:
+            ptr, rest[0] = rest[0].split(size)
+        taken.append(ptr)
+        size -= ptr.size()
+    return taken, rest
+
+class _Progress:
+    "The number of bytes copied by one side of a pipelined transfer, which the other side can wait on"
+    def __init__(self) -> None:
+        self.count = 0
+        self.event = Event()
+        self.exn: t.Optional[BaseException] = None
+
+    def advance(self, count: int) -> None:
+        self.count += count
+        event, self.event = self.event, Event()
+        event.set()
+
+    async def wait_for(self, count: int) -> None:
+        if self.exn:
+            raise self.exn
+        while self.count < count:
+            await self.event.wait()
+
+    async def run(self, func: t.Callable[[], t.Awaitable[None]]) -> None:
+        "Run this side of the transfer; if it fails, wake up the other side with the error"
+        try:
+            await func()
+        except BaseException as exn:
+            self.exn = exn
+            self.event.close(exn)
+            raise
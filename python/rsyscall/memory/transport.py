@@ -17,6 +17,27 @@ class MemoryGateway:
         "Write this bytestring to the memory pointed to by this Pointer."
         pass
 
+    async def read_into(self, src: Pointer, buf: t.Union[bytearray, memoryview]) -> int:
+        """Read the memory pointed to by this Pointer into the start of this buffer.
+
+        Returns the number of bytes read, which is always the size of the Pointer; the
+        buffer must be at least that big. Gateways which can copy directly into the buffer
+        should override this.
+
+        """
+        data = await self.read(src)
+        memoryview(buf).cast('B')[:len(data)] = data
+        return len(data)
+
+    async def read_memoryview(self, src: Pointer) -> memoryview:
+        """Read the memory pointed to by this Pointer, and return its contents as a memoryview.
+
+        Gateways which can access the memory directly should override this to return a
+        view of the memory itself, without copying it.
+
+        """
+        return memoryview(await self.read(src))
+
 class MemoryTransport(MemoryGateway):
     @abc.abstractmethod
     def inherit(self, task: Task) -> MemoryTransport: ...
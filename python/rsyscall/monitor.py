@@ -159,8 +159,13 @@ class AsyncChildProcess:
         await self.process.waitid(W.EXITED|W.STOPPED|W.CONTINUED|W.NOHANG, siginfo_buf)
         return await self.process.read_siginfo()
 
-    async def waitpid(self, options: W) -> ChildState:
-        "Wait for a child state change in this child, like waitid(P.PID)"
+    async def waitpid(self, options: W, deadline: t.Optional[float]=None) -> ChildState:
+        """Wait for a child state change in this child, like waitid(P.PID)
+
+        If `deadline` (a `time.monotonic` time) passes before there's a state change,
+        raise TimeoutError.
+
+        """
         if options & W.EXITED and self.process.death_state:
             # TODO this is not really the actual behavior of waitpid...
             # if the child is already dead we'd get an ECHLD not the death state change again.
@@ -168,7 +173,12 @@ class AsyncChildProcess:
         while True:
             # If a previous call has given us a next_sigchld to wait on, then wait we shall.
             if self.next_sigchld:
-                await self.next_sigchld.wait()
+                if deadline is None:
+                    await self.next_sigchld.wait()
+                else:
+                    # on timeout we keep next_sigchld, so the next call waits for it again
+                    timer_wheel = await self.sigchld_sigfd.afd.epolled.epoller.timer_wheel()
+                    await timer_wheel.wait_until(deadline, self.next_sigchld.wait_cb)
                 # we shouldn't wait for SIGCHLD the next time we're called, we should eagerly call
                 # waitid, since there may still be state changes to fetch.
                 self.next_sigchld = None
@@ -16,8 +16,10 @@ SyscallInterface.
 """
 from __future__ import annotations
 from dataclasses import dataclass
+from dneio import run_all
 from rsyscall.sys.syscall import SYS
 import abc
+import functools
 import typing as t
 import os
 if t.TYPE_CHECKING:
@@ -26,6 +28,7 @@ if t.TYPE_CHECKING:
 __all__ = [
     "SyscallInterface",
     "SyscallHangup",
+    "SyscallBatchError",
 ]
 
 class SyscallInterface:
@@ -96,6 +99,32 @@ class SyscallInterface:
         """
         pass
 
+    async def syscall_batch(self, syscalls: t.Sequence[Syscall]) -> t.List[int]:
+        """Make these independent syscalls, and return their raw results, in order
+
+        Failed syscalls don't raise; their results are negative errno values, as from the kernel.
+        By default, the syscalls are just made concurrently, through `syscall`;
+        some syscall interfaces can make a batch more efficiently.
+
+        If some of the syscalls got a SyscallError, we raise SyscallBatchError, which has
+        the results of the rest.
+
+        """
+        errors: t.List[SyscallError] = []
+        async def make(syscall: Syscall) -> t.Optional[int]:
+            try:
+                return await self.syscall(syscall.number, syscall.arg1, syscall.arg2, syscall.arg3,
+                                          syscall.arg4, syscall.arg5, syscall.arg6)
+            except OSError as exn:
+                return -exn.errno
+            except SyscallError as exn:
+                errors.append(exn)
+                return None
+        results = await run_all([functools.partial(make, syscall) for syscall in syscalls])
+        if errors:
+            raise SyscallBatchError(results) from errors[0]
+        return t.cast(t.List[int], results)
+
     # non-syscall operations which we haven't figured out how to get rid of yet
     @abc.abstractmethod
     async def close_interface(self) -> None:
@@ -174,6 +203,18 @@ class SyscallSendError(SyscallError):
     """
     pass
 
+class SyscallBatchError(SyscallError):
+    """Some of the syscalls in a batch got a SyscallError.
+
+    `results` has the raw result of each syscall in the batch, in order, or None for
+    each one which got a SyscallError, and so may or may not have been executed.
+
+    Raised by SyscallInterface.syscall_batch.
+    """
+    def __init__(self, results: t.List[t.Optional[int]]) -> None:
+        super().__init__(results)
+        self.results = results
+
 def raise_if_error(response: int) -> None:
     "Raise an OSError if this integer is in the error range for syscall return values"
     if -4095 < response < 0:
@@ -1,8 +1,9 @@
 """Functions and classes for a connection between two threads, with which we can open channels for data transfer
 """
 from __future__ import annotations
-from dneio import make_n_in_parallel
+from dneio import make_n_in_parallel, run_all
 import abc
+import functools
 import typing as t
 import trio
 from rsyscall.epoller import AsyncFileDescriptor, Epoller
@@ -151,11 +152,10 @@ class FDPassConnection(Connection):
     async def open_async_channels(self, count: int) -> t.List[t.Tuple[AsyncFileDescriptor, FileDescriptor]]:
         chans = await self.open_channels(count)
         access_socks, local_socks = zip(*chans)
-        async def make_afd(sock: FileDescriptor) -> AsyncFileDescriptor:
-            # have to set NONBLOCK after creation because we want the other end to be blocking
-            await sock.fcntl(F.SETFL, O.NONBLOCK)
-            return await AsyncFileDescriptor.make(self.access_epoller, self.access_ram, sock)
-        async_access_socks = [await make_afd(sock) for sock in access_socks]
+        # have to set NONBLOCK after creation because we want the other end to be blocking
+        await run_all([functools.partial(sock.fcntl, F.SETFL, O.NONBLOCK) for sock in access_socks])
+        async_access_socks = await AsyncFileDescriptor.make_many(
+            self.access_epoller, self.access_ram, access_socks)
         return list(zip(async_access_socks, local_socks))
 
     async def prep_fd_transfer(self) -> t.Tuple[FileDescriptor, t.Callable[[Task, RAM, FileDescriptor], FDPassConnection]]:
@@ -8,6 +8,8 @@ __all__ = [
     "MFD",
     "PROT",
     "MAP",
+    "MADV",
+    "MREMAP",
     "MappableFileDescriptor",
     "MemoryMappingTask",
     "MemoryMapping",
@@ -25,6 +27,15 @@ class MAP(enum.IntFlag):
     ANONYMOUS = lib.MAP_ANONYMOUS
     POPULATE = lib.MAP_POPULATE
 
+class MADV(enum.IntEnum):
+    DONTNEED = lib.MADV_DONTNEED
+    REMOVE = lib.MADV_REMOVE
+    FREE = lib.MADV_FREE
+
+class MREMAP(enum.IntFlag):
+    NONE = 0
+    MAYMOVE = lib.MREMAP_MAYMOVE
+
 #### Classes ####
 from dataclasses import dataclass
 import rsyscall.far
@@ -42,6 +53,22 @@ class MemoryMapping:
     async def munmap(self) -> None:
         await _munmap(self.task.sysif, self.near)
 
+    async def madvise(self, advice: MADV, offset: int=0, length: t.Optional[int]=None) -> None:
+        "Give advice about the pages in this range of the mapping, which must be page-aligned."
+        if length is None:
+            length = self.near.length - offset
+        await _madvise(self.task.sysif, self.near.as_address() + offset, length, advice)
+
+    async def mremap(self, new_length: int, flags: MREMAP=MREMAP.NONE) -> MemoryMapping:
+        """Resize this mapping, returning a handle for the resized mapping.
+
+        Without MREMAP.MAYMOVE, the mapping stays at the same address, so pointers into it
+        remain valid; with it, the mapping may be moved, and this handle is left dangling.
+
+        """
+        new_near = await _mremap(self.task.sysif, self.near, new_length, flags)
+        return MemoryMapping(self.task, new_near, self.file)
+
     def for_task(self, task: MemoryMappingTask) -> MemoryMapping:
         if task.address_space != self.task.address_space:
             raise rsyscall.far.AddressSpaceMismatchError()
@@ -100,3 +127,12 @@ async def _mmap(sysif: SyscallInterface, length: int, prot: PROT, flags: MAP,
 
 async def _munmap(sysif: SyscallInterface, mapping: near.MemoryMapping) -> None:
     await sysif.syscall(SYS.munmap, mapping.address, mapping.length)
+
+async def _mremap(sysif: SyscallInterface, mapping: near.MemoryMapping,
+                  new_length: int, flags: MREMAP) -> near.MemoryMapping:
+    assert (int(new_length) % mapping.page_size) == 0
+    ret = await sysif.syscall(SYS.mremap, mapping.address, mapping.length, new_length, flags)
+    return near.MemoryMapping(address=ret, length=new_length, page_size=mapping.page_size)
+
+async def _madvise(sysif: SyscallInterface, addr: near.Address, length: int, advice: MADV) -> None:
+    await sysif.syscall(SYS.madvise, addr, length, advice)
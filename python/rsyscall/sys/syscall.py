@@ -49,16 +49,20 @@ class SYS(enum.IntEnum):
     linkat = lib.SYS_linkat
     listen = lib.SYS_listen
     lseek = lib.SYS_lseek
+    madvise = lib.SYS_madvise
     memfd_create = lib.SYS_memfd_create
     mkdirat = lib.SYS_mkdirat
     mmap = lib.SYS_mmap
     mount = lib.SYS_mount
+    mremap = lib.SYS_mremap
     munmap = lib.SYS_munmap
     openat = lib.SYS_openat
     pipe2 = lib.SYS_pipe2
     prctl = lib.SYS_prctl
     pread64 = lib.SYS_pread64
     preadv2 = lib.SYS_preadv2
+    process_vm_readv = lib.SYS_process_vm_readv
+    process_vm_writev = lib.SYS_process_vm_writev
     prlimit64 = lib.SYS_prlimit64
     pwrite64 = lib.SYS_pwrite64
     pwritev2 = lib.SYS_pwritev2
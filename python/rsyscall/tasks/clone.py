@@ -63,7 +63,7 @@ async def launch_futex_monitor(ram: RAM,
         stack_buf = await sem.malloc(Stack, 4096)
         stack = await stack_buf.write_to_end(stack_value, alignment=16)
         return stack
-    stack = await ram.perform_batch(op)
+    stack = await ram.perform_batch(op, shape_key="launch_futex_monitor")
     futex_process = await monitor.clone(CLONE.VM|CLONE.FILES, stack)
     # wait for futex helper to SIGSTOP itself,
     # which indicates the trampoline is done and we can deallocate the stack.
@@ -83,12 +83,22 @@ async def clone_child_task(
         monitor: ChildProcessMonitor,
         flags: CLONE,
         trampoline_func: t.Callable[[FileDescriptor], Trampoline],
+        make_sysif: t.Optional[t.Callable[[logging.Logger, AsyncFileDescriptor, FileDescriptor],
+                                          SyscallConnection]]=None,
+        on_exit: t.Optional[t.Callable[[], t.Awaitable[None]]]=None,
 ) -> t.Tuple[AsyncChildProcess, Task]:
     """Clone a new child process and setup the sysif and task to manage it
 
     We rely on trampoline_func to take a socket and give us a native function call with
     arguments that will speak the rsyscall protocol over that socket.
 
+    If the server started by trampoline_func speaks something other than the normal
+    rsyscall protocol over that socket, pass make_sysif to create the matching
+    syscall interface from our side of the socket and the server's side.
+
+    If on_exit is passed, we call it once the process has exited or exec'd, and so
+    stopped using our address space; it can free memory the server was using.
+
     We want to see EOF on our local socket if that remote socket is no longer being read;
     for example, if the process exits or execs.
     This is not automatic for us: Since the process might share its file descriptor table
@@ -122,7 +132,7 @@ async def clone_child_task(
         futex_pointer = await sem.ptr(FutexNode(None, Int32(1)))
         return stack, futex_pointer
     # Create the stack we'll need, and the zero-initialized futex
-    stack, futex_pointer = await ram.perform_batch(op, arena)
+    stack, futex_pointer = await ram.perform_batch(op, arena, shape_key="clone_child_task")
     # it's important to start the processes in this order, so that the thread
     # process is the first process started; this is relevant in several
     # situations, including unshare(NEWPID) and manipulation of ns_last_pid
@@ -143,6 +153,8 @@ async def clone_child_task(
             # connection is broken anyway, so shut it down.
             pass
         await access_sock.handle.shutdown(SHUT.RDWR)
+        if on_exit is not None:
+            await on_exit()
     # Running this in the background, without an associated object, is a bit dubious...
     reset(shutdown_access_sock_on_futex_process_exit())
     # Set up the new task with appropriately inherited namespaces, tables, etc.
@@ -163,9 +175,13 @@ async def clone_child_task(
     await remote_sock.invalidate()
     # Create the new syscall interface, which needs to use not just the connection,
     # but also the futex process.
-    child_task.sysif = SyscallConnection(
-        logger.getChild(str(child_process.process.near)),
-        access_sock, access_sock,
-        remote_sock_handle, remote_sock_handle,
-    )
+    child_logger = logger.getChild(str(child_process.process.near))
+    if make_sysif is None:
+        child_task.sysif = SyscallConnection(
+            child_logger,
+            access_sock, access_sock,
+            remote_sock_handle, remote_sock_handle,
+        )
+    else:
+        child_task.sysif = make_sysif(child_logger, access_sock, remote_sock_handle)
     return child_process, child_task
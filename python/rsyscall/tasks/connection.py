@@ -8,16 +8,21 @@ Still, it's not completely trivial, because we do pipelining of syscall
 requests, and we also batch together multiple requests so they can be written
 out all at once.
 
+We also support chains of syscalls, where a syscall's arguments can refer to
+the results of earlier syscalls in the chain; the server performs the whole
+chain without waiting for us in between, so it takes only a single round trip.
+
 """
-from rsyscall._raw import ffi # type: ignore
+from rsyscall._raw import ffi, lib # type: ignore
 from dataclasses import dataclass
-from dneio import RequestQueue, reset, is_running_directly_under_trio
-from rsyscall.epoller import AsyncFileDescriptor, AsyncReadBuffer
+from dneio import RequestQueue, Continuation, reset, is_running_directly_under_trio
+from rsyscall.epoller import AsyncFileDescriptor
 from rsyscall.handle import Pointer, FileDescriptor
 from rsyscall.near.sysif import SyscallHangup, SyscallSendError, SyscallInterface, Syscall, raise_if_error
-from rsyscall.struct import Struct, StructList
+from rsyscall.struct import Struct
 from rsyscall.sys.socket import SHUT
 from rsyscall.sys.syscall import SYS
+import collections
 import logging
 import trio
 import typing as t
@@ -26,8 +31,17 @@ __all__ = [
     "SyscallConnection",
     "RsyscallSyscall",
     "SyscallResponse",
+    "ChainRef",
+    "ChainSyscall",
+    "RsyscallChain",
+    "ChainResult",
 ]
 
+# How many requests fit in each of the buffers we serialize requests into before writing them.
+REQUEST_BUFFER_COUNT = 64
+# The size of the buffer we read responses into; this is enough for hundreds of responses at once.
+RESPONSE_BUFFER_SIZE = 4096
+
 class RsyscallSyscall(Struct, Syscall):
     "The struct representing a syscall request"
     def to_bytes(self) -> bytes:
@@ -66,6 +80,113 @@ class SyscallResponse(Struct):
     def sizeof(cls) -> int:
         return ffi.sizeof('long')
 
+@dataclass
+class ChainRef:
+    "An argument to a syscall in a chain, referring to the result of the earlier syscall at this index in the chain"
+    index: int
+
+    def __str__(self) -> str:
+        return f"${self.index}"
+
+ChainArg = t.Union[t.SupportsInt, ChainRef]
+
+@dataclass
+class ChainSyscall:
+    """A syscall in a chain, whose arguments may also be `ChainRef`s
+
+    This isn't a `Syscall`, since a `ChainRef` means nothing outside a chain.
+
+    """
+    number: SYS
+    arg1: ChainArg
+    arg2: ChainArg
+    arg3: ChainArg
+    arg4: ChainArg
+    arg5: ChainArg
+    arg6: ChainArg
+
+    def __str__(self) -> str:
+        args = [self.arg1, self.arg2, self.arg3, self.arg4, self.arg5, self.arg6]
+        while args and args[-1] == 0:
+            args.pop()
+        return f"{self.number}({','.join(map(str, args))})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+class RsyscallChain:
+    """A chain of syscall requests, which the server performs without a round trip between each one
+
+    The arguments of each syscall may be `ChainRef`s to earlier syscalls in the chain.
+    If a syscall in the chain fails, the syscalls after it aren't performed.
+
+    """
+    def __init__(self, syscalls: t.Sequence[t.Union[Syscall, ChainSyscall]]) -> None:
+        if not (0 < len(syscalls) <= lib.RSYSCALL_CHAIN_MAX):
+            raise ValueError("chains must contain between 1 and", lib.RSYSCALL_CHAIN_MAX, "syscalls, not", len(syscalls))
+        self.syscalls = syscalls
+        # the sys and args fields of each request, with the chain flags in sys
+        self.requests: t.List[t.Tuple[int, t.List[int]]] = []
+        for i, syscall in enumerate(syscalls):
+            sys = int(syscall.number)
+            if i + 1 < len(syscalls):
+                sys |= lib.RSYSCALL_CHAIN_NEXT
+            args: t.List[int] = []
+            for j, arg in enumerate([syscall.arg1, syscall.arg2, syscall.arg3,
+                                     syscall.arg4, syscall.arg5, syscall.arg6]):
+                if isinstance(arg, ChainRef):
+                    if not (0 <= arg.index < i):
+                        raise ValueError("syscall", i, "in chain can only refer to earlier syscalls, not", arg.index)
+                    sys |= 1 << (lib.RSYSCALL_CHAIN_REF_SHIFT + j)
+                    args.append(arg.index)
+                else:
+                    args.append(int(arg))
+            self.requests.append((sys, args))
+
+    def to_bytes(self) -> bytes:
+        return b"".join(bytes(ffi.buffer(ffi.new('struct rsyscall_syscall const*', {
+            "sys": sys,
+            "args": args,
+        }))) for sys, args in self.requests)
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def __str__(self) -> str:
+        return f"chain({'; '.join(map(str, self.syscalls))})"
+
+    def __repr__(self) -> str:
+        return str(self)
+
+@dataclass
+class ChainResult:
+    """The results of the syscalls in a `RsyscallChain`
+
+    The syscalls after a failed syscall weren't performed; their results are -ECANCELED.
+
+    """
+    results: t.List[int]
+
+    def __getitem__(self, index: int) -> int:
+        "Return the result of the syscall at this index in the chain, raising OSError if it failed"
+        result = self.results[index]
+        raise_if_error(result)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    @property
+    def failed(self) -> t.Optional[int]:
+        "The index of the syscall that failed and aborted the chain, or None if none did"
+        for i, result in enumerate(self.results):
+            if -4095 < result < 0:
+                return i
+        return None
+
+# Each element of a SyscallConnection's queues is a single syscall, or a chain.
+Request = t.Union[RsyscallSyscall, RsyscallChain]
+
 class SyscallConnection(SyscallInterface):
     "A connection to some rsyscall server where we can make syscalls"
     def __init__(self,
@@ -81,9 +202,12 @@ class SyscallConnection(SyscallInterface):
         self.server_infd = server_infd
         self.server_outfd = server_outfd
         self.valid: t.Optional[Pointer[bytes]] = None
-        self.request_queue = RequestQueue[RsyscallSyscall, int]()
+        self.request_queue = RequestQueue[Request, t.Any]()
+        self.free_buffers: t.List[Pointer[bytes]] = []
+        self.write_queue = RequestQueue[t.Tuple[Pointer[bytes], Pointer[bytes],
+                                                t.List[t.Tuple[int, Request, Continuation[t.Any]]]], None]()
         reset(self._run_requests())
-        self.response_queue = RequestQueue[RsyscallSyscall, int]()
+        self.response_queue = RequestQueue[Request, t.Any]()
         reset(self._run_responses())
 
     def get_activity_fd(self) -> FileDescriptor:
@@ -121,9 +245,28 @@ class SyscallConnection(SyscallInterface):
             self.logger.debug("%s -> %s", number, result)
             return result
 
-    async def do_syscall(self, syscall: RsyscallSyscall) -> int:
+    async def syscall_chain(self, syscalls: t.Sequence[t.Union[Syscall, ChainSyscall]]) -> ChainResult:
+        """Perform these syscalls as a chain, in a single round trip to the server
+
+        Arguments may be `ChainRef`s to the results of earlier syscalls in the chain.
+        This doesn't raise if a syscall in the chain fails; check the `ChainResult`.
+
+        """
+        chain = RsyscallChain(syscalls)
+        self.logger.debug("%s", chain)
+        try:
+            results = await self.do_syscall(chain)
+        except Exception as exn:
+            self.logger.debug("%s -/ %s", chain, exn)
+            raise
+        self.logger.debug("%s -> %s", chain, results)
+        return ChainResult(results)
+
+    async def do_syscall(self, syscall: Request) -> t.Any:
         """Write a syscall request and perform it.
 
+        For a chain, returns the list of results.
+
         """
         # TODO as a hack, so we don't have to figure it out now, we don't allow
         # a syscall request to be cancelled before it's actually made. we could
@@ -136,45 +279,142 @@ class SyscallConnection(SyscallInterface):
             return await self.request_queue.request(syscall)
 
     async def _run_requests(self) -> None:
+        """Serialize batches of requests into our request buffers, and pass them to _run_writes
+
+        We have two request buffers, which we allocate once and reuse: while one is
+        being written to tofd by _run_writes, we gather and serialize the next batch
+        of requests into the other.
+
+        """
+        reset(self._run_writes())
+        capacity = REQUEST_BUFFER_COUNT * RsyscallSyscall.sizeof()
         while True:
             # wait until we have a batch to do, received from self.pending_requests
             requests = await self.request_queue.get_many()
             self.logger.debug("_run_requests: get_many: %s", requests)
-            # write remaining_reqs to memory
-            ptr: Pointer[StructList] = await self.tofd.ram.ptr(
-                StructList(RsyscallSyscall, [syscall for syscall, coro in requests]))
-            self.logger.debug("_run_requests: performed ptr for: %s", requests)
-            ptr_to_write, reqs_to_write = ptr, requests
-            # TODO write requests to tofd in parallel with receiving more
-            # requests from the channel and writing them to memory
+            batch: t.List[t.Tuple[bytes, Request, Continuation[t.Any]]] = []
+            length = 0
+            for request, cb in requests:
+                data = request.to_bytes()
+                if length + len(data) > capacity:
+                    await self._send_batch(batch)
+                    batch, length = [], 0
+                batch.append((data, request, cb))
+                length += len(data)
+            await self._send_batch(batch)
+
+    async def _send_batch(self, batch: t.List[t.Tuple[bytes, Request, Continuation[t.Any]]]) -> None:
+        "Serialize this batch into a free request buffer, and pass it to _run_writes"
+        # _run_writes returns its buffer before it takes the next one from us,
+        # and we hold at most one buffer at a time, so we only ever allocate two.
+        if self.free_buffers:
+            buf = self.free_buffers.pop()
+        else:
+            buf = await self.tofd.ram.malloc(bytes, REQUEST_BUFFER_COUNT * RsyscallSyscall.sizeof())
+        data = b"".join(data for data, _, _ in batch)
+        to_write, spare = buf.split(len(data))
+        written = await to_write.write(data)
+        self.logger.debug("_run_requests: serialized: %s", batch)
+        # returns as soon as _run_writes has taken the batch, not when it's written
+        await self.write_queue.request((written, spare, [(len(data), request, cb) for data, request, cb in batch]))
+
+    async def _run_writes(self) -> None:
+        """Write batches of serialized requests to tofd, forwarding them to _run_responses as they're sent
+
+        If we get a partial write, we forward the requests that were completely
+        written immediately, so that they aren't blocked on later requests.
+
+        The server performs each request in a chain as soon as it reads it, so if we
+        fail partway through writing a chain, the start of the chain may have been
+        performed; that chain gets SyscallHangup rather than SyscallSendError.
+
+        """
+        while True:
+            (to_write, spare, requests), cb = await self.write_queue.get_one()
+            cb.send(None)
+            written: t.Optional[Pointer[bytes]] = None
+            forwarded = 0
+            # the offset in the buffer of the end of the next request to forward
+            end = requests[0][0]
             try:
-                while ptr_to_write.size() > 0:
-                    _, ptr_to_write = await self.tofd.write(ptr_to_write)
-                    # TODO mark the requests as complete incrementally,
-                    # so if we do have a partial write,
-                    # we don't block earlier requests on later ones.
+                while to_write.size() > 0:
+                    just_written, to_write = await self.tofd.write(to_write)
+                    written += just_written
+                    while forwarded < len(requests) and end <= written.size():
+                        _, request, coro = requests[forwarded]
+                        self.logger.debug("forward_request: %s", request)
+                        self.response_queue.request_cb(request, coro)
+                        forwarded += 1
+                        if forwarded < len(requests):
+                            end += requests[forwarded][0]
             except OSError as syscall_error:
                 exn = SyscallSendError()
                 exn.__cause__ = syscall_error
-                # TODO not necessarily all of the syscalls have failed...
-                # some maybe have been actually written, if we had a partial write
-                for syscall, cb in reqs_to_write:
+                unsent = requests[forwarded:]
+                # the offset in the buffer of the start of the first unforwarded request
+                start = end - unsent[0][0]
+                written_size = written.size() if written else 0
+                _, request, cb = unsent[0]
+                if isinstance(request, RsyscallChain) and written_size - start >= RsyscallSyscall.sizeof():
+                    # at least one request in this chain was written, so it may have been performed
+                    hangup_exn = SyscallHangup()
+                    hangup_exn.__cause__ = syscall_error
+                    cb.throw(hangup_exn)
+                    unsent = unsent[1:]
+                # the server can't have performed any other request that wasn't entirely written
+                for _, request, cb in unsent:
                     cb.throw(exn)
-            else:
-                for syscall, coro in reqs_to_write:
-                    self.logger.debug("forward_request: %s", syscall)
-                    self.response_queue.request_cb(syscall, coro)
+            self.free_buffers.append((written + to_write) + spare)
 
     async def _run_responses(self) -> None:
-        buffer = AsyncReadBuffer(self.fromfd)
+        """Read responses in bulk, and resume the requests they're for, in order
+
+        Rather than parsing each response separately, we read as many responses
+        as are available, and decode all the complete ones in one pass.
+
+        """
+        size = SyscallResponse.sizeof()
+        read_buf: t.Optional[Pointer[bytes]] = None
+        # the start of a response which we've only partially read
+        leftover = b""
+        # responses which we've read, but haven't yet matched up with a request
+        values: t.Deque[int] = collections.deque()
+        pending: t.Deque[t.Tuple[Request, Continuation[t.Any]]] = collections.deque()
         while True:
-            syscall, cb = await self.response_queue.get_one()
-            self.logger.debug("going to read_result for syscall: %s %s", syscall, self.fromfd.handle.near)
+            if not pending:
+                pending.append(await self.response_queue.get_one())
+            pending.extend(self.response_queue.fetch_any())
+            while pending:
+                request, cb = pending[0]
+                if isinstance(request, RsyscallChain):
+                    if len(values) < len(request):
+                        break
+                    pending.popleft()
+                    cb.send([values.popleft() for _ in request.requests])
+                else:
+                    if not values:
+                        break
+                    pending.popleft()
+                    cb.send(values.popleft())
+            if not pending:
+                continue
+            self.logger.debug("going to read results for syscalls: %s %s", pending, self.fromfd.handle.near)
             try:
-                value = (await buffer.read_struct(SyscallResponse)).value
+                if read_buf is None:
+                    read_buf = await self.fromfd.ram.malloc(bytes, RESPONSE_BUFFER_SIZE)
+                valid, rest = await self.fromfd.read(read_buf)
+                if valid.size() == 0:
+                    read_buf = valid.merge(rest)
+                    raise EOFError("got EOF while expecting to read syscall responses")
+                data = leftover + await valid.read()
+                read_buf = valid.merge(rest)
             except Exception as exn:
                 hangup_exn = SyscallHangup()
                 hangup_exn.__cause__ = exn
-                cb.throw(hangup_exn)
+                while pending:
+                    _, cb = pending.popleft()
+                    cb.throw(hangup_exn)
             else:
-                cb.send(value)
+                complete = len(data) - (len(data) % size)
+                values.extend(memoryview(data)[:complete].cast('q'))
+                leftover = data[complete:]
@@ -65,6 +65,22 @@ class LocalSyscall(SyscallInterface):
         self.logger.debug("%s -> %s", number, result)
         return result
 
+    async def syscall_batch(self, syscalls: t.Sequence[Syscall]) -> t.List[int]:
+        "Make these syscalls with a single call into C, rather than one call per syscall"
+        if not syscalls:
+            return []
+        self.logger.debug("batch %s", syscalls)
+        requests = ffi.new('struct rsyscall_syscall[]', [{
+            "sys": syscall.number,
+            "args": (int(syscall.arg1), int(syscall.arg2), int(syscall.arg3),
+                     int(syscall.arg4), int(syscall.arg5), int(syscall.arg6)),
+        } for syscall in syscalls])
+        results = ffi.new('int64_t[]', len(syscalls))
+        lib.rsyscall_raw_syscall_batch(requests, results, len(syscalls))
+        ret = list(results)
+        self.logger.debug("batch %s -> %s", syscalls, ret)
+        return ret
+
 class LocalMemoryTransport(MemoryTransport):
     "This is a memory transport that only works on local pointers."
     def __init__(self, local_task: Task) -> None:
@@ -84,6 +100,17 @@ class LocalMemoryTransport(MemoryTransport):
         buf = ffi.buffer(ffi.cast('void*', int(src.near)), src.size())
         return bytes(buf)
 
+    async def read_into(self, src: Pointer, buf: t.Union[bytearray, memoryview]) -> int:
+        if src.mapping.task.address_space != self.local_task.address_space:
+            raise Exception("trying to read from pointer", src, "not in local address space")
+        ffi.memmove(ffi.from_buffer(buf, require_writable=True), ffi.cast('void*', int(src.near)), src.size())
+        return src.size()
+
+    async def read_memoryview(self, src: Pointer) -> memoryview:
+        if src.mapping.task.address_space != self.local_task.address_space:
+            raise Exception("trying to read from pointer", src, "not in local address space")
+        return memoryview(ffi.buffer(ffi.cast('void*', int(src.near)), src.size())).toreadonly()
+
 async def _make_local_thread() -> Thread:
     """Create the local thread, allocating various resources locally.
 
@@ -79,6 +79,7 @@ from rsyscall.loader import NativeLoader, Trampoline
 from rsyscall.sched import Stack
 from rsyscall.handle import WrittenPointer, ThreadProcess, Pointer, Task, FileDescriptor
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVmTransport
 from rsyscall.near.sysif import SyscallInterface, SyscallSendError
 from rsyscall.sys.syscall import SYS
 
@@ -202,11 +203,12 @@ async def clone_persistent(
         CLONE.FILES|CLONE.FS|CLONE.SIGHAND,
         lambda sock: Trampoline(parent.loader.persistent_server_func, [sock, sock, listening_sock]))
     listening_sock_handle = listening_sock.move(task)
-    ram = RAM(task, parent.ram.transport, parent.ram.allocator.inherit(task))
+    ram = RAM(task, parent.ram.transport, parent.ram.allocator.inherit(task),
+              const_cache=parent.ram.const_cache)
 
     ## create the new persistent task
     epoller = await Epoller.make_root(ram, task)
-    signal_block = SignalBlock(task, await ram.ptr(Sigset({SIG.CHLD})))
+    signal_block = SignalBlock(task, await ram.const_ptr(Sigset({SIG.CHLD})))
     # TODO use an inherited signalfd instead
     child_monitor = await ChildProcessMonitor.make(ram, task, epoller, signal_block=signal_block)
     return PersistentThread(Thread(
@@ -321,7 +323,8 @@ class PersistentThread(Thread):
         # Fix up RAM with new transport
         # TODO technically this could still be in the same address space - that's the case in our tests.
         # we should figure out a way to use a LocalMemoryTransport here so it can copy efficiently
-        transport = SocketMemoryTransport(access_data_sock, remote_data_sock)
+        transport = ProcessVmTransport.make(
+            self.task, SocketMemoryTransport(access_data_sock, remote_data_sock))
         self.ram.transport = transport
         self.transport = transport
         # close remote fds we don't have handles to; this includes the old interface fds.
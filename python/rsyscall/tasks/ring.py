@@ -0,0 +1,199 @@
+"""A syscall interface over a ring of requests in shared memory
+
+A child created by `rsyscall.tasks.clone.clone_child_task` always shares our
+address space, so instead of writing syscall requests to a socket and reading
+responses back, we can put them in a ring in memory, and have the child run
+`rsyscall_ring_server`, which spins on the ring for a while before going to
+sleep on a futex. While the server is spinning, a syscall costs no syscalls at
+all on either side.
+
+We still use a socket between us and the server, but only rarely: the server
+writes a byte to it when we're blocked waiting for a completion, and we write a
+byte to it when the server is blocked in a syscall and we've submitted more
+requests behind that syscall. The latter is what makes the server's socket work
+as the activity fd, just as it does for `SyscallConnection`. Hangup detection
+works exactly as it does for a normal `SyscallConnection`, by shutting down our
+side of the socket when the child exits or execs.
+
+This only works when the ring is in the local address space, and the socket is
+in the local fd table, since we access both directly from Python.
+
+"""
+from __future__ import annotations
+from rsyscall._raw import ffi, lib # type: ignore
+from dneio import Event
+from rsyscall.epoller import AsyncFileDescriptor
+from rsyscall.handle import FileDescriptor, Pointer, Task
+from rsyscall.near.sysif import SyscallHangup
+from rsyscall.sys.mman import MemoryMapping, PROT, MAP
+from rsyscall.tasks.connection import SyscallConnection, RsyscallChain
+import logging
+import typing as t
+
+__all__ = [
+    "SyscallRing",
+    "RingSyscallConnection",
+]
+
+def _round_to_page(size: int, page_size: int=4096) -> int:
+    return (size + page_size - 1) // page_size * page_size
+
+def _local_task() -> Task:
+    # imported here, since the local thread is itself created with this module imported
+    from rsyscall.tasks.local import local_thread
+    return local_thread.task
+
+class SyscallRing:
+    "A `struct rsyscall_ring` in a mapping in the local address space"
+    @staticmethod
+    async def make(task: Task) -> SyscallRing:
+        """Map a new ring in `task`, which must share the local address space
+
+        We don't use the normal allocator here, since the ring must outlive any
+        particular syscall, and must never be moved.
+
+        """
+        if task.address_space != _local_task().address_space:
+            raise Exception("can't make a syscall ring in a non-local address space", task)
+        mapping = await task.mmap(_round_to_page(ffi.sizeof('struct rsyscall_ring')),
+                                  PROT.READ|PROT.WRITE, MAP.PRIVATE)
+        return SyscallRing(mapping)
+
+    def __init__(self, mapping: MemoryMapping) -> None:
+        self.mapping = mapping
+        self.ring = ffi.cast('struct rsyscall_ring*', int(mapping.near.as_address()))
+        self.closed = False
+
+    def check_open(self) -> None:
+        "Raise SyscallHangup if the ring has been unmapped, so we don't touch its memory."
+        if self.closed:
+            raise SyscallHangup("the syscall ring was unmapped")
+
+    async def close(self) -> None:
+        """Unmap the ring
+
+        Only call this once the server has stopped using the ring, such as when its process
+        has exited or exec'd; after this, the connection fails every request.
+
+        """
+        if not self.closed:
+            self.closed = True
+            await self.mapping.munmap()
+
+    @property
+    def address(self) -> int:
+        "The address of the ring, to be passed to `rsyscall_ring_server`"
+        return int(ffi.cast('uintptr_t', self.ring))
+
+    def make_connection(self, logger: logging.Logger,
+                        sock: AsyncFileDescriptor, server_sock: FileDescriptor) -> RingSyscallConnection:
+        return RingSyscallConnection(logger, self, sock, server_sock)
+
+class RingSyscallConnection(SyscallConnection):
+    """A connection to an rsyscall_ring_server, sending syscalls through a `SyscallRing`
+
+    Requests are submitted to the ring in order, and completed in order, so,
+    like `SyscallConnection`, we just keep a queue of the requests submitted but
+    not yet completed.
+
+    The ring server supports chains just like the other servers, as long as all
+    the requests in a chain are submitted consecutively.
+
+    """
+    def __init__(self,
+                 logger: logging.Logger,
+                 ring: SyscallRing,
+                 sock: AsyncFileDescriptor,
+                 server_sock: FileDescriptor,
+    ) -> None:
+        if sock.handle.task.fd_table != _local_task().fd_table:
+            raise Exception("the socket for a syscall ring must be in the local fd table", sock)
+        self.ring = ring
+        self.submitted = 0
+        self.completed = 0
+        self.space_available: t.Optional[Event] = None
+        self.read_buf: t.Optional[Pointer[bytes]] = None
+        super().__init__(logger, sock, sock, server_sock, server_sock)
+
+    def _sockfd(self) -> int:
+        return int(self.tofd.handle.near)
+
+    async def _run_requests(self) -> None:
+        size = lib.RSYSCALL_RING_SIZE
+        while True:
+            requests = await self.request_queue.get_many()
+            self.logger.debug("_run_requests: get_many: %s", requests)
+            for syscall, cb in requests:
+                if isinstance(syscall, RsyscallChain):
+                    entries = syscall.requests
+                else:
+                    entries = [(int(syscall.number), [
+                        int(syscall.arg1), int(syscall.arg2), int(syscall.arg3),
+                        int(syscall.arg4), int(syscall.arg5), int(syscall.arg6)])]
+                if self.ring.closed:
+                    cb.throw(SyscallHangup("the syscall ring was unmapped"))
+                    continue
+                for sys, args in entries:
+                    while self.submitted - self.completed >= size:
+                        self.space_available = Event()
+                        await self.space_available.wait()
+                    if self.ring.closed:
+                        # the response side will fail this request with SyscallHangup
+                        break
+                    entry = self.ring.ring.entries[self.submitted % size]
+                    entry.request.sys = sys
+                    entry.request.args = args
+                    ret = lib.rsyscall_ring_submit(self.ring.ring, self._sockfd())
+                    self.submitted += 1
+                    # Even if waking the server failed, the request is in the ring, so
+                    # we'll find out if it's performed the same way as for any request.
+                    if ret < 0:
+                        self.logger.debug("_run_requests: failed to wake server: %s", ret)
+                self.response_queue.request_cb(syscall, cb)
+
+    async def _wait_for_completion(self) -> None:
+        "Wait until the server has completed the next request"
+        # the ring's counters are uint32_t
+        index = self.completed % 2**32
+        self.ring.check_open()
+        while lib.rsyscall_ring_completed(self.ring.ring, 0, self._sockfd()) == index:
+            if lib.rsyscall_ring_completed(self.ring.ring, 1, self._sockfd()) != index:
+                break
+            if self.read_buf is None:
+                self.read_buf = await self.fromfd.ram.malloc(bytes, 64)
+            buf, self.read_buf = self.read_buf, None
+            valid, rest = await self.fromfd.read(buf)
+            self.read_buf = valid.merge(rest)
+            # the ring may have been unmapped while we were waiting
+            self.ring.check_open()
+            if valid.size() == 0:
+                if lib.rsyscall_ring_completed(self.ring.ring, 0, self._sockfd()) != index:
+                    break
+                raise SyscallHangup("got EOF from ring syscall server")
+
+    async def _complete(self) -> int:
+        "Wait until the server has completed the next request, and return its result"
+        await self._wait_for_completion()
+        self.ring.check_open()
+        value = self.ring.ring.entries[self.completed % lib.RSYSCALL_RING_SIZE].result
+        self.completed += 1
+        if self.space_available is not None:
+            space_available, self.space_available = self.space_available, None
+            space_available.set()
+        return value
+
+    async def _run_responses(self) -> None:
+        while True:
+            syscall, cb = await self.response_queue.get_one()
+            self.logger.debug("going to wait for completion of syscall: %s", syscall)
+            try:
+                if isinstance(syscall, RsyscallChain):
+                    value: t.Any = [await self._complete() for _ in syscall.requests]
+                else:
+                    value = await self._complete()
+            except Exception as exn:
+                hangup_exn = SyscallHangup()
+                hangup_exn.__cause__ = exn
+                cb.throw(hangup_exn)
+            else:
+                cb.send(value)
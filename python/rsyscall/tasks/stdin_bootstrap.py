@@ -18,6 +18,8 @@ from rsyscall.thread import Thread
 from rsyscall.loader import NativeLoader
 from rsyscall.memory.ram import RAM
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVmTransport
+from rsyscall.memory.shared_transport import make_shared_memory
 from rsyscall.monitor import AsyncChildProcess, ChildProcessMonitor
 from rsyscall.tasks.connection import SyscallConnection
 import logging
@@ -120,12 +122,13 @@ async def stdin_bootstrap(
         access_syscall_sock, access_syscall_sock,
         remote_syscall_fd, remote_syscall_fd,
     )
-    allocator = memory.AllocatorClient.make_allocator(base_task)
     # we assume our SignalMask is zero'd before being started, so we don't inherit it
-    ram = RAM(base_task,
-               SocketMemoryTransport(access_data_sock,
-                                     base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd))),
-               allocator)
+    setup_ram = RAM(base_task,
+                    ProcessVmTransport.make(base_task, SocketMemoryTransport(
+                        access_data_sock, base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)))),
+                    memory.AllocatorClient.make_allocator(base_task))
+    # allocate from memory that's also mapped locally, so we can access it without syscalls
+    ram = RAM(base_task, *make_shared_memory(setup_ram))
     # TODO I think I can maybe elide creating this epollcenter and instead inherit it or share it, maybe?
     epoller = await Epoller.make_root(ram, base_task)
     child_monitor = await ChildProcessMonitor.make(ram, base_task, epoller)
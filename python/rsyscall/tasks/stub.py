@@ -50,6 +50,8 @@ from rsyscall.epoller import Epoller, AsyncFileDescriptor, AsyncReadBuffer
 from rsyscall.monitor import ChildProcessMonitor
 from rsyscall.command import Command
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVmTransport
+from rsyscall.memory.shared_transport import make_shared_memory
 
 import rsyscall.struct
 from rsyscall.environ import Environment
@@ -162,12 +164,13 @@ async def _setup_stub(
         access_syscall_sock, access_syscall_sock,
         remote_syscall_fd, remote_syscall_fd,
     )
-    allocator = memory.AllocatorClient.make_allocator(base_task)
     base_task.sigmask = Sigset({SIG(bit) for bit in rsyscall.struct.bits(describe_struct.sigmask)})
-    ram = RAM(base_task,
-              SocketMemoryTransport(access_data_sock,
-                                    base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd))),
-              allocator)
+    setup_ram = RAM(base_task,
+                    ProcessVmTransport.make(base_task, SocketMemoryTransport(
+                        access_data_sock, base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)))),
+                    memory.AllocatorClient.make_allocator(base_task))
+    # allocate from memory that's also mapped locally, so we can access it without syscalls
+    ram = RAM(base_task, *make_shared_memory(setup_ram))
     # TODO I think I can maybe elide creating this epollcenter and instead inherit it or share it, maybe?
     # I guess I need to write out the set too in describe
     epoller = await Epoller.make_root(ram, base_task)
@@ -0,0 +1,184 @@
+"""An io_uring-based syscall interface for the local thread
+
+`rsyscall.tasks.local.LocalSyscall` performs every syscall synchronously, blocking
+the whole Python thread (and so the trio event loop) until it returns. For slow
+syscalls, like openat on a network filesystem, that's unfortunate.
+
+`UringSyscall` instead submits syscalls which have an io_uring equivalent to an
+io_uring, and waits for their completion through the epoller, so many of them
+can be in flight at once. Other syscalls are still performed directly.
+
+Unlike other syscall interfaces, syscalls made through `UringSyscall` don't
+necessarily complete in the order they were made. So it's best used for things
+like filesystem operations, which don't rely on that ordering; in particular,
+concurrent operations on a single `rsyscall.epoller.AsyncFileDescriptor` expect
+their syscalls to complete in order.
+
+"""
+from __future__ import annotations
+from rsyscall._raw import ffi, lib # type: ignore
+from dneio import RequestQueue, Continuation, reset, is_running_directly_under_trio
+from rsyscall.epoller import AsyncFileDescriptor
+from rsyscall.handle import Pointer, Task
+from rsyscall.memory.ram import RAM
+from rsyscall.near.sysif import SyscallInterface, Syscall, SyscallHangup, raise_if_error
+from rsyscall.sys.eventfd import EFD
+from rsyscall.sys.syscall import SYS
+from rsyscall.thread import Thread
+import errno
+import logging
+import trio
+import typing as t
+
+__all__ = [
+    "UringSyscall",
+    "make_uring_thread",
+]
+
+logger = logging.getLogger(__name__)
+
+class UringSyscall(SyscallInterface):
+    "Makes syscalls in the local thread, through an io_uring where possible."
+    @staticmethod
+    async def make(thread: Thread, entries: int=256) -> UringSyscall:
+        """Set up an io_uring in `thread`, which must be the local thread
+
+        We're notified of completions through an eventfd registered on the thread's epoller.
+
+        """
+        eventfd = await thread.task.eventfd(0, EFD.NONBLOCK)
+        uring = ffi.new('struct rsyscall_uring*')
+        raise_if_error(lib.rsyscall_uring_setup(uring, entries, int(eventfd.near)))
+        return UringSyscall(
+            uring,
+            await AsyncFileDescriptor.make(thread.epoller, thread.ram, eventfd),
+            await thread.ram.malloc(bytes, 8),
+        )
+
+    def __init__(self, uring: t.Any, eventfd: AsyncFileDescriptor, eventfd_buf: Pointer[bytes]) -> None:
+        "Don't construct directly; use the UringSyscall.make constructor instead."
+        self.logger = logger
+        self.uring = uring
+        self.eventfd = eventfd
+        self.eventfd_buf = eventfd_buf
+        self.request = ffi.new('struct rsyscall_syscall*')
+        self.completions = ffi.new('struct rsyscall_uring_completion[]', 64)
+        self.next_id = 0
+        self.closed = False
+        self.queue = RequestQueue[int, int]()
+        reset(self._run())
+
+    def get_activity_fd(self) -> None:
+        return None
+
+    async def close_interface(self) -> None:
+        """Close the io_uring and its eventfd; syscalls which haven't completed throw SyscallHangup
+
+        Closing the eventfd makes _run's read of it fail, so _run stops.
+
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.close(SyscallHangup("io_uring was closed"))
+        raise_if_error(lib.rsyscall_uring_close(self.uring))
+        await self.eventfd.close()
+
+    async def syscall(self, number: SYS, arg1=0, arg2=0, arg3=0, arg4=0, arg5=0, arg6=0) -> int:
+        syscall = Syscall(number, arg1, arg2, arg3, arg4, arg5, arg6)
+        self.logger.debug("%s", syscall)
+        try:
+            result = await self._do_syscall(
+                number, int(arg1), int(arg2), int(arg3), int(arg4), int(arg5), int(arg6))
+            raise_if_error(result)
+        except OSError as exn:
+            self.logger.debug("%s -> %s", number, exn)
+            raise
+        self.logger.debug("%s -> %s", number, result)
+        return result
+
+    def _prep(self, number: SYS, args: t.Tuple[int, ...]) -> t.Optional[int]:
+        "Queue this syscall on the io_uring, returning its id, or None if we can't"
+        self.request.sys = number
+        self.request.args = args
+        user_data = self.next_id
+        ret = lib.rsyscall_uring_prep(self.uring, self.request, user_data)
+        if ret == -errno.EBUSY:
+            # the submission queue is full of earlier syscalls which failed to submit
+            lib.rsyscall_uring_submit(self.uring)
+            ret = lib.rsyscall_uring_prep(self.uring, self.request, user_data)
+        if ret <= 0:
+            return None
+        self.next_id += 1
+        return user_data
+
+    async def _do_syscall(self, number: SYS, *args: int) -> int:
+        if self.closed:
+            raise SyscallHangup("io_uring was closed")
+        user_data = self._prep(number, args)
+        if user_data is None:
+            return lib.rsyscall_raw_syscall(*args, number)
+        ret = lib.rsyscall_uring_submit(self.uring)
+        if ret < 0:
+            # The syscall is still queued; we'll retry submitting it before we next block.
+            self.logger.debug("io_uring_enter failed, will retry: %s", ret)
+        # Like SyscallConnection, once the syscall is submitted, we have to wait for it to complete.
+        if is_running_directly_under_trio():
+            with trio.CancelScope(shield=True):
+                return await self.queue.request(user_data)
+        else:
+            return await self.queue.request(user_data)
+
+    async def _run(self) -> None:
+        pending: t.Dict[int, Continuation[int]] = {}
+        while True:
+            if not pending:
+                user_data, cb = await self.queue.get_one()
+                pending[user_data] = cb
+            for user_data, cb in self.queue.fetch_any():
+                pending[user_data] = cb
+            if self.closed:
+                # the io_uring is gone, so we can't touch it any more
+                final_exn = SyscallHangup("io_uring was closed")
+                break
+            count = lib.rsyscall_uring_reap(self.uring, self.completions, len(self.completions))
+            if count == 0:
+                lib.rsyscall_uring_submit(self.uring)
+                try:
+                    valid, rest = await self.eventfd.read(self.eventfd_buf)
+                except Exception as exn:
+                    final_exn = SyscallHangup()
+                    final_exn.__cause__ = exn
+                    break
+                self.eventfd_buf = valid.merge(rest)
+                continue
+            for i in range(count):
+                completion = self.completions[i]
+                pending.pop(completion.user_data).send(completion.result)
+        for cb in pending.values():
+            cb.throw(final_exn)
+        self.queue.close(final_exn)
+
+async def make_uring_thread(thread: Thread, entries: int=256) -> Thread:
+    """Make a Thread for the same process as `thread`, but which makes syscalls through an io_uring
+
+    `thread` must be the local thread. The new thread shares its fd table,
+    address space, epoller and child monitor.
+
+    """
+    task = Task(thread.task.process, thread.task.fd_table, thread.task.address_space, thread.task.pidns)
+    task.sysif = await UringSyscall.make(thread, entries)
+    task.sigmask = thread.task.sigmask
+    ram = RAM(task, thread.ram.transport, thread.ram.allocator.inherit(task),
+              const_cache=thread.ram.const_cache)
+    return Thread(
+        task, ram,
+        thread.connection.inherit(task, ram),
+        thread.loader,
+        thread.epoller.inherit(ram),
+        thread.monitor,
+        thread.environ.inherit(task, ram),
+        stdin=thread.stdin.inherit(task),
+        stdout=thread.stdout.inherit(task),
+        stderr=thread.stderr.inherit(task),
+    )
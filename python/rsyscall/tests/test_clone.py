@@ -9,6 +9,31 @@ from rsyscall.signal import SIG, Sigset
 from rsyscall.stdlib import mkdtemp
 from rsyscall.sys.signalfd import SignalfdSiginfo
 from rsyscall.sys.wait import CalledProcessError
+from rsyscall.sys.syscall import SYS
+from rsyscall.near.sysif import SyscallInterface
+from rsyscall.tasks.connection import SyscallConnection, ChainRef, ChainSyscall
+import errno
+import trio
+
+async def do_syscall_chains(test: TrioTestCase, sysif: SyscallInterface) -> None:
+    assert isinstance(sysif, SyscallConnection)
+    F_GETFL = 3
+    result = await sysif.syscall_chain([
+        ChainSyscall(SYS.eventfd2, 0, 0, 0, 0, 0, 0),
+        ChainSyscall(SYS.fcntl, ChainRef(0), F_GETFL, 0, 0, 0, 0),
+        ChainSyscall(SYS.close, ChainRef(0), 0, 0, 0, 0, 0),
+    ])
+    test.assertIsNone(result.failed)
+    test.assertEqual(result[2], 0)
+    result = await sysif.syscall_chain([
+        ChainSyscall(SYS.close, -1, 0, 0, 0, 0, 0),
+        ChainSyscall(SYS.close, ChainRef(0), 0, 0, 0, 0, 0),
+    ])
+    test.assertEqual(result.failed, 0)
+    with test.assertRaises(OSError) as cm:
+        result[0]
+    test.assertEqual(cm.exception.errno, errno.EBADF)
+    test.assertEqual(result.results[1], -errno.ECANCELED)
 
 class TestClone(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -43,6 +68,47 @@ class TestClone(TrioTestCase):
         await child1.check()
         await child2.check()
 
+    async def test_batch_server(self) -> None:
+        thread = await self.thr.clone(batch_server=True)
+        await do_async_things(self, thread.epoller, thread)
+        await thread.exit(0)
+
+    async def test_batch_server_blocking(self) -> None:
+        "A response isn't held back while the server is blocked in a later request"
+        pipe = await self.thr.pipe()
+        thread = await self.thr.clone(batch_server=True)
+        read_end = thread.task.inherit_fd(pipe.read)
+        buf = await thread.ram.malloc(bytes, 1)
+        got_pid = trio.Event()
+        async def getpid() -> None:
+            await thread.task.getpid()
+            got_pid.set()
+        async with trio.open_nursery() as nursery:
+            # pipelined, so the server may read both requests before performing either
+            nursery.start_soon(getpid)
+            nursery.start_soon(read_end.read, buf)
+            try:
+                with trio.fail_after(5):
+                    await got_pid.wait()
+            finally:
+                # unblock the read either way
+                await pipe.write.write(await self.thr.ram.ptr(b'x'))
+        await thread.exit(0)
+
+    async def test_syscall_ring(self) -> None:
+        thread = await local_thread.clone(syscall_ring=True)
+        await do_async_things(self, thread.epoller, thread)
+        child = await thread.exec(thread.environ.sh.args('-c', 'true'))
+        await child.check()
+
+    async def test_syscall_chain(self) -> None:
+        await do_syscall_chains(self, self.thr.task.sysif)
+
+    async def test_syscall_ring_chain(self) -> None:
+        thread = await local_thread.clone(syscall_ring=True)
+        await do_syscall_chains(self, thread.task.sysif)
+        await thread.exit(0)
+
     async def test_async(self) -> None:
         epoller = await Epoller.make_root(self.thr.ram, self.thr.task)
         await do_async_things(self, epoller, self.thr)
@@ -3,12 +3,15 @@ from __future__ import annotations
 from rsyscall.tests.trio_test_case import TrioTestCase
 from rsyscall import local_thread, FileDescriptor, Pointer
 from rsyscall.epoller import *
+import time
 import trio
 import outcome
 
 from rsyscall.tests.utils import do_async_things
 from rsyscall.near.sysif import SyscallInterface, Syscall
 from rsyscall.sys.syscall import SYS
+from rsyscall.sys.epoll import EPOLL
+from rsyscall.fcntl import F, O
 from dneio import RequestQueue, reset, Continuation
 import typing as t
 
@@ -103,3 +106,81 @@ class TestEpoller(TrioTestCase):
         with self.assertRaises(OSError) as cm:
             await async_pipe_rfd.write_all_bytes(b'hi')
         self.assertEqual(cm.exception.errno, 9)
+
+    async def test_many_ready(self):
+        "Many fds ready in a single epoll_wait grow the epoll_wait buffer"
+        pipe = await self.thr.pipe()
+        await pipe.read.fcntl(F.SETFL, O.NONBLOCK)
+        # copies of the read end, which all become readable with a single write
+        fds = [await pipe.read.dup2(await self.thr.task.eventfd(0)) for _ in range(100)]
+        afds = [await self.thr.make_afd(fd) for fd in fds]
+        for afd in afds:
+            # wait for epoll, rather than assuming the fd is readable
+            afd.epolled.status.negedge(EPOLL.IN)
+        await pipe.write.write(await self.thr.ptr(b'hi'))
+        async with trio.open_nursery() as nursery:
+            for afd in afds:
+                nursery.start_soon(afd.epolled.wait_for, EPOLL.IN)
+        self.assertGreater(self.thr.epoller.epoll_waiter.buffer_events, 32)
+
+    async def test_number_reuse(self):
+        "A released number's slot is reused with a new generation"
+        waiter = self.thr.epoller.epoll_waiter
+        first = waiter.allocate_number()
+        waiter._release_number(first)
+        second = waiter.allocate_number()
+        self.assertNotEqual(first, second)
+        self.assertEqual(first & 0xffffffff, second & 0xffffffff)
+        waiter._release_number(second)
+
+    async def test_optimistic(self):
+        "An optimistic AFD tries the syscall even when epoll hasn't told us it's ready"
+        pipe = await self.thr.pipe()
+        afd = await self.thr.make_afd(pipe.read, set_nonblock=True, optimistic=True)
+        afd.epolled.status.negedge(EPOLL.IN)
+        await pipe.write.write(await self.thr.ptr(b'hello'))
+        self.assertEqual(await afd.read_some_bytes(), b'hello')
+        self.assertTrue(afd.epolled.status.mask & EPOLL.IN)
+
+    async def test_read_buffer(self):
+        pipe = await self.thr.pipe()
+        afd = await self.thr.make_afd(pipe.read, set_nonblock=True)
+        buf = AsyncReadBuffer(afd)
+        await pipe.write.write(await self.thr.ptr(b'foo\nbar\r\n5:hello,' + b'x'*10000))
+        await pipe.write.close()
+        self.assertEqual(await buf.read_line(), b'foo')
+        self.assertEqual(await buf.read_until_delimiter(b'\r\n'), b'bar')
+        self.assertEqual(await buf.read_netstring(), b'hello')
+        self.assertEqual(await buf.read_length(10000), b'x'*10000)
+        self.assertIsNone(await buf.read_until_delimiter(b'\n'))
+
+    async def test_timer_wheel(self):
+        "Deadlines work through a timerfd on the epoller, and time out waits for readability"
+        timer_wheel = await self.thr.epoller.timer_wheel()
+        self.assertIs(timer_wheel, await self.thr.epoller.timer_wheel())
+        deadline = time.monotonic() + 0.01
+        await timer_wheel.sleep_until(deadline)
+        self.assertGreaterEqual(time.monotonic(), deadline)
+        pipe = await self.thr.pipe()
+        afd = await self.thr.make_afd(pipe.read, set_nonblock=True)
+        with self.assertRaises(TimeoutError):
+            await afd.read(await self.thr.malloc(bytes, 16), deadline=time.monotonic() + 0.01)
+        # each timed-out wait withdraws itself, so waiters don't pile up
+        for _ in range(10):
+            with self.assertRaises(TimeoutError):
+                await afd.epolled.wait_for(EPOLL.IN, deadline=time.monotonic() + 0.001)
+            self.assertEqual(sum(len(waiters) for waiters in afd.epolled.waiters.values()), 0)
+        await pipe.write.write(await self.thr.ptr(b'hello'))
+        valid, _ = await afd.read(await self.thr.malloc(bytes, 16), deadline=time.monotonic() + 10)
+        self.assertEqual(await valid.read(), b'hello')
+
+    async def test_make_many(self):
+        pipes = [await self.thr.pipe() for _ in range(4)]
+        for pipe in pipes:
+            await pipe.read.fcntl(F.SETFL, O.NONBLOCK)
+        afds = await AsyncFileDescriptor.make_many(self.thr.epoller, self.thr.ram, [pipe.read for pipe in pipes])
+        self.assertEqual(len({afd.epolled.number for afd in afds}), len(afds))
+        for i, pipe in enumerate(pipes):
+            await pipe.write.write(await self.thr.ptr(b'%d' % i))
+        for i, afd in enumerate(afds):
+            self.assertEqual(await afd.read_some_bytes(), b'%d' % i)
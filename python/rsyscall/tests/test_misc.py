@@ -11,6 +11,26 @@ from rsyscall.tests.utils import do_async_things
 from rsyscall.fcntl import O
 from rsyscall.unistd import Pipe
 from rsyscall.sched import CLONE
+from rsyscall.near.sysif import Syscall, SyscallBatchError, SyscallHangup, SyscallInterface
+from rsyscall.sys.syscall import SYS
+import errno
+import typing as t
+
+class HangupOnCloseSysif(SyscallInterface):
+    "Hangs up on close, and makes every other syscall through `sysif`"
+    def __init__(self, sysif: SyscallInterface) -> None:
+        self.sysif = sysif
+
+    async def syscall(self, number: SYS, arg1=0, arg2=0, arg3=0, arg4=0, arg5=0, arg6=0) -> int:
+        if number == SYS.close:
+            raise SyscallHangup()
+        return await self.sysif.syscall(number, arg1, arg2, arg3, arg4, arg5, arg6)
+
+    async def close_interface(self) -> None:
+        return await self.sysif.close_interface()
+
+    def get_activity_fd(self) -> t.Any:
+        return self.sysif.get_activity_fd()
 
 class TestMisc(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -33,3 +53,23 @@ class TestMisc(TrioTestCase):
         with self.assertRaises(BrokenPipeError):
             # this side is still open, but gets EPIPE
             await pipe.write.write(data)
+
+    async def test_syscall_batch(self) -> None:
+        for thr in [self.local, self.thr]:
+            results = await thr.task.sysif.syscall_batch([
+                Syscall(SYS.getpid, 0, 0, 0, 0, 0, 0),
+                Syscall(SYS.close, -1, 0, 0, 0, 0, 0),
+            ])
+            self.assertGreater(results[0], 0)
+            self.assertEqual(results[1], -errno.EBADF)
+
+    async def test_syscall_batch_error(self) -> None:
+        sysif = HangupOnCloseSysif(self.thr.task.sysif)
+        with self.assertRaises(SyscallBatchError) as cm:
+            await sysif.syscall_batch([
+                Syscall(SYS.getpid, 0, 0, 0, 0, 0, 0),
+                Syscall(SYS.close, -1, 0, 0, 0, 0, 0),
+            ])
+        # we know the getpid was performed, but not whether the close was
+        self.assertGreater(t.cast(int, cm.exception.results[0]), 0)
+        self.assertIsNone(cm.exception.results[1])
@@ -1,6 +1,11 @@
+import trio
+import typing as t
 from rsyscall.tests.trio_test_case import TrioTestCase
 from rsyscall import local_thread
 from rsyscall.handle.pointer import UseAfterFreeError
+from rsyscall.memory.allocator import Arena, AllocatorClient, OutOfSpaceError, SLAB_SIZE, SlabAllocation, UnlimitedAllocator
+from rsyscall.memory.ram import RAM
+from rsyscall.sys.mman import PROT, MAP
 
 class TestPointer(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -23,3 +28,173 @@ class TestPointer(TrioTestCase):
         with self.assertRaises(UseAfterFreeError):
             buf.near
         str(buf)
+
+    async def test_arena_coalesce(self) -> None:
+        arena = Arena(await self.thr.task.mmap(4096, PROT.READ|PROT.WRITE, MAP.SHARED))
+        allocations = [arena.allocate(16, 8) for _ in range(256)]
+        with self.assertRaises(OutOfSpaceError):
+            arena.allocate(1, 1)
+        # free every other allocation, then the rest, so the free space has to be coalesced
+        for allocation in allocations[::2] + allocations[1::2]:
+            allocation.free()
+        whole = arena.allocate(4096, 1)
+        self.assertEqual(whole.size(), 4096)
+        whole.free()
+        await arena.close()
+
+    async def test_arena_trim(self) -> None:
+        arena = Arena(await self.thr.task.mmap(1024*1024, PROT.READ|PROT.WRITE, MAP.SHARED))
+        first, second, third = [arena.allocate(256*1024, 1) for _ in range(3)]
+        second.free()
+        [stats] = arena.stats()
+        self.assertEqual(stats.live_bytes, 512*1024)
+        self.assertEqual(stats.free_bytes, 512*1024)
+        self.assertEqual(stats.allocations, 2)
+        self.assertEqual(stats.fragmentation, 0.5)
+        await arena.trim()
+        first.free()
+        third.free()
+        await arena.close()
+
+    async def test_slab(self) -> None:
+        buf = await self.thr.malloc(bytes, 16)
+        self.assertIsInstance(buf.allocation, SlabAllocation)
+        first, second = buf.split(8)
+        buf = first.merge(second)
+        address = int(buf.near)
+        buf.free()
+        # the slot we just freed is the first to be reused
+        buf = await self.thr.malloc(bytes, 16)
+        self.assertEqual(int(buf.near), address)
+        big = await self.thr.malloc(bytes, 4096)
+        self.assertNotIsInstance(big.allocation, SlabAllocation)
+
+    async def test_slab_release(self) -> None:
+        allocator = AllocatorClient.make_allocator(self.thr.task)
+        # more than fit in one slab, all allocated together
+        allocations = await allocator.bulk_malloc([(8, 8)]*(SLAB_SIZE//8 + 1))
+        self.assertEqual(sum(stats.allocations for stats in allocator.stats()), 2)
+        for _, allocation in allocations:
+            allocation.free()
+        # we keep one empty slab for reuse, and free the other
+        self.assertEqual(sum(stats.allocations for stats in allocator.stats()), 1)
+
+    async def test_const_ptr(self) -> None:
+        first = await self.thr.ram.const_ptr(b'foo')
+        second = await self.thr.ram.const_ptr(b'foo')
+        self.assertEqual(int(first.near), int(second.near))
+        self.assertEqual(await second.read(), b'foo')
+        first.free()
+        # the shared copy is still alive for the other user
+        self.assertEqual(await second.read(), b'foo')
+        with self.assertRaises(Exception):
+            second.split(1)
+
+    async def test_concurrent_const_ptr(self) -> None:
+        # on a thread we make syscalls to, allocating suspends, so these misses overlap
+        thread = await self.thr.clone()
+        ptrs: t.List[t.Any] = []
+        async def get() -> None:
+            ptrs.append(await thread.ram.const_ptr(b'bar'))
+        async with trio.open_nursery() as nursery:
+            for _ in range(4):
+                nursery.start_soon(get)
+        # all of them share the one cached copy
+        self.assertEqual(len({int(ptr.near) for ptr in ptrs}), 1)
+        await thread.exit(0)
+
+    async def test_concurrent_malloc(self) -> None:
+        # requests are only coalesced while we're waiting for an mmap, and on the local
+        # thread, mmap returns immediately; so use a thread which we make syscalls to
+        thread = await self.thr.clone()
+        allocator = UnlimitedAllocator(thread.task)
+        allocations: t.List[t.Any] = []
+        async def malloc() -> None:
+            allocations.append(await allocator.malloc(1024, 1))
+        async with trio.open_nursery() as nursery:
+            for _ in range(32):
+                nursery.start_soon(malloc)
+        # the first malloc is alone, but all the rest are coalesced into one mmap
+        self.assertLessEqual(len(allocator.arenas), 2)
+        # the arenas can only be unmapped once they're empty
+        for _, allocation in allocations:
+            allocation.free()
+        await allocator.close()
+
+    async def test_reclaim_on_free(self) -> None:
+        allocator = UnlimitedAllocator(self.thr.task, high_water_mark=0)
+        _, allocation = await allocator.malloc(1024, 1)
+        self.assertEqual(len(allocator.arenas), 1)
+        allocation.free()
+        # freeing wakes up the allocator, which unmaps the arena now that it's empty
+        with trio.fail_after(5):
+            while allocator.arenas:
+                await trio.sleep(0.01)
+
+    async def test_batch_shape_key(self) -> None:
+        calls = 0
+        async def op(sem) -> t.Any:
+            nonlocal calls
+            calls += 1
+            return await sem.ptr(data)
+        data = b'foo'
+        ptr = await self.thr.ram.perform_batch(op, shape_key="test_batch_shape_key")
+        self.assertEqual(calls, 2)
+        self.assertEqual(await ptr.read(), b'foo')
+        data = b'bar'
+        ptr = await self.thr.ram.perform_batch(op, shape_key="test_batch_shape_key")
+        # the dry run was skipped
+        self.assertEqual(calls, 3)
+        self.assertEqual(await ptr.read(), b'bar')
+        data = b'longer'
+        ptr = await self.thr.ram.perform_batch(op, shape_key="test_batch_shape_key")
+        # the allocation didn't match, so we fell back to a dry run
+        self.assertEqual(calls, 6)
+        self.assertEqual(await ptr.read(), b'longer')
+
+    async def test_arena_grow(self) -> None:
+        arena = await Arena.make(self.thr.task, 4096)
+        # an empty arena can be moved, so growing it always succeeds
+        self.assertTrue(await arena.grow(8192))
+        # the grown pages are backed by the memfd, so we can write all the way to the end
+        ram = RAM(self.thr.task, self.thr.ram.transport, arena)
+        data = b'x'*8191 + b'y'
+        ptr = await ram.ptr(data)
+        self.assertEqual(ptr.allocation.offset(), 0)
+        self.assertEqual(await ptr.read(), data)
+        ptr.free()
+        # the arena isn't movable while this is allocated, so it can only grow in place,
+        # and this pointer's handle for the shorter mapping stays valid
+        first = await ram.ptr(b'a')
+        if await arena.grow(16384):
+            self.assertEqual(first.mapping.near.address, arena.mapping.near.address)
+            self.assertEqual(await first.read(), b'a')
+        first.free()
+        # a shared anonymous mapping can't be grown
+        anonymous = Arena(await self.thr.task.mmap(4096, PROT.READ|PROT.WRITE, MAP.SHARED))
+        self.assertFalse(await anonymous.grow(8192))
+        await anonymous.close()
+        with arena.pinned():
+            with self.assertRaises(Exception):
+                await arena.close()
+        await arena.close()
+
+    async def test_borrow_pins_arena(self) -> None:
+        arena = await Arena.make(self.thr.task, 4096)
+        ram = RAM(self.thr.task, self.thr.ram.transport, arena)
+        ptr = await ram.malloc(bytes, 16)
+        with ptr.borrow(self.thr.task):
+            # a syscall might still be using the memory, even after the pointer is freed
+            ptr.free()
+            self.assertFalse(arena.movable())
+        self.assertTrue(arena.movable())
+        await arena.close()
+
+    async def test_read_into(self) -> None:
+        ptr = await self.thr.ptr(b'hello')
+        buf = bytearray(8)
+        self.assertEqual(await ptr.read_into(buf), 5)
+        self.assertEqual(bytes(buf), b'hello\0\0\0')
+        self.assertEqual(bytes(await ptr.read_memoryview()), b'hello')
+        with self.assertRaises(Exception):
+            await ptr.read_into(bytearray(4))
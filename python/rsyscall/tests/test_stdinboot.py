@@ -7,6 +7,11 @@ from rsyscall import local_thread
 
 from rsyscall.tests.utils import do_async_things
 from rsyscall.command import Command
+from rsyscall.memory.process_vm_transport import ProcessVmTransport
+from rsyscall.memory.shared_transport import SharedMemoryTransport
+from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.sched import CLONE
+import trio
 
 class TestStdinboot(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -18,9 +23,61 @@ class TestStdinboot(TrioTestCase):
     async def asyncTearDown(self) -> None:
         await self.local_child.kill()
 
+    def process_vm_transport(self) -> ProcessVmTransport:
+        shared = self.remote.ram.transport
+        assert isinstance(shared, SharedMemoryTransport)
+        transport = shared.fallback
+        assert isinstance(transport, ProcessVmTransport)
+        return transport
+
+    def socket_transport(self) -> SocketMemoryTransport:
+        transport = self.process_vm_transport().fallback
+        assert isinstance(transport, SocketMemoryTransport)
+        return transport
+
     async def test_exit(self) -> None:
         await self.remote.exit(0)
 
+    async def test_process_vm(self) -> None:
+        transport = self.process_vm_transport()
+        ptrs = [await self.remote.ram.ptr(bytes([i])*64) for i in range(16)]
+        results = {}
+        async def read(i: int) -> None:
+            results[i] = await transport.read(ptrs[i])
+        # these reads are coalesced into a single process_vm_readv
+        async with trio.open_nursery() as nursery:
+            for i in range(16):
+                nursery.start_soon(read, i)
+        self.assertEqual(results, {i: bytes([i])*64 for i in range(16)})
+
+    async def test_process_vm_inherit_pidns(self) -> None:
+        transport = self.process_vm_transport()
+        child = await self.remote.clone(CLONE.NEWUSER|CLONE.NEWPID)
+        # our pid for the child wouldn't be valid for process_vm_readv/writev
+        self.assertNotIsInstance(transport.inherit(child.task), ProcessVmTransport)
+        await child.exit(0)
+
+    async def test_socket_transport(self) -> None:
+        transport = self.socket_transport()
+        ptrs = [await self.remote.ram.malloc(bytes, 100) for i in range(16)]
+        results = {}
+        async def write_and_read(i: int) -> None:
+            # these writes, and then these reads, are coalesced into one transfer
+            await transport.write(ptrs[i], bytes([i])*100)
+            results[i] = await transport.read(ptrs[i])
+        async with trio.open_nursery() as nursery:
+            for i in range(16):
+                nursery.start_soon(write_and_read, i)
+        self.assertEqual(results, {i: bytes([i])*100 for i in range(16)})
+
+    async def test_socket_transport_large(self) -> None:
+        transport = self.socket_transport()
+        data = bytes(range(256))*16*1024
+        ptr = await self.remote.ram.malloc(bytes, len(data))
+        # much bigger than the socket buffer, so this is transferred in pipelined chunks
+        await transport.write(ptr, data)
+        self.assertEqual(await transport.read(ptr), data)
+
     async def test_async(self) -> None:
         await do_async_things(self, self.remote.epoller, self.remote)
 
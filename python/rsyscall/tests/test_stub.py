@@ -9,6 +9,7 @@ from rsyscall import local_thread
 from rsyscall.tests.utils import do_async_things
 from rsyscall.command import Command
 from rsyscall.stdlib import mkdtemp
+from rsyscall.memory.shared_transport import SharedMemoryTransport
 
 import os
 
@@ -39,6 +40,20 @@ class TestStub(TrioTestCase):
         argv, new_thread = await self.server.accept()
         await do_async_things(self, new_thread.epoller, new_thread)
 
+    async def test_shared_memory(self) -> None:
+        command = Command(self.tmpdir/self.stub_name, [self.stub_name], {})
+        child = await self.thread.exec(command)
+        self.nursery.start_soon(child.check)
+        argv, new_thread = await self.server.accept()
+        transport = new_thread.ram.transport
+        assert isinstance(transport, SharedMemoryTransport)
+        ptr = await new_thread.ram.ptr(b"hello")
+        # the pointer is in shared memory, so it's accessed locally
+        self.assertIn((ptr.mapping.task.address_space, ptr.mapping.near), transport.local_addresses)
+        # and the remote thread sees what we wrote
+        self.assertEqual(await transport.fallback.read(ptr), b"hello")
+        await new_thread.exit(0)
+
     async def test_read_stdin(self) -> None:
         data_in = "hello"
         command = self.thread.environ.sh.args("-c", f"printf {data_in} | {self.stub_name}").env(PATH=os.fsdecode(self.tmpdir))
@@ -0,0 +1,40 @@
+from rsyscall.tests.trio_test_case import TrioTestCase
+from rsyscall import local_thread
+from rsyscall.tasks.uring import make_uring_thread
+
+from dneio import run_all
+import functools
+from rsyscall.fcntl import O
+from rsyscall.near.sysif import SyscallHangup
+from rsyscall.stdlib import mkdtemp
+from rsyscall.unistd import SEEK
+
+class TestUring(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.thr = await make_uring_thread(local_thread)
+        self.tmpdir = await mkdtemp(self.thr)
+
+    async def asyncTearDown(self) -> None:
+        await self.tmpdir.cleanup()
+
+    async def test_read_write(self) -> None:
+        f = await self.thr.task.open(await self.thr.ram.ptr(self.tmpdir/"file"), O.RDWR|O.CREAT)
+        data = b'hello world'
+        _, rest = await f.write(await self.thr.ram.ptr(data))
+        self.assertEqual(rest.size(), 0)
+        await f.lseek(0, SEEK.SET)
+        valid, _ = await f.read(await self.thr.ram.malloc(bytes, 4096))
+        self.assertEqual(await valid.read(), data)
+        await f.close()
+
+    async def test_many_opens(self) -> None:
+        async def open_and_close(i: int) -> None:
+            f = await self.thr.task.open(await self.thr.ram.ptr(self.tmpdir/str(i)), O.RDWR|O.CREAT)
+            await f.close()
+        await run_all([functools.partial(open_and_close, i) for i in range(100)])
+
+    async def test_close(self) -> None:
+        thr = await make_uring_thread(local_thread)
+        await thr.task.sysif.close_interface()
+        with self.assertRaises(SyscallHangup):
+            await thr.task.getpid()
@@ -13,6 +13,8 @@ from rsyscall.network.connection import Connection
 from rsyscall.path import Path
 from rsyscall.struct import FixedSize, T_fixed_size, HasSerializer, T_has_serializer, FixedSerializer, T_fixed_serializer, T_pathlike
 from rsyscall.tasks.clone import clone_child_task
+from rsyscall.tasks.connection import SyscallConnection
+from rsyscall.tasks.ring import SyscallRing
 import logging
 import os
 import rsyscall.near
@@ -60,7 +62,7 @@ async def do_cloexec_except(thr: Thread, excluded_fds: t.Set[near.FileDescriptor
     # it's important to do this so we can't try to inherit the fds that we close here
     thr.task.fd_table.remove_inherited()
     buf = await thr.ram.malloc(DirentList, 4096)
-    dirfd = await thr.task.open(await thr.ram.ptr("/proc/self/fd"), O.DIRECTORY)
+    dirfd = await thr.task.open(await thr.ram.const_ptr("/proc/self/fd"), O.DIRECTORY)
     excluded_fds.add(dirfd.near)
     async def maybe_close(fd: near.FileDescriptor) -> None:
         flags = await _fcntl(thr.task.sysif, fd, F.GETFD)
@@ -170,17 +172,20 @@ class Thread:
         """
         return await self.ram.ptr(data)
 
-    async def make_afd(self, fd: FileDescriptor, set_nonblock: bool=False) -> AsyncFileDescriptor:
+    async def make_afd(self, fd: FileDescriptor, set_nonblock: bool=False,
+                       optimistic: bool=False) -> AsyncFileDescriptor:
         """Make an AsyncFileDescriptor; make it nonblocking if `set_nonblock` is True.
 
         Make sure that `fd` is already in non-blocking mode;
         such as by accepting it with the `SOCK.NONBLOCK` flag;
         if it's not, you can pass set_nonblock=True to make it nonblocking.
 
+        See `AsyncFileDescriptor` for the meaning of `optimistic`.
+
         """
         if set_nonblock:
             await fd.fcntl(F.SETFL, O.NONBLOCK)
-        return await AsyncFileDescriptor.make(self.epoller, self.ram, fd)
+        return await AsyncFileDescriptor.make(self.epoller, self.ram, fd, optimistic)
 
     async def open_async_channels(self, count: int) -> t.List[t.Tuple[AsyncFileDescriptor, FileDescriptor]]:
         "Calls self.connection.open_async_channels; see `Connection.open_async_channels`"
@@ -242,13 +247,14 @@ class Thread:
 
     async def read_to_eof(self, fd: FileDescriptor) -> bytes:
         "Read this file descriptor until we get EOF, then return all the bytes read"
-        data = b""
+        data = bytearray()
+        buf = await self.ram.malloc(bytes, 4096)
         while True:
-            read, rest = await fd.read(await self.ram.malloc(bytes, 4096))
+            read, rest = await fd.read(buf)
             if read.size() == 0:
-                return data
-            # TODO this would be more efficient if we batched our memory-reads at the end
-            data += await read.read()
+                return bytes(data)
+            data += await read.read_memoryview()
+            buf = read.merge(rest)
 
     async def mount(self, source: t.Union[str, os.PathLike], target: t.Union[str, os.PathLike],
                     filesystemtype: str, mountflags: MS,
@@ -281,14 +287,36 @@ class Thread:
     def inherit_fd(self, fd: FileDescriptor) -> FileDescriptor:
         return self.task.inherit_fd(fd)
 
-    async def clone(self, flags: CLONE=CLONE.NONE, automatically_write_user_mappings: bool=True) -> ChildThread:
+    async def clone(self, flags: CLONE=CLONE.NONE, automatically_write_user_mappings: bool=True,
+                    batch_server: bool=False, syscall_ring: bool=False) -> ChildThread:
         """Create a new child thread
 
+        If batch_server is true, the child runs a syscall server which reads all
+        available requests at once and writes back their responses together,
+        which is cheaper when many syscalls are pipelined to it.
+
+        If syscall_ring is true, we send syscalls to the child through a
+        `rsyscall.tasks.ring.SyscallRing` in shared memory rather than over a
+        socket. This is only possible if this thread shares the local address
+        space, since the child will too.
+
         manpage: clone(2)
         """
+        make_sysif: t.Optional[t.Callable[[logging.Logger, AsyncFileDescriptor, FileDescriptor],
+                                          SyscallConnection]]
+        if syscall_ring:
+            ring = await SyscallRing.make(self.task)
+            trampoline_func = lambda sock: Trampoline(self.loader.ring_server_func, [ring.address, sock])
+            make_sysif = ring.make_connection
+            on_exit: t.Optional[t.Callable[[], t.Awaitable[None]]] = ring.close
+        else:
+            server_func = self.loader.batch_server_func if batch_server else self.loader.server_func
+            trampoline_func = lambda sock: Trampoline(server_func, [sock, sock])
+            make_sysif = None
+            on_exit = None
         child_process, task = await clone_child_task(
             self.task, self.ram, self.connection, self.loader, self.monitor,
-            flags, lambda sock: Trampoline(self.loader.server_func, [sock, sock]))
+            flags, trampoline_func, make_sysif, on_exit)
         ram = RAM(task,
                   # We don't inherit the transport because it leads to a deadlock:
                   # If when a child task calls transport.read, it performs a syscall in the child task,
@@ -299,6 +327,8 @@ class Thread:
                   # and child's read syscall will never complete.
                   self.ram.transport,
                   self.ram.allocator.inherit(task),
+                  # the child shares our address space, so it can share our const pointers
+                  const_cache=self.ram.const_cache,
         )
         if flags & CLONE.NEWPID:
             # if the new process is pid 1, then CLONE_PARENT isn't allowed so we can't use inherit_to_child.
@@ -307,7 +337,7 @@ class Thread:
             epoller = await Epoller.make_root(ram, task)
             # this signal is already blocked, we inherited the block, um... I guess...
             # TODO handle this more formally
-            signal_block = SignalBlock(task, await ram.ptr(Sigset({SIG.CHLD})))
+            signal_block = SignalBlock(task, await ram.const_ptr(Sigset({SIG.CHLD})))
             monitor = await ChildProcessMonitor.make(ram, task, epoller, signal_block=signal_block)
         else:
             epoller = self.epoller.inherit(ram)
@@ -432,7 +462,11 @@ class ChildThread(Thread):
             return (await sem.ptr(path),
                     await sem.ptr(argv_ptrs),
                     await sem.ptr(envp_ptrs))
-        filename, argv_ptr, envp_ptr = await self.ram.perform_batch(op)
+        # the allocations depend only on the lengths of the strings
+        shape_key = ("execve", len(os.fsencode(path)),
+                     tuple(len(os.fsencode(arg)) for arg in argv),
+                     tuple(len(os.fsencode(arg)) for arg in envp))
+        filename, argv_ptr, envp_ptr = await self.ram.perform_batch(op, shape_key=shape_key)
         await self.task.execve(filename, argv_ptr, envp_ptr, command=command)
         return self.process
 
@@ -478,7 +512,7 @@ class ChildThread(Thread):
         sigmask: t.Set[SIG] = set()
         for block in inherited_signal_blocks:
             sigmask = sigmask.union(block.mask)
-        await self.task.sigprocmask((HowSIG.SETMASK, await self.ram.ptr(Sigset(sigmask))))
+        await self.task.sigprocmask((HowSIG.SETMASK, await self.ram.const_ptr(Sigset(sigmask))))
         if not env_updates:
             # use execv if we aren't updating the env, as an optimization.
             return await self.execv(path, argv, command=command)
@@ -65,7 +65,8 @@ class Timespec:
 
     @classmethod
     def from_nanos(cls: t.Type[T], nsec: int) -> T:
-        raise NotImplementedError
+        sec, nsec = divmod(nsec, NSEC_PER_SEC)
+        return cls(sec, nsec)
 
     @classmethod
     def from_cffi(cls: t.Type[T], cffi_value: t.Any) -> T:
@@ -88,7 +89,7 @@ class Itimerspec(Struct):
     def __init__(self, interval: t.Union[float, Decimal, Timespec],
                  value: t.Union[float, Decimal, Timespec]) -> None:
         self.interval = Timespec.from_float(interval)
-        self.value = Timespec.from_float(interval)
+        self.value = Timespec.from_float(value)
 
     def _to_cffi_dict(self) -> t.Dict[str, t.Dict[str, int]]:
         return {
@@ -0,0 +1,228 @@
+"""Timers for any thread, using a hierarchical timer wheel driven by a timerfd
+
+trio's timers only work on the local thread, and a root `rsyscall.epoller.Epoller` just
+blocks in epoll_wait, so there's no other way to time out an operation on a remote
+thread. A `TimerWheel` registers a single timerfd on an epollfd, and arms it for the
+earliest deadline it knows about; when it fires, we call the callbacks for every timer
+which has expired.
+
+We keep timers in a hierarchical timer wheel, so that adding, cancelling and expiring
+timers is cheap even with many thousands of them. There are LEVELS levels of SLOTS
+slots; a slot in level 0 spans a single TICK, and a slot in each higher level spans all
+the slots of the level below. A timer goes in the lowest level with a slot for its
+deadline; when we pass the start of a slot in a higher level, we move its timers down to
+the lower levels.
+
+Deadlines are in terms of the local `time.monotonic` clock. We arm the timerfd with a
+relative time, so this works even if the timerfd is on another host.
+
+"""
+from __future__ import annotations
+from dneio import Continuation, Event, reset, shift
+from rsyscall.epoller import AsyncFileDescriptor, Epoller
+from rsyscall.handle import Pointer
+from rsyscall.sys.timerfd import CLOCK, TFD, TFD_TIMER, Itimerspec, Timespec
+import logging
+import math
+import time
+import typing as t
+
+__all__ = [
+    "Timer",
+    "TimerWheel",
+]
+
+logger = logging.getLogger(__name__)
+T = t.TypeVar('T')
+
+TICK = 0.001
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+LEVELS = 4
+
+class Timer:
+    "A callback which a `TimerWheel` will call once its deadline passes, unless it's cancelled first."
+    __slots__ = ('deadline', 'tick', 'callback', 'slot')
+
+    def __init__(self, deadline: float, callback: t.Callable[[], None]) -> None:
+        self.deadline = deadline
+        # round up, so that we never call the callback early
+        self.tick = math.ceil(deadline/TICK)
+        self.callback = callback
+        self.slot: t.Optional[t.Set[Timer]] = None
+
+    def cancel(self) -> None:
+        "Don't call the callback; does nothing if it's already been called."
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+
+    def __repr__(self) -> str:
+        return f"Timer({self.deadline}, {self.callback})"
+
+class TimerWheel:
+    "Calls callbacks at deadlines, using a timerfd registered on some epollfd"
+    @staticmethod
+    async def make(epoller: Epoller) -> TimerWheel:
+        "Make a timerfd in the epoller's task, and register it on the epoller"
+        fd = await epoller.epfd.task.timerfd_create(CLOCK.MONOTONIC, TFD.NONBLOCK)
+        afd = await AsyncFileDescriptor.make(epoller, epoller.ram, fd)
+        return TimerWheel(afd, await epoller.ram.malloc(bytes, 8))
+
+    def __init__(self, afd: AsyncFileDescriptor, buf: Pointer[bytes]) -> None:
+        "Don't construct directly; use TimerWheel.make, or more likely, Epoller.timer_wheel."
+        self.afd = afd
+        self.buf = buf
+        self.current = math.floor(time.monotonic()/TICK)
+        self.levels: t.List[t.List[t.Set[Timer]]] = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        # the tick the timerfd is armed for, or None if it's not armed
+        self.armed: t.Optional[int] = None
+        self.rearm_needed = False
+        self.rearm_event: t.Optional[Event] = None
+        reset(self._run())
+        reset(self._run_arm())
+
+    def add(self, deadline: float, callback: t.Callable[[], None]) -> Timer:
+        """Call `callback` once `deadline` has passed, unless the returned Timer is cancelled
+
+        The callback is called from our own coroutine, so it must not block; if the
+        deadline has already passed, it's called soon, not immediately.
+
+        """
+        timer = Timer(deadline, callback)
+        self._insert(timer)
+        self._request_rearm()
+        return timer
+
+    async def sleep_until(self, deadline: float) -> None:
+        "Wait until `deadline` has passed."
+        event = Event()
+        self.add(deadline, event.set)
+        await event.wait()
+
+    async def wait_until(self, deadline: float,
+                         register: t.Callable[[Continuation[T]], t.Callable[[], None]]) -> T:
+        """Wait for a callback to be resumed, or raise TimeoutError if `deadline` passes first
+
+        `register` is passed our continuation; it should arrange for the continuation to
+        be resumed with the result of whatever we're waiting for, and return a function
+        which withdraws it again. At the deadline, we call that function before raising
+        TimeoutError, so nothing is left waiting on our behalf; such as with
+        `dneio.Event.wait_cb`.
+
+        """
+        timers: t.List[Timer] = []
+        def start(cb: Continuation[T]) -> None:
+            def timeout() -> None:
+                withdraw()
+                cb.throw(TimeoutError("deadline passed", deadline))
+            # add the timer first; it can't fire until after we return, but `register`
+            # might resume `cb` immediately, and then the timer must still be cancelled
+            timers.append(self.add(deadline, timeout))
+            withdraw = register(cb)
+        try:
+            return await shift(start)
+        finally:
+            for timer in timers:
+                timer.cancel()
+
+    def _insert(self, timer: Timer) -> None:
+        # expired timers go in the next slot, and are called the next time we advance
+        tick = max(timer.tick, self.current + 1)
+        # the lowest level where the timer's slot is one of the next SLOTS-1 slots
+        for level in range(LEVELS):
+            shift = SLOT_BITS*level
+            if (tick >> shift) - (self.current >> shift) < SLOTS:
+                index = (tick >> shift) % SLOTS
+                break
+        else:
+            # too far in the future for the wheel; put it in the last slot of the highest
+            # level, and it'll be reinserted when we reach that slot
+            index = ((self.current >> shift) + SLOTS - 1) % SLOTS
+        slot = self.levels[level][index]
+        slot.add(timer)
+        timer.slot = slot
+
+    def _next_wake(self) -> t.Optional[int]:
+        "Return the tick at which we next need to advance, or None if there are no timers."
+        wake: t.Optional[int] = None
+        for level in range(LEVELS):
+            shift = SLOT_BITS*level
+            base = self.current >> shift
+            for offset in range(1, SLOTS):
+                if self.levels[level][(base + offset) % SLOTS]:
+                    start = (base + offset) << shift
+                    if wake is None or start < wake:
+                        wake = start
+                    break
+        return wake
+
+    def _advance(self, now: float) -> t.List[Timer]:
+        "Move the wheel forward to `now`, returning the expired timers in order of deadline."
+        target = math.floor(now/TICK)
+        if target <= self.current:
+            return []
+        taken: t.List[Timer] = []
+        for level in range(LEVELS):
+            shift = SLOT_BITS*level
+            first = (self.current >> shift) + 1
+            last = min(target >> shift, first + SLOTS - 1)
+            for index in range(first, last + 1):
+                slot = self.levels[level][index % SLOTS]
+                taken.extend(slot)
+                slot.clear()
+        self.current = target
+        expired: t.List[Timer] = []
+        for timer in taken:
+            timer.slot = None
+            if timer.tick <= target:
+                expired.append(timer)
+            else:
+                self._insert(timer)
+        expired.sort(key=lambda timer: timer.deadline)
+        return expired
+
+    def _request_rearm(self) -> None:
+        self.rearm_needed = True
+        if self.rearm_event is not None:
+            event, self.rearm_event = self.rearm_event, None
+            event.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                valid, rest = await self.afd.read(self.buf)
+            except Exception:
+                logger.info("timerfd read failed, no more timers will expire", exc_info=True)
+                return
+            self.buf = valid.merge(rest)
+            self.armed = None
+            for timer in self._advance(time.monotonic()):
+                try:
+                    timer.callback()
+                except Exception:
+                    logger.exception("timer callback %s raised", timer)
+            self._request_rearm()
+
+    async def _run_arm(self) -> None:
+        "Arm the timerfd for our next wakeup whenever that might have changed."
+        while True:
+            if not self.rearm_needed:
+                self.rearm_event = Event()
+                await self.rearm_event.wait()
+            self.rearm_needed = False
+            wake = self._next_wake()
+            if wake == self.armed:
+                continue
+            self.armed = wake
+            if wake is None:
+                # a zero value disarms the timerfd
+                value = Timespec(0, 0)
+            else:
+                value = Timespec.from_nanos(max(math.ceil((wake*TICK - time.monotonic())*1e9), 1))
+            try:
+                await self.afd.handle.timerfd_settime(
+                    TFD_TIMER.NONE, await self.afd.ram.ptr(Itimerspec(Timespec(0, 0), value)))
+            except Exception:
+                logger.info("timerfd_settime failed, no more timers will expire", exc_info=True)
+                return